@@ -70,7 +70,8 @@ class ProductAdmin(admin.ModelAdmin):
 
 @admin.register(Cart)
 class CartAdmin(admin.ModelAdmin):
-    list_display = ['user', 'created_at', 'updated_at']
+    list_display = ['user', 'item_count', 'subtotal', 'created_at', 'updated_at']
+    readonly_fields = ['item_count', 'subtotal']
     search_fields = ['user__email']
 
 
@@ -80,11 +81,26 @@ class CartItemAdmin(admin.ModelAdmin):
     search_fields = ['variant__product__name', 'cart__user__email']
 
 
+@admin.register(StockReservation)
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ['order', 'variant', 'quantity', 'status', 'expires_at', 'created_at']
+    list_filter = ['status']
+    search_fields = ['order__order_id', 'variant__product__name']
+    raw_id_fields = ['order', 'variant']
+
+
+class WishlistItemInline(admin.TabularInline):
+    model = WishlistItem
+    extra = 0
+    autocomplete_fields = ['product']
+    readonly_fields = ['added_at']
+
+
 @admin.register(Wishlist)
 class WishlistAdmin(admin.ModelAdmin):
     list_display = ['user', 'total_items', 'created_at', 'updated_at']
     search_fields = ['user__email', 'user__first_name', 'user__last_name']
-    filter_horizontal = ['products']  # Nice interface for many-to-many
+    inlines = [WishlistItemInline]  # products goes through WishlistItem
     readonly_fields = ['created_at', 'updated_at', 'total_items']
 
     def total_items(self, obj):
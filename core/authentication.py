@@ -0,0 +1,13 @@
+# core/authentication.py
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+
+class OptionalTokenAuthentication(TokenAuthentication):
+    """Token auth for public endpoints: a stale or invalid token is treated as anonymous, not a 401."""
+
+    def authenticate(self, request):
+        try:
+            return super().authenticate(request)
+        except AuthenticationFailed:
+            return None
@@ -0,0 +1,109 @@
+# core/conditional.py
+"""
+Conditional GET (ETag / Last-Modified -> 304 Not Modified) for read endpoints.
+
+Views compute cheap validators (row counts, max updated_at, the catalog
+version) before running their main query. When the client's copy is still
+current, the main query and the serializer never run.
+"""
+import hashlib
+from datetime import datetime
+
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+
+
+def make_etag(*parts):
+    digest = hashlib.md5('|'.join(str(part) for part in parts).encode()).hexdigest()
+    return f'"{digest}"'
+
+
+def conditional_response(request, render, etag, last_modified=None, private=False):
+    """
+    Return a 304 if the request's If-None-Match / If-Modified-Since match the
+    validators, otherwise call render(). last_modified is a Unix timestamp.
+    """
+    http_request = getattr(request, '_request', request)
+    if last_modified is not None:
+        last_modified = int(last_modified)
+    response = get_conditional_response(http_request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = render()
+
+    if response.status_code in (200, 304):
+        response['ETag'] = etag
+        if last_modified is not None:
+            response['Last-Modified'] = http_date(last_modified)
+        # Always revalidate; shared caches may only keep anonymous copies
+        if private:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+class ConditionalGetMixin:
+    """
+    ViewSet mixin that revalidates list and retrieve responses.
+
+    The validators are the row count plus the max of `conditional_fields`
+    over the filtered queryset (one aggregate query), or the fields of the
+    requested row for retrieve. Override get_validator_extras() for anything
+    else the response depends on, e.g. per-user flags.
+    """
+    conditional_fields = ('updated_at',)
+
+    def get_validator_extras(self):
+        return ()
+
+    def get_list_conditional_fields(self):
+        """Fields whose max validates the list; override when the ordering depends on other rows."""
+        return self.conditional_fields
+
+    def get_list_validators(self):
+        queryset = self.filter_queryset(self.get_queryset()).order_by()
+        fields = self.get_list_conditional_fields()
+        aggregates = {f'max_{i}': Max(field) for i, field in enumerate(fields)}
+        row = queryset.aggregate(count=Count('pk'), **aggregates)
+        return [row['count']] + [row[f'max_{i}'] for i in range(len(fields))]
+
+    def get_retrieve_validators(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        filter_kwargs = {self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        row = self.get_queryset().filter(**filter_kwargs).order_by().values_list(
+            *self.conditional_fields
+        ).first()
+        return list(row) if row is not None else None
+
+    def list(self, request, *args, **kwargs):
+        render = lambda: super(ConditionalGetMixin, self).list(request, *args, **kwargs)
+        # No Last-Modified: a delete lowers the count without raising max(updated_at)
+        return self._conditional(request, self.get_list_validators(), render, with_last_modified=False)
+
+    def retrieve(self, request, *args, **kwargs):
+        render = lambda: super(ConditionalGetMixin, self).retrieve(request, *args, **kwargs)
+        validators = self.get_retrieve_validators()
+        if validators is None:
+            return render()  # Let the normal lookup raise 404
+        return self._conditional(request, validators, render, with_last_modified=True)
+
+    def _conditional(self, request, validators, render, with_last_modified):
+        private = request.user.is_authenticated
+        timestamps = [value.timestamp() for value in validators if isinstance(value, datetime)]
+        # Per-user extras are not datable, so signed-in users revalidate by ETag only
+        last_modified = max(timestamps) if timestamps and with_last_modified and not private else None
+        etag = make_etag(
+            self.action,
+            request.accepted_renderer.format,
+            *validators,
+            *self.get_validator_extras(),
+        )
+        return conditional_response(
+            request,
+            render,
+            etag,
+            last_modified=last_modified,
+            private=private,
+        )
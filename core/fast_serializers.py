@@ -0,0 +1,190 @@
+# core/fast_serializers.py
+"""
+Read-only fast path for hot list serializers.
+
+ReadPlan walks a bound ModelSerializer once and compiles each field into a
+column of a .values() query plus a converter, then renders rows with plain
+dict building instead of DRF's per-field get_attribute/to_representation
+calls. Values that need formatting (decimals, datetimes, files) still go
+through the DRF field's own to_representation, so the rendered JSON is
+byte-identical to serializer.data.
+
+Supported fields: concrete model columns, nested serializers over a forward
+FK (joined into the same query), nested many=True serializers over a
+reverse FK (one extra query per relation), primary-key related fields, and
+anything the serializer compiles itself through a `fast_<field name>()`
+hook returning (columns, function). Anything else raises
+ImproperlyConfigured when the plan is built.
+"""
+from collections import defaultdict
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.db.models.fields.files import FieldFile
+from rest_framework import serializers
+from rest_framework.fields import empty
+from rest_framework.response import Response
+
+# Field types whose to_representation() is the identity for values the
+# database driver already returns (str, int, bool, decoded JSON)
+_PASSTHROUGH_FIELDS = (
+    serializers.IntegerField,
+    serializers.CharField,
+    serializers.BooleanField,
+    serializers.ChoiceField,
+)
+_CONVERTED_FIELDS = (
+    serializers.DecimalField,
+    serializers.FloatField,
+    serializers.DateTimeField,
+    serializers.DateField,
+    serializers.TimeField,
+)
+
+
+class ReadPlan:
+    def __init__(self, serializer, prefix=''):
+        self.model = serializer.Meta.model
+        self.prefix = prefix
+        self.pk_column = f'{prefix}{self.model._meta.pk.attname}'
+        self.columns = [self.pk_column]
+        self.entries = []    # (output name, getter(row)) for per-row fields
+        self.children = []   # (output name, child plan, fk attname) for many=True fields
+        self.layout = []     # output names in serializer order
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            self._compile(serializer, field)
+
+    def _add_column(self, column):
+        if column not in self.columns:
+            self.columns.append(column)
+        return column
+
+    def _compile(self, serializer, field):
+        name = field.field_name
+        hook = getattr(serializer, f'fast_{name}', None)
+        if hook is not None:
+            columns, function = hook()
+            keys = [self._add_column(f'{self.prefix}{column}') for column in columns]
+            self.entries.append((name, lambda row: function(*[row[key] for key in keys])))
+            self.layout.append(name)
+            return
+
+        source = field.source
+        if source == '*' or '.' in source:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: needs a fast_{name}() hook')
+        if not hasattr(self.model, source):
+            # Mirrors Field.get_attribute(): a missing attribute on an optional
+            # field with no default is skipped from the output entirely
+            if field.default is empty and not field.allow_null and not field.required:
+                return
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: no fast path for source {source!r}')
+        try:
+            model_field = self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: {source!r} is not a model field')
+
+        if isinstance(field, serializers.ListSerializer) and model_field.one_to_many:
+            if not isinstance(field.child, serializers.ModelSerializer) or self.prefix:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: unsupported nested list')
+            child = ReadPlan(field.child)
+            self.children.append((name, child, model_field.field.attname))
+            self.layout.append(name)
+            return
+
+        if isinstance(field, serializers.ModelSerializer) and model_field.many_to_one:
+            nested = ReadPlan(field, prefix=f'{self.prefix}{source}__')
+            if nested.children:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: unsupported nested list')
+            for column in nested.columns:
+                self._add_column(column)
+            pk_key = nested.pk_column
+            build = nested.build_row
+            self.entries.append((name, lambda row: None if row[pk_key] is None else build(row)))
+            self.layout.append(name)
+            return
+
+        if isinstance(field, serializers.PrimaryKeyRelatedField) and model_field.many_to_one:
+            if field.pk_field is not None:
+                raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: pk_field is not supported')
+            key = self._add_column(f'{self.prefix}{model_field.attname}')
+            self.entries.append((name, lambda row: row[key]))
+            self.layout.append(name)
+            return
+
+        if model_field.is_relation:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: unsupported relation field')
+
+        key = self._add_column(f'{self.prefix}{source}')
+        if isinstance(field, serializers.FileField):
+            to_representation = field.to_representation
+            convert = lambda value: to_representation(FieldFile(None, model_field, value))
+        elif isinstance(field, serializers.JSONField) and not field.binary:
+            convert = None
+        elif isinstance(field, _CONVERTED_FIELDS):
+            convert = field.to_representation
+        elif isinstance(field, _PASSTHROUGH_FIELDS):
+            convert = None
+        else:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: unsupported field type')
+
+        if convert is None:
+            self.entries.append((name, lambda row: row[key]))
+        else:
+            self.entries.append((name, lambda row: None if row[key] is None else convert(row[key])))
+        self.layout.append(name)
+
+    def build_row(self, row, children=None):
+        values = {name: get(row) for name, get in self.entries}
+        if not self.children:
+            return values  # Entries were compiled in serializer order
+        pk = row[self.pk_column]
+        for name, grouped in children.items():
+            values[name] = grouped.get(pk, [])
+        return {name: values[name] for name in self.layout}
+
+    def values(self, queryset, *extra):
+        """The .values() queryset this plan renders; extra names are selected too (e.g. ordering keys)."""
+        columns = list(self.columns)
+        columns.extend(name for name in extra if name not in columns)
+        return queryset.prefetch_related(None).values(*columns)
+
+    def render(self, rows):
+        """Render rows from values() to the serializer's output."""
+        rows = list(rows)
+        children = {}
+        if self.children and rows:
+            ids = [row[self.pk_column] for row in rows]
+            for name, plan, fk in self.children:
+                queryset = plan.model._default_manager.filter(**{f'{fk}__in': ids})
+                grouped = defaultdict(list)
+                child_rows = list(plan.values(queryset, fk))
+                for child_row, rendered in zip(child_rows, plan.render(child_rows)):
+                    grouped[child_row[fk]].append(rendered)
+                children[name] = grouped
+        return [self.build_row(row, children) for row in rows]
+
+
+class FastListMixin:
+    """
+    ViewSet mixin rendering list() through a ReadPlan of the view's serializer.
+
+    The queryset from get_queryset()/filter_queryset() is switched to
+    .values() (its ordering keys included, so cursor pagination still works)
+    and paginated and rendered as plain rows.
+    """
+
+    def get_read_plan(self):
+        return ReadPlan(self.get_serializer())
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        plan = self.get_read_plan()
+        ordering = list(queryset.query.order_by) or list(getattr(self, 'ordering', None) or [])
+        ordering_keys = [term.lstrip('-') for term in ordering if isinstance(term, str)]
+        rows = plan.values(queryset, *ordering_keys)
+
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(plan.render(page))
+        return Response(plan.render(rows))
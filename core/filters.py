@@ -1,7 +1,11 @@
 # filters.py
 import django_filters
-from django.db.models import Q
-from .models import Product, ProductVariant
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce
+from rest_framework import filters
+from .models import Product, ProductFacet
+from .services.facet_service import PRICE_BUCKETS, facet_filter
+from .services.search_service import search_products, tokenize
 
 class ProductFilter(django_filters.FilterSet):
     # Multi-value filters
@@ -17,15 +21,14 @@ class ProductFilter(django_filters.FilterSet):
         model = Product
         fields = []
 
+    # Color/size/material filters are semi-joins against the ProductFacet
+    # table, so no variant join and no DISTINCT are needed.
     def filter_by_colors(self, queryset, name, value):
         if not value:
             return queryset
         colors = self.request.GET.getlist('color')  # handles ?color=Black&color=White
         if colors:
-            q = Q()
-            for color in colors:
-                q |= Q(variants__color__iexact=color.strip())
-            queryset = queryset.filter(q).distinct()
+            queryset = queryset.filter(facet_filter(ProductFacet.COLOR, colors))
         return queryset
 
     def filter_by_sizes(self, queryset, name, value):
@@ -33,10 +36,7 @@ class ProductFilter(django_filters.FilterSet):
             return queryset
         sizes = self.request.GET.getlist('size')
         if sizes:
-            q = Q()
-            for size in sizes:
-                q |= Q(variants__size=size.strip())
-            queryset = queryset.filter(q).distinct()
+            queryset = queryset.filter(facet_filter(ProductFacet.SIZE, sizes))
         return queryset
 
     def filter_by_materials(self, queryset, name, value):
@@ -44,17 +44,62 @@ class ProductFilter(django_filters.FilterSet):
             return queryset
         materials = self.request.GET.getlist('material')
         if materials:
-            q = Q()
-            for mat in materials:
-                q |= Q(materials__contains=[mat.strip()])
-            queryset = queryset.filter(q)
+            queryset = queryset.filter(facet_filter(ProductFacet.MATERIAL, materials))
         return queryset
 
     def filter_by_price_range(self, queryset, name, value):
-        if value == 'under_500':
-            return queryset.filter(price__lt=500)
-        elif value == 'under_1000':
-            return queryset.filter(price__lt=1000)
-        elif value == 'under_2000':
-            return queryset.filter(price__lt=2000)
-        return queryset
\ No newline at end of file
+        # value is one of PRICE_BUCKETS, e.g. 'under_1000'
+        for bucket, limit in PRICE_BUCKETS:
+            if value == bucket:
+                return queryset.filter(price__lt=limit)
+        return queryset
+
+
+class ProductSearchFilter(filters.BaseFilterBackend):
+    """
+    ?search= backed by the full-text index (see core.services.search_service)
+    instead of SearchFilter's ICONTAINS scans. Matches are annotated with
+    `search_rank`, which ProductOrderingFilter uses when no explicit sort is given.
+    """
+    search_param = 'search'
+
+    def filter_queryset(self, request, queryset, view):
+        return search_products(queryset, request.query_params.get(self.search_param, ''))
+
+
+class ProductOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter that also understands the storefront's ?sort_by= values.
+
+    `sort_by=popular` (lifetime units sold) and `sort_by=trending` (decayed
+    recent sales) read the materialized ProductPopularity scores and take
+    precedence over ?ordering=. Searches without an explicit ordering sort by
+    relevance. The primary key is the tiebreaker so keyset pagination stays
+    stable. Anything else falls back to ?ordering=.
+    """
+    sort_param = 'sort_by'
+    search_param = ProductSearchFilter.search_param
+    # Products without a ProductPopularity row rank as zero, not NULL: NULLs
+    # sort differently per database and break keyset cursor comparisons
+    score_sorts = {
+        'popular': ('popular_units', Coalesce(F('popularity__units_sold'), Value(0))),
+        'trending': ('trend_score', Coalesce(F('popularity__trending_score'), Value(0.0))),
+    }
+
+    def get_ordering(self, request, queryset, view):
+        sort = self.score_sorts.get(request.query_params.get(self.sort_param))
+        if sort:
+            return [f'-{sort[0]}', 'id']
+        if self.ordering_param not in request.query_params and tokenize(
+            request.query_params.get(self.search_param, '')
+        ):
+            # Searches default to relevance
+            return ['-search_rank', 'id']
+        return super().get_ordering(request, queryset, view)
+
+    def filter_queryset(self, request, queryset, view):
+        sort = self.score_sorts.get(request.query_params.get(self.sort_param))
+        if sort:
+            annotation, score = sort
+            queryset = queryset.annotate(**{annotation: score})
+        return super().filter_queryset(request, queryset, view)
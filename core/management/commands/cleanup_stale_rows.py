@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from core.services.cleanup_service import DEFAULT_BATCH_SIZE, run_cleanup
+
+
+class Command(BaseCommand):
+    help = 'Purges abandoned carts and expired OTP codes and releases expired stock holds in small batches (schedule e.g. every 15 minutes)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument('--max-batches', type=int, default=None, help='Stop each purge after this many batches')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the rows that would be deleted')
+
+    def handle(self, *args, **options):
+        def progress(name, stats):
+            if options['verbosity'] >= 1:
+                self.stdout.write(
+                    f"{name}: batch {stats['batches']}, {stats['rows']} rows in {stats['seconds']:.2f}s"
+                )
+
+        results = run_cleanup(
+            batch_size=options['batch_size'],
+            max_batches=options['max_batches'],
+            dry_run=options['dry_run'],
+            progress=progress,
+        )
+        for name, stats in results.items():
+            if stats['dry_run']:
+                self.stdout.write(f'{name}: {stats["rows"]} rows would be processed')
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    f'✅ {name}: processed {stats["rows"]} rows in {stats["batches"]} batches, '
+                    f'{stats["seconds"]:.2f}s ({stats["rows_per_second"]:.0f} rows/s)'
+                ))
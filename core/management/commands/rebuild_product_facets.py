@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Product
+from core.services.facet_service import rebuild_product_facets
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the ProductFacet table (use after bulk imports that bypass model signals)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        product_ids = list(Product.objects.order_by('id').values_list('id', flat=True))
+        for start in range(0, len(product_ids), batch_size):
+            rebuild_product_facets(product_ids[start:start + batch_size])
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Rebuilt facets for {len(product_ids)} products')
+        )
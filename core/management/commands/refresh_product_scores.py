@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.services.popularity_service import refresh_product_scores
+
+
+class Command(BaseCommand):
+    help = 'Recomputes popular/trending scores from order history (schedule e.g. hourly)'
+
+    def handle(self, *args, **options):
+        count = refresh_product_scores()
+        self.stdout.write(
+            self.style.SUCCESS(f'✅ Refreshed scores for {count} products')
+        )
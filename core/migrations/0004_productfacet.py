@@ -0,0 +1,69 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_facets(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductFacet = apps.get_model('core', 'ProductFacet')
+
+    rows = []
+    for product in Product.objects.prefetch_related('variants').iterator(chunk_size=500):
+        facets = {}
+
+        def add(facet_type, raw_value, in_stock):
+            value = str(raw_value).strip().lower()
+            if not value:
+                return
+            key = (facet_type, value)
+            if key in facets:
+                facets[key].in_stock = facets[key].in_stock or in_stock
+            else:
+                facets[key] = ProductFacet(
+                    product_id=product.id,
+                    facet_type=facet_type,
+                    value=value[:100],
+                    label=str(raw_value).strip()[:100],
+                    in_stock=in_stock,
+                )
+
+        any_in_stock = False
+        for variant in product.variants.all():
+            any_in_stock = any_in_stock or variant.stock > 0
+            add('color', variant.color, variant.stock > 0)
+            add('size', variant.size, variant.stock > 0)
+        for material in product.materials or []:
+            add('material', material, any_in_stock)
+
+        rows.extend(facets.values())
+        if len(rows) >= 1000:
+            ProductFacet.objects.bulk_create(rows)
+            rows = []
+    ProductFacet.objects.bulk_create(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0003_coupon_is_new_user_only'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductFacet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('facet_type', models.CharField(choices=[('color', 'Color'), ('size', 'Size'), ('material', 'Material')], max_length=10)),
+                ('value', models.CharField(max_length=100)),
+                ('label', models.CharField(max_length=100)),
+                ('in_stock', models.BooleanField(default=False)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='facets', to='core.product')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['facet_type', 'value', 'product'], name='core_facet_lookup_idx')],
+                'unique_together': {('product', 'facet_type', 'value')},
+            },
+        ),
+        migrations.RunPython(backfill_facets, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:29
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+
+from django.db import migrations, models
+from django.db.models import Sum
+
+
+def backfill_popularity(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    OrderItem = apps.get_model('core', 'OrderItem')
+    ProductPopularity = apps.get_model('core', 'ProductPopularity')
+
+    # Same constants as core.services.popularity_service
+    epoch = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    half_life = timedelta(days=7)
+    since = datetime.now(timezone.utc) - timedelta(days=56)
+
+    units = dict(
+        OrderItem.objects.values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+    trending = defaultdict(float)
+    recent = OrderItem.objects.filter(order__created_at__gte=since).values_list(
+        'product_id', 'quantity', 'order__created_at'
+    )
+    for product_id, quantity, created_at in recent.iterator():
+        trending[product_id] += quantity * 2 ** ((created_at - epoch) / half_life)
+
+    ProductPopularity.objects.bulk_create(
+        [
+            ProductPopularity(
+                product_id=product_id,
+                units_sold=units.get(product_id, 0),
+                trending_score=trending.get(product_id, 0.0),
+            )
+            for product_id in Product.objects.values_list('id', flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_productfacet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductPopularity',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='popularity', serialize=False, to='core.product')),
+                ('units_sold', models.PositiveIntegerField(default=0)),
+                ('trending_score', models.FloatField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['units_sold', 'product'], name='core_popularity_units_idx'), models.Index(fields=['trending_score', 'product'], name='core_popularity_trend_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_popularity, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-17 04:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FTS_TABLE = 'core_product_fts'
+DOCUMENT_TABLE = 'core_productsearchdocument'
+
+SCHEMA = {
+    'sqlite': [
+        f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+            name, body,
+            content='{DOCUMENT_TABLE}', content_rowid='product_id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )""",
+        f"""CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {DOCUMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, name, body) VALUES (new.product_id, new.name, new.body);
+        END""",
+        f"""CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {DOCUMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, body) VALUES ('delete', old.product_id, old.name, old.body);
+        END""",
+        f"""CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE ON {DOCUMENT_TABLE} BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, body) VALUES ('delete', old.product_id, old.name, old.body);
+            INSERT INTO {FTS_TABLE}(rowid, name, body) VALUES (new.product_id, new.name, new.body);
+        END""",
+    ],
+    'postgresql': [
+        f"""ALTER TABLE {DOCUMENT_TABLE} ADD COLUMN search_vector tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('simple', coalesce(name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(body, '')), 'B')
+            ) STORED""",
+        f"CREATE INDEX {DOCUMENT_TABLE}_vector_idx ON {DOCUMENT_TABLE} USING GIN (search_vector)",
+    ],
+}
+
+DROP = {
+    'sqlite': [
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+        f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+        f"DROP TABLE IF EXISTS {FTS_TABLE}",
+    ],
+    'postgresql': [
+        f"DROP INDEX IF EXISTS {DOCUMENT_TABLE}_vector_idx",
+        f"ALTER TABLE {DOCUMENT_TABLE} DROP COLUMN IF EXISTS search_vector",
+    ],
+}
+
+
+def create_search_index(apps, schema_editor):
+    for sql in SCHEMA.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def drop_search_index(apps, schema_editor):
+    for sql in DROP.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+def backfill_documents(apps, schema_editor):
+    Product = apps.get_model('core', 'Product')
+    ProductSearchDocument = apps.get_model('core', 'ProductSearchDocument')
+
+    documents = []
+    products = Product.objects.select_related('category').prefetch_related('variants')
+    for product in products.iterator(chunk_size=500):
+        colors = []
+        for variant in product.variants.all():
+            if variant.color and variant.color not in colors:
+                colors.append(variant.color)
+        parts = [product.description, product.category.name]
+        parts.extend(str(material) for material in product.materials or [])
+        parts.extend(colors)
+        documents.append(ProductSearchDocument(
+            product_id=product.id,
+            name=product.name,
+            body=' '.join(part for part in parts if part),
+        ))
+        if len(documents) >= 500:
+            ProductSearchDocument.objects.bulk_create(documents)
+            documents = []
+    ProductSearchDocument.objects.bulk_create(documents)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0005_productpopularity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProductSearchDocument',
+            fields=[
+                ('product', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='search_document', serialize=False, to='core.product')),
+                ('name', models.CharField(max_length=200)),
+                ('body', models.TextField(blank=True)),
+            ],
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(backfill_documents, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def recount_items(Wishlist, WishlistItem):
+    counts = WishlistItem.objects.filter(wishlist=OuterRef('pk')).order_by().values(
+        'wishlist'
+    ).annotate(total=Count('pk')).values('total')
+    Wishlist.objects.update(item_count=Coalesce(Subquery(counts), Value(0)))
+
+
+def merge_into_items(apps, schema_editor):
+    """Copy rows that only exist in the old auto-created M2M table into WishlistItem."""
+    Wishlist = apps.get_model('core', 'Wishlist')
+    WishlistItem = apps.get_model('core', 'WishlistItem')
+    Through = Wishlist.products.through
+    rows = Through.objects.values_list('wishlist_id', 'product_id')
+    WishlistItem.objects.bulk_create(
+        (WishlistItem(wishlist_id=wishlist_id, product_id=product_id) for wishlist_id, product_id in rows.iterator()),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+    recount_items(Wishlist, WishlistItem)
+
+
+def split_from_items(apps, schema_editor):
+    """Reverse: the M2M gets its own table again, filled from WishlistItem."""
+    Wishlist = apps.get_model('core', 'Wishlist')
+    WishlistItem = apps.get_model('core', 'WishlistItem')
+    Through = Wishlist.products.through
+    rows = WishlistItem.objects.values_list('wishlist_id', 'product_id')
+    Through.objects.bulk_create(
+        (Through(wishlist_id=wishlist_id, product_id=product_id) for wishlist_id, product_id in rows.iterator()),
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_product_category_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='wishlist',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(merge_into_items, split_from_items),
+        # Django cannot add through= to an existing M2M, so drop the old
+        # auto-created table (its rows were merged above) and re-add it
+        migrations.RemoveField(
+            model_name='wishlist',
+            name='products',
+        ),
+        migrations.AddField(
+            model_name='wishlist',
+            name='products',
+            field=models.ManyToManyField(blank=True, related_name='wishlisted_by', through='core.WishlistItem', to='core.product'),
+        ),
+    ]
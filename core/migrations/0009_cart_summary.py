@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-17 07:41
+
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import DecimalField, ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_summaries(apps, schema_editor):
+    Cart = apps.get_model('core', 'Cart')
+    CartItem = apps.get_model('core', 'CartItem')
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    line_total = ExpressionWrapper(
+        F('quantity') * F('variant__product__price'),
+        output_field=DecimalField(max_digits=12, decimal_places=2),
+    )
+    Cart.objects.update(
+        item_count=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), Value(0)),
+        subtotal=Coalesce(
+            Subquery(items.annotate(total=Sum(line_total)).values('total')),
+            Value(Decimal('0.00')),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_wishlist_single_store'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cart',
+            name='item_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cart',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=Decimal('0.00'), max_digits=12),
+        ),
+        migrations.RunPython(fill_summaries, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_cart_summary'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='cart',
+            index=models.Index(fields=['updated_at', 'id'], name='core_cart_activity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='otp',
+            index=models.Index(fields=['expires_at', 'id'], name='core_otp_expiry_idx'),
+        ),
+    ]
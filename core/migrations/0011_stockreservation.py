@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 08:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_cleanup_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockReservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.PositiveIntegerField()),
+                ('status', models.CharField(choices=[('held', 'Held'), ('confirmed', 'Confirmed'), ('released', 'Released')], default='held', max_length=10)),
+                ('expires_at', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('order', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.order')),
+                ('variant', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reservations', to='core.productvariant')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['variant', 'status', 'expires_at'], name='core_reservation_active_idx'), models.Index(fields=['status', 'expires_at', 'id'], name='core_reservation_expiry_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='status',
+            field=models.CharField(choices=[('placed', 'Order Placed'), ('accepted', 'Accepted'), ('in_process', 'In Process'), ('out_for_delivery', 'Out for Delivery'), ('delivered', 'Delivered'), ('refund_pending', 'Refund Pending')], default='placed', max_length=20),
+        ),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-17 05:30
+
+from datetime import datetime, timezone
+
+from django.db import migrations, models
+
+
+def create_epoch(apps, schema_editor):
+    # The epoch existing scores were weighted against (the old module constant)
+    TrendingEpoch = apps.get_model('core', 'TrendingEpoch')
+    TrendingEpoch.objects.get_or_create(pk=1, defaults={'started_at': datetime(2025, 1, 1, tzinfo=timezone.utc)})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_order_refund_pending'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TrendingEpoch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('started_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.RunPython(create_epoch, migrations.RunPython.noop),
+    ]
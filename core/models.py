@@ -20,6 +20,7 @@ class CustomUser(AbstractUser):
 class Category(models.Model):
     name = models.CharField(max_length=100)  # e.g., 'Tracks', 'T-Shirts'
     slug = models.SlugField(unique=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Conditional-GET validator
 
     def __str__(self):
         return self.name
@@ -31,6 +32,8 @@ class Product(models.Model):
     category = models.ForeignKey('Category', on_delete=models.CASCADE)
     materials = models.JSONField(default=list, blank=True)
     is_new_drop = models.BooleanField(default=False)
+    # Also touched when a variant or image changes, so it covers the whole serialized product
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -44,6 +47,72 @@ class ProductVariant(models.Model):
     def __str__(self):
         return f"{self.product.name} - {self.color} - {self.size}"
 
+class ProductFacet(models.Model):
+    """Denormalized (product, facet) rows used for catalog filters and sidebar counts"""
+    COLOR = 'color'
+    SIZE = 'size'
+    MATERIAL = 'material'
+    FACET_TYPE_CHOICES = [
+        (COLOR, 'Color'),
+        (SIZE, 'Size'),
+        (MATERIAL, 'Material'),
+    ]
+
+    product = models.ForeignKey(Product, related_name="facets", on_delete=models.CASCADE)
+    facet_type = models.CharField(max_length=10, choices=FACET_TYPE_CHOICES)
+    value = models.CharField(max_length=100)     # Normalized: stripped + lowercase
+    label = models.CharField(max_length=100)     # Display form, e.g. 'Black'
+    in_stock = models.BooleanField(default=False)
+
+    class Meta:
+        unique_together = ('product', 'facet_type', 'value')
+        indexes = [
+            models.Index(fields=['facet_type', 'value', 'product'], name='core_facet_lookup_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id} {self.facet_type}={self.value}"
+
+class ProductPopularity(models.Model):
+    """Materialized ranking scores behind ?sort_by=popular and ?sort_by=trending"""
+    product = models.OneToOneField(Product, primary_key=True, related_name="popularity", on_delete=models.CASCADE)
+    units_sold = models.PositiveIntegerField(default=0)   # Lifetime units sold
+    trending_score = models.FloatField(default=0)         # Forward-decayed recent units sold
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['units_sold', 'product'], name='core_popularity_units_idx'),
+            models.Index(fields=['trending_score', 'product'], name='core_popularity_trend_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_id}: {self.units_sold} sold"
+
+class TrendingEpoch(models.Model):
+    """
+    Single row: the reference time trending_score weights are relative to.
+    Moved forward (with the scores rescaled) by
+    popularity_service.rebase_trending_scores before the weights can overflow.
+    """
+    started_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"trending epoch {self.started_at:%Y-%m-%d}"
+
+class ProductSearchDocument(models.Model):
+    """
+    Denormalized search text for a product. A database-specific full-text
+    index (SQLite FTS5 / Postgres tsvector) is built on top of this table
+    by migration 0006; see core.services.search_service.
+    """
+    product = models.OneToOneField(Product, primary_key=True, related_name="search_document", on_delete=models.CASCADE)
+    name = models.CharField(max_length=200)
+    body = models.TextField(blank=True)   # description, category, materials, colors
+
+    def __str__(self):
+        return self.name
+
 class ProductImage(models.Model):
     product = models.ForeignKey(Product, related_name="images", on_delete=models.CASCADE)
     image = models.ImageField(upload_to="products/")
@@ -55,6 +124,16 @@ class Cart(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    # Header badge summary, kept current from CartItem and Product.price writes
+    # (see core.services.cart_service.refresh_cart_summaries)
+    item_count = models.PositiveIntegerField(default=0)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, default=Decimal('0.00'))
+
+    class Meta:
+        indexes = [
+            # Abandoned-cart cleanup walks carts by last activity
+            models.Index(fields=['updated_at', 'id'], name='core_cart_activity_idx'),
+        ]
 
     def __str__(self):
         return f"Cart of {self.user.email}"
@@ -167,6 +246,7 @@ class Order(models.Model):
         ('in_process', 'In Process'),
         ('out_for_delivery', 'Out for Delivery'),
         ('delivered', 'Delivered'),
+        ('refund_pending', 'Refund Pending'),  # Paid, but the held stock was gone by then
     ]
     
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -211,6 +291,41 @@ class Payment(models.Model):
     status = models.CharField(max_length=20, default='pending')  # pending, captured, failed
     created_at = models.DateTimeField(auto_now_add=True)
 
+class StockReservation(models.Model):
+    """
+    Units of a variant set aside for an order.
+
+    A HELD row counts against available-to-sell until expires_at; confirming
+    it takes the units off ProductVariant.stock, and an expired or abandoned
+    hold is marked RELEASED by the sweep (see core.services.reservation_service).
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+    ]
+
+    variant = models.ForeignKey(ProductVariant, related_name='reservations', on_delete=models.CASCADE)
+    order = models.ForeignKey(Order, related_name='reservations', on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            # Active holds per variant: status = held AND expires_at > now
+            models.Index(fields=['variant', 'status', 'expires_at'], name='core_reservation_active_idx'),
+            # Expiry sweep
+            models.Index(fields=['status', 'expires_at', 'id'], name='core_reservation_expiry_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.variant} for {self.order} ({self.status})"
+
 class Review(models.Model):
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
@@ -242,6 +357,12 @@ class OTP(models.Model):
     expires_at = models.DateTimeField()
     is_used = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [
+            # Cleanup purges by expiry (used codes expire on the same clock)
+            models.Index(fields=['expires_at', 'id'], name='core_otp_expiry_idx'),
+        ]
+
     def is_valid(self):
         """Check if OTP is still valid and unused"""
         return not self.is_used and timezone.now() < self.expires_at
@@ -251,7 +372,10 @@ class OTP(models.Model):
 
 class Wishlist(models.Model):
     user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='wishlist')
-    products = models.ManyToManyField(Product, blank=True, related_name='wishlisted_by')
+    # WishlistItem is the only storage; this is a view over it
+    products = models.ManyToManyField(Product, through='WishlistItem', blank=True, related_name='wishlisted_by')
+    # Maintained by the WishlistItem / m2m signals, so reads never COUNT(*)
+    item_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -260,10 +384,10 @@ class Wishlist(models.Model):
 
     @property
     def total_items(self):
-        return self.products.count()
+        return self.item_count
 
 class WishlistItem(models.Model):
-    """Alternative approach using through model for more control"""
+    """Through model of Wishlist.products: one row per saved product"""
     wishlist = models.ForeignKey(Wishlist, on_delete=models.CASCADE, related_name='items')
     product = models.ForeignKey(Product, on_delete=models.CASCADE)
     added_at = models.DateTimeField(auto_now_add=True)
@@ -0,0 +1,174 @@
+# core/pagination.py
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor pagination keyed on the queryset's own ordering.
+
+    The cursor stores the ordering values of the last (or first) row on the
+    page and the next page is fetched with a `WHERE (a, b, id) > (...)` style
+    filter, so deep pages cost the same as page 1. The primary key is always
+    appended as a tiebreaker to keep the ordering total and stable.
+    Ordering fields must be non-null.
+    """
+    page_size = 24
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    tiebreaker = 'id'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(queryset, view)
+
+        cursor = self.decode_cursor(request, queryset)
+        reverse = cursor is not None and cursor['reverse']
+        ordering = [_flip(term) for term in self.ordering] if reverse else self.ordering
+
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(_keyset_filter(ordering, cursor['values']))
+
+        rows = list(queryset[:self.page_size + 1])
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        if reverse:
+            rows.reverse()
+
+        # Moving backwards means there is always a page after this one, and
+        # vice versa; the extra row tells us about the other direction.
+        if reverse:
+            self.has_next, self.has_previous = cursor is not None, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = rows
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            requested = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if requested <= 0:
+            return self.page_size
+        return min(requested, self.max_page_size)
+
+    def get_ordering(self, queryset, view=None):
+        ordering = list(queryset.query.order_by) or list(getattr(view, 'ordering', None) or [])
+        for term in ordering:
+            if not isinstance(term, str):
+                raise TypeError('KeysetPagination only supports ordering by field names.')
+        if not any(term.lstrip('-') in (self.tiebreaker, 'pk') for term in ordering):
+            ordering.append(self.tiebreaker)
+        return ordering
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def encode_cursor(self, row, reverse):
+        payload = {'v': [_get_value(row, term.lstrip('-')) for term in self.ordering]}
+        if reverse:
+            payload['r'] = 1
+        raw = json.dumps(payload, cls=DjangoJSONEncoder, separators=(',', ':'))
+        encoded = base64.urlsafe_b64encode(raw.encode()).decode()
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encoded)
+
+    def decode_cursor(self, request, queryset):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(encoded.encode()).decode())
+            values = payload['v']
+        except (TypeError, ValueError, KeyError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        # A forged value of the wrong type would otherwise fail in the filter (a 500)
+        try:
+            values = [
+                _ordering_field(queryset, term.lstrip('-')).to_python(value)
+                for term, value in zip(self.ordering, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if any(value is None for value in values):
+            raise NotFound(self.invalid_cursor_message)
+        return {'values': values, 'reverse': bool(payload.get('r'))}
+
+
+def _flip(term):
+    return term[1:] if term.startswith('-') else f'-{term}'
+
+
+def _ordering_field(queryset, name):
+    """The model field (or annotation output field) an ordering term sorts by."""
+    annotation = queryset.query.annotations.get(name)
+    if annotation is not None:
+        return annotation.output_field
+    model = queryset.model
+    *relations, last = name.split('__')
+    for relation in relations:
+        model = model._meta.get_field(relation).related_model
+    return model._meta.pk if last == 'pk' else model._meta.get_field(last)
+
+
+def _get_value(row, field):
+    if isinstance(row, dict):
+        return row[field]
+    value = row
+    for attr in field.split('__'):
+        value = getattr(value, attr)
+    return value
+
+
+def _keyset_filter(ordering, values):
+    """Build `(f1, f2, ...) > (v1, v2, ...)` honouring each field's direction."""
+    condition = Q()
+    equal_prefix = Q()
+    for term, value in zip(ordering, values):
+        field = term.lstrip('-')
+        lookup = 'lt' if term.startswith('-') else 'gt'
+        condition |= equal_prefix & Q(**{f'{field}__{lookup}': value})
+        equal_prefix &= Q(**{field: value})
+    return condition
@@ -0,0 +1,12 @@
+# core/queries.py
+"""Query expressions shared by the serializers and the services."""
+from django.db.models import OuterRef, Subquery
+
+from .models import ProductImage
+
+
+def first_image_subquery(product_ref='pk'):
+    """Image path of a product's first image, for annotating a queryset; product_ref points at the product"""
+    return Subquery(
+        ProductImage.objects.filter(product=OuterRef(product_ref)).order_by('id').values('image')[:1]
+    )
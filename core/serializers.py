@@ -1,5 +1,52 @@
+from django.core.files.storage import default_storage
+from django.db.models import Exists, OuterRef
 from rest_framework import serializers
 from .models import *
+from .queries import first_image_subquery
+from .services.checkout_service import commit_order
+from .services.wishlist_service import get_wishlisted_product_ids
+
+
+def media_url(path, context):
+    """Absolute (when there is a request) URL of a stored file path"""
+    if not path:
+        return None
+    url = default_storage.url(path)
+    request = context.get('request')
+    return request.build_absolute_uri(url) if request is not None else url
+
+
+def parse_sparse_fieldset(query_params):
+    """Read ?fields=a,b and ?expand=c from the query string; fields is None when not given."""
+    def names(param):
+        return {name.strip() for value in query_params.getlist(param) for name in value.split(',') if name.strip()}
+    return names('fields') or None, names('expand')
+
+
+class SparseFieldsetMixin:
+    """
+    Lets callers pick the rendered fields: fields=[...] keeps only those,
+    expand=[...] adds names from Meta.expandable_fields, which are not
+    rendered by default. Unknown names are ignored.
+    """
+
+    def __init__(self, *args, fields=None, expand=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        wanted = set(self.resolve_fields(fields, expand))
+        for name in list(self.fields):
+            if name not in wanted:
+                self.fields.pop(name)
+
+    @classmethod
+    def resolve_fields(cls, fields=None, expand=()):
+        expandable = set(getattr(cls.Meta, 'expandable_fields', ()))
+        if fields:
+            wanted = set(fields)
+        else:
+            wanted = {name for name in cls.Meta.fields if name not in expandable}
+        wanted |= set(expand) & expandable
+        return [name for name in cls.Meta.fields if name in wanted]
+
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -9,7 +56,7 @@ class UserSerializer(serializers.ModelSerializer):
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
         model = Category
-        fields = '__all__'
+        fields = ['id', 'name', 'slug']  # updated_at is only a cache validator
 
 
 
@@ -23,11 +70,12 @@ class ProductVariantSerializer(serializers.ModelSerializer):
         model = ProductVariant
         fields = ['id', 'color', 'size', 'stock']
 
-class ProductSerializer(serializers.ModelSerializer):
+class ProductSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     category = CategorySerializer()
     variants = ProductVariantSerializer(many=True, read_only=True)
     images = ProductImageSerializer(many=True, read_only=True)
     is_wishlisted = serializers.SerializerMethodField()
+    thumbnail = serializers.SerializerMethodField()  # ?expand=thumbnail, for grid tiles
 
     class Meta:
         model = Product
@@ -42,21 +90,53 @@ class ProductSerializer(serializers.ModelSerializer):
             'variants',
             'images',
             'is_wishlisted',  # New field
+            'thumbnail',
         ]
+        expandable_fields = ['thumbnail']
+
+    # Columns that are only loaded when their field is rendered
+    deferrable_columns = ['description', 'materials']
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, fields=None, expand=()):
+        """
+        Load what the rendered fields need up front so serializing a page is a
+        fixed number of queries; joins, prefetches and columns for fields that
+        were not requested are skipped.
+        """
+        rendered = set(cls.resolve_fields(fields, expand))
+        if 'category' in rendered:
+            queryset = queryset.select_related('category')
+        prefetches = [name for name in ('variants', 'images') if name in rendered]
+        if prefetches:
+            queryset = queryset.prefetch_related(*prefetches)
+        if 'thumbnail' in rendered:
+            queryset = queryset.annotate(thumbnail_path=first_image_subquery())
+        deferred = [column for column in cls.deferrable_columns if column not in rendered]
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        return queryset
 
     def get_is_wishlisted(self, obj):
         """Check if current user has this product in wishlist"""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            try:
-                wishlist = Wishlist.objects.get(user=request.user)
-                return WishlistItem.objects.filter(
-                    wishlist=wishlist, 
-                    product=obj
-                ).exists()
-            except Wishlist.DoesNotExist:
-                return False
-        return False
+        # Membership is loaded once per request and shared by every serializer
+        return obj.id in get_wishlisted_product_ids(self.context.get('request'))
+
+    def get_thumbnail(self, obj):
+        """URL of the product's first image (annotated by setup_eager_loading)"""
+        path = getattr(obj, 'thumbnail_path', None)
+        if path is None:
+            image = min(obj.images.all(), key=lambda image: image.id, default=None)
+            path = image.image.name if image else None
+        return media_url(path, self.context)
+
+    # Compiled read path (core.fast_serializers): method fields as (columns, function)
+    def fast_is_wishlisted(self):
+        wishlisted = get_wishlisted_product_ids(self.context.get('request'))
+        return ['id'], lambda product_id: product_id in wishlisted
+
+    def fast_thumbnail(self):
+        return ['thumbnail_path'], lambda path: media_url(path, self.context)
 
 class CartItemSerializer(serializers.ModelSerializer):
     variant = ProductVariantSerializer(read_only=True)
@@ -71,12 +151,65 @@ class CartItemSerializer(serializers.ModelSerializer):
         fields = ['id', 'variant', 'variant_id', 'quantity']
 
 
+class CartAddSerializer(serializers.Serializer):
+    """Add-to-cart input; the variant is checked by the upsert itself, not loaded here"""
+    variant_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartOperationSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['set', 'increment', 'remove'])
+    variant_id = serializers.IntegerField(min_value=1)
+    quantity = serializers.IntegerField(required=False)
+
+    def validate(self, attrs):
+        quantity = attrs.get('quantity')
+        if attrs['op'] == 'set' and (quantity is None or quantity < 0):
+            raise serializers.ValidationError({'quantity': 'set needs a quantity of 0 or more'})
+        if attrs['op'] == 'increment' and not quantity:
+            raise serializers.ValidationError({'quantity': 'increment needs a non-zero quantity'})
+        return attrs
+
+
+class CartBatchSerializer(serializers.Serializer):
+    operations = CartOperationSerializer(many=True, allow_empty=False, max_length=100)
+
+
+class CartProductSummarySerializer(serializers.Serializer):
+    """The product behind a cart line, read from the line's joined variant__product"""
+    id = serializers.IntegerField(source='variant.product_id')
+    name = serializers.CharField(source='variant.product.name')
+    price = serializers.DecimalField(max_digits=10, decimal_places=2, source='variant.product.price')
+    thumbnail = serializers.SerializerMethodField()
+
+    def get_thumbnail(self, obj):
+        return media_url(obj.thumbnail_path, self.context)
+
+
+class CartLineSerializer(serializers.ModelSerializer):
+    """Cart item priced at the current product price; expects the annotations of cart_service.cart_lines()"""
+    variant = ProductVariantSerializer(read_only=True)
+    product = CartProductSummarySerializer(source='*', read_only=True)
+    unit_price = serializers.DecimalField(max_digits=10, decimal_places=2, source='variant.product.price', read_only=True)
+    line_total = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    in_stock = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = CartItem
+        fields = ['id', 'variant', 'product', 'quantity', 'unit_price', 'line_total', 'in_stock']
+
+
+class CartSummarySerializer(serializers.Serializer):
+    item_count = serializers.IntegerField()
+    subtotal = serializers.DecimalField(max_digits=12, decimal_places=2)
+
+
 class CartSerializer(serializers.ModelSerializer):
-    items = CartItemSerializer(many=True, read_only=True)
+    items = CartLineSerializer(many=True, read_only=True)
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'created_at', 'updated_at', 'items']
+        fields = ['id', 'user', 'created_at', 'updated_at', 'items', 'item_count', 'subtotal']
 
 class OrderItemSerializer(serializers.ModelSerializer):
     product = ProductSerializer()
@@ -107,6 +240,34 @@ class WishlistItemSerializer(serializers.ModelSerializer):
         model = WishlistItem
         fields = ['id', 'product', 'product_id', 'added_at']
 
+class ProductTileSerializer(serializers.ModelSerializer):
+    """Compact product for saved-item tiles: no category, variants or image list"""
+    thumbnail = serializers.SerializerMethodField()
+    in_stock = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = Product
+        fields = ['id', 'name', 'price', 'thumbnail', 'in_stock']
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        """Everything the tile needs comes back as columns of the product query itself"""
+        return queryset.only('id', 'name', 'price').annotate(
+            thumbnail_path=first_image_subquery(),
+            in_stock=Exists(ProductVariant.objects.filter(product=OuterRef('pk'), stock__gt=0)),
+        )
+
+    def get_thumbnail(self, obj):
+        return media_url(obj.thumbnail_path, self.context)
+
+
+class WishlistEntrySerializer(serializers.Serializer):
+    """A row of the paginated wishlist, rendered from an annotated Product (see WishlistViewSet.list)"""
+    id = serializers.IntegerField(source='wishlist_item_id')
+    product = ProductTileSerializer(source='*')
+    added_at = serializers.DateTimeField()
+
+
 class WishlistSerializer(serializers.ModelSerializer):
     items = WishlistItemSerializer(many=True, read_only=True)
     total_items = serializers.ReadOnlyField()
@@ -206,19 +367,14 @@ class CheckoutSerializer(serializers.Serializer):
     def get_cart_items(self, obj):
         # This won't be called during input validation/deserialization
         # It's for output serialization if the full cart summary is returned
-        # The cart items are accessed via self.context['cart_items'] in create()
+        # The cart items are accessed via self.context['quote'] in create()
         return [] # Placeholder for output logic if needed separately
 
     def create(self, validated_data):
         """
-        Override create to handle order and order items creation based on context['cart_items'].
+        Place the order for the quote in context['quote'] (priced by the view
+        from the user's cart) through the checkout service.
         """
-        user = self.context['user']
-        cart_items = self.context['cart_items']
-
-        if not cart_items.exists():
-             raise serializers.ValidationError("Cart is empty, cannot create order.")
-
         # --- Prepare Shipping Address String ---
         # Combine the individual address fields into the single TextField expected by your Order model
         address_parts = [
@@ -231,42 +387,18 @@ class CheckoutSerializer(serializers.Serializer):
         ]
         full_shipping_address = ", ".join(part for part in address_parts if part)
 
-        # --- Calculate Total Amount ---
-        # Simple calculation based on cart item prices and quantities
-        # Add logic here later for shipping cost, discounts, taxes if applicable before saving
-        total_amount = sum(
-            float(item.variant.product.price) * item.quantity for item in cart_items
-        )
-
-        # --- Create the Order Object ---
-        order = Order.objects.create(
-            user=user,
-            # Combine name and address details into the shipping_address TextField
-            shipping_address=full_shipping_address,
-            # Use the email sent from the frontend as the billing email
-            billing_email=validated_data['email'],
-            payment_method=validated_data['payment_method'],
-            total_amount=total_amount,
-            # Status defaults to 'placed' as per your model
-            # Other fields like razorpay_order_id will be set later
+        # Online orders hold stock until payment; COD takes it now. The cart is cleared either way.
+        payment_method = validated_data['payment_method']
+        return commit_order(
+            self.context['user'],
+            self.context['quote'],
+            payment_method,
+            full_shipping_address,
+            validated_data['email'],  # Use the email sent from the frontend as the billing email
+            hold=payment_method != 'cod',
+            clear_cart=True,
         )
 
-        # --- Create OrderItem Objects based on CartItems ---
-        for cart_item in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=cart_item.variant.product, # Link to the Product
-                variant=cart_item.variant,         # Link to the specific ProductVariant
-                quantity=cart_item.quantity,
-                # Store the price at the time of order (from the product)
-                price=cart_item.variant.product.price,
-                # Store the size explicitly (as per your OrderItem model)
-                size=cart_item.variant.size
-                # Color is implicitly linked via the variant
-            )
-
-        return order
-
     def validate(self, attrs):
         """
         Perform any cross-field validation if necessary.
@@ -292,6 +424,10 @@ class OrderSerializer(serializers.ModelSerializer):
     items = CheckoutItemSerializer(source='get_order_items', many=True, read_only=True) # Or a dedicated OrderItemSerializer
     user = serializers.StringRelatedField(read_only=True) # Show username
 
+    def fast_user(self):
+        # Compiled read path (core.fast_serializers): str(user) is the username
+        return ['user__username'], str
+
     class Meta:
         model = Order
         # Include fields relevant for the checkout confirmation response
@@ -0,0 +1,269 @@
+# core/services/cart_service.py
+from contextlib import contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+
+from django.db import connection, transaction
+from django.db.models import (
+    BooleanField, DecimalField, ExpressionWrapper, F, OuterRef, Q, QuerySet, Subquery, Sum, Value,
+)
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Cart, CartItem, ProductVariant
+from core.queries import first_image_subquery
+from core.utils.sql import delete_by_pk
+
+ZERO = Decimal('0.00')
+LINE_TOTAL = ExpressionWrapper(
+    F('quantity') * F('variant__product__price'),
+    output_field=DecimalField(max_digits=12, decimal_places=2),
+)
+
+
+def cart_lines(cart):
+    """
+    The cart's items with variant, product, line total, stock flag and
+    thumbnail, all from one joined query.
+    """
+    return CartItem.objects.filter(cart=cart).select_related('variant__product').annotate(
+        line_total=LINE_TOTAL,
+        in_stock=ExpressionWrapper(Q(variant__stock__gte=F('quantity')), output_field=BooleanField()),
+        thumbnail_path=first_image_subquery('variant__product'),
+    ).order_by('id')
+
+
+_summaries_skipped = ContextVar('cart_summaries_skipped', default=False)
+
+
+@contextmanager
+def skip_summary_refresh():
+    """
+    Make the CartItem signals skip their per-row summary refresh inside the
+    block, for deletes of whole carts (or code that refreshes once itself).
+    """
+    token = _summaries_skipped.set(True)
+    try:
+        yield
+    finally:
+        _summaries_skipped.reset(token)
+
+
+def summary_refresh_skipped():
+    return _summaries_skipped.get()
+
+
+def refresh_cart_summaries(carts, touch=True):
+    """
+    Recompute item_count and subtotal for the given carts (a queryset or IDs)
+    in one UPDATE. Each cart's aggregate reads only its own items, so the
+    cost follows the cart size, not the number of carts in the table.
+    """
+    if not isinstance(carts, QuerySet):
+        carts = Cart.objects.filter(pk__in=list(carts))
+    items = CartItem.objects.filter(cart=OuterRef('pk')).order_by().values('cart')
+    fields = {
+        'item_count': Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total')), Value(0)),
+        'subtotal': Coalesce(
+            Subquery(items.annotate(total=Sum(LINE_TOTAL)).values('total')),
+            Value(ZERO),
+            output_field=DecimalField(max_digits=12, decimal_places=2),
+        ),
+    }
+    if touch:
+        fields['updated_at'] = timezone.now()
+    carts.update(**fields)
+
+
+def get_cart_summary(user):
+    """{item_count, subtotal} for the header badge: one indexed row read, no items loaded."""
+    row = Cart.objects.filter(user=user).values('item_count', 'subtotal').first()
+    return row or {'item_count': 0, 'subtotal': ZERO}
+
+
+CART_TABLE = Cart._meta.db_table
+ITEM_TABLE = CartItem._meta.db_table
+VARIANT_TABLE = ProductVariant._meta.db_table
+
+# Insert the line or add to it in one statement, only if the new quantity
+# fits in the variant's stock; otherwise nothing is written and no row is
+# returned. The variant's columns come back for the response.
+_UPSERT = f"""
+    INSERT INTO {ITEM_TABLE} (cart_id, variant_id, quantity)
+    SELECT c.id, v.id, %(quantity)s
+    FROM {CART_TABLE} c, {VARIANT_TABLE} v
+    WHERE c.user_id = %(user)s AND v.id = %(variant)s AND v.stock >= %(quantity)s
+    ON CONFLICT (cart_id, variant_id) DO UPDATE
+    SET quantity = {ITEM_TABLE}.quantity + %(quantity)s
+    WHERE {ITEM_TABLE}.quantity + %(quantity)s <= (
+        SELECT stock FROM {VARIANT_TABLE} WHERE id = {ITEM_TABLE}.variant_id
+    )
+    RETURNING id, cart_id, quantity,
+        (SELECT color FROM {VARIANT_TABLE} WHERE id = {ITEM_TABLE}.variant_id),
+        (SELECT size FROM {VARIANT_TABLE} WHERE id = {ITEM_TABLE}.variant_id),
+        (SELECT stock FROM {VARIANT_TABLE} WHERE id = {ITEM_TABLE}.variant_id)
+"""
+_UPSERT_VENDORS = ('sqlite', 'postgresql')
+
+
+class StockLimitReached(Exception):
+    """Nothing was added: the cart would hold more than the variant's stock."""
+
+    def __init__(self, stock, in_cart):
+        super().__init__(f'Only {stock} left')
+        self.stock = stock
+        self.in_cart = in_cart
+
+
+def add_to_cart(user, variant_id, quantity):
+    """
+    Add quantity of the variant to the user's cart, all or nothing.
+
+    Returns the CartItem, built from the upsert's row with its variant. Raises
+    ProductVariant.DoesNotExist for unknown variants and StockLimitReached
+    when the line would go past the stock. The line is written by one upsert
+    that increments in SQL, so concurrent adds never lose an update.
+    """
+    params = {'user': user.pk, 'variant': variant_id, 'quantity': quantity}
+    for attempt in range(2):
+        with transaction.atomic():
+            if connection.vendor in _UPSERT_VENDORS:
+                with connection.cursor() as cursor:
+                    cursor.execute(_UPSERT, params)
+                    row = cursor.fetchone()
+            else:
+                row = _add_orm(user, variant_id, quantity)
+            if row is not None:
+                item_id, cart_id, new_quantity, color, size, stock = row
+                # Raw SQL skips the CartItem signals
+                refresh_cart_summaries([cart_id])
+                variant = ProductVariant(id=variant_id, color=color, size=size, stock=stock)
+                return CartItem(id=item_id, cart_id=cart_id, variant=variant, quantity=new_quantity)
+
+        # No row: unknown variant, not enough stock, or no cart yet
+        stock = ProductVariant.objects.filter(pk=variant_id).values_list('stock', flat=True).first()
+        if stock is None:
+            raise ProductVariant.DoesNotExist(f'Variant {variant_id} does not exist')
+        in_cart = CartItem.objects.filter(cart__user=user, variant_id=variant_id).values_list(
+            'quantity', flat=True
+        ).first()
+        if (in_cart or 0) + quantity > stock:
+            raise StockLimitReached(stock, in_cart or 0)
+        Cart.objects.get_or_create(user=user)
+    raise RuntimeError('Add to cart did not apply')
+
+
+def _add_orm(user, variant_id, quantity):
+    cart = Cart.objects.filter(user=user).first()
+    variant = ProductVariant.objects.select_for_update().filter(pk=variant_id, stock__gte=quantity).first()
+    if cart is None or variant is None:
+        return None
+    item, created = CartItem.objects.select_for_update().get_or_create(
+        cart=cart, variant=variant, defaults={'quantity': quantity}
+    )
+    if not created:
+        if item.quantity + quantity > variant.stock:
+            return None
+        CartItem.objects.filter(pk=item.pk).update(quantity=F('quantity') + quantity)
+        item.refresh_from_db(fields=['quantity'])
+    return item.id, cart.id, item.quantity, variant.color, variant.size, variant.stock
+
+
+class CartBatchError(Exception):
+    """The batch was rejected as a whole; problems is one entry per offending variant."""
+
+    def __init__(self, problems):
+        super().__init__('Cart batch rejected')
+        self.problems = problems
+
+
+def apply_operations(quantities, operations):
+    """
+    Run {'op', 'variant_id', 'quantity'} operations in order over a
+    {variant_id: quantity} mapping and return the new mapping: 'set'
+    replaces, 'increment' adds (negative amounts subtract) and 'remove'
+    zeroes. Lines at zero or below are meant to be dropped by the caller.
+    """
+    quantities = dict(quantities)
+    for operation in operations:
+        variant_id = operation['variant_id']
+        if operation['op'] == 'set':
+            quantities[variant_id] = operation['quantity']
+        elif operation['op'] == 'increment':
+            quantities[variant_id] = quantities.get(variant_id, 0) + operation['quantity']
+        else:
+            quantities[variant_id] = 0
+    return quantities
+
+
+def stock_problems(variants, quantities):
+    """One entry per variant in quantities that is unknown (not in variants) or above its stock."""
+    problems = []
+    for variant_id in sorted(quantities):
+        variant = variants.get(variant_id)
+        quantity = max(quantities[variant_id], 0)
+        if variant is None:
+            problems.append({'variant_id': variant_id, 'error': 'Product variant not found'})
+        elif quantity > variant.stock:
+            problems.append({
+                'variant_id': variant_id,
+                'error': f'Only {variant.stock} left',
+                'requested': quantity,
+                'stock': variant.stock,
+            })
+    return problems
+
+
+def apply_cart_operations(user, operations, cap_at_stock=False):
+    """
+    Apply a list of {'op', 'variant_id', 'quantity'} operations (see
+    apply_operations) to the user's cart in one transaction and return the cart.
+
+    Every touched variant is locked and stock-checked in one query, and the
+    lines are written with one bulk insert, one bulk update and one delete.
+    If any variant is unknown or would end above its stock, nothing is
+    written and CartBatchError is raised; with cap_at_stock, unknown variants
+    are skipped and quantities are lowered to the stock instead.
+    """
+    variant_ids = {operation['variant_id'] for operation in operations}
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user=user)
+        variants = ProductVariant.objects.select_for_update().filter(pk__in=variant_ids).in_bulk()
+        lines = {item.variant_id: item for item in CartItem.objects.filter(cart=cart, variant_id__in=variant_ids)}
+
+        quantities = apply_operations(
+            {variant_id: item.quantity for variant_id, item in lines.items()}, operations
+        )
+        if cap_at_stock:
+            quantities = {
+                variant_id: min(quantity, variants[variant_id].stock) if variant_id in variants else 0
+                for variant_id, quantity in quantities.items()
+            }
+        else:
+            problems = stock_problems(variants, {variant_id: quantities[variant_id] for variant_id in variant_ids})
+            if problems:
+                raise CartBatchError(problems)
+
+        to_create, to_update, to_delete = [], [], []
+        for variant_id, quantity in quantities.items():
+            line = lines.get(variant_id)
+            if quantity <= 0:
+                if line is not None:
+                    to_delete.append(line.pk)
+            elif line is None:
+                to_create.append(CartItem(cart=cart, variant_id=variant_id, quantity=quantity))
+            elif line.quantity != quantity:
+                line.quantity = quantity
+                to_update.append(line)
+
+        # Bulk writes skip the CartItem signals; the summary is refreshed once below
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ['quantity'])
+        if to_delete:
+            # Nothing references CartItem, so no cascade or per-row signals are needed
+            delete_by_pk(CartItem, to_delete)
+        if to_create or to_update or to_delete:
+            refresh_cart_summaries([cart.pk])
+    return cart
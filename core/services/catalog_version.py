@@ -0,0 +1,29 @@
+# core/services/catalog_version.py
+import time
+
+from django.core.cache import cache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def _clock_version():
+    # Microseconds since the epoch: monotonic enough across workers and
+    # doubles as a Last-Modified timestamp.
+    return time.time_ns() // 1000
+
+
+def get_catalog_version():
+    """Current catalog version (a cache read; never touches the database)."""
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        cache.add(CATALOG_VERSION_KEY, _clock_version(), None)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    """Mark every catalog-derived cache entry as stale."""
+    current = cache.get(CATALOG_VERSION_KEY) or 0
+    version = max(_clock_version(), current + 1)
+    cache.set(CATALOG_VERSION_KEY, version, None)
+    return version
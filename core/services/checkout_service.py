@@ -0,0 +1,196 @@
+# core/services/checkout_service.py
+"""
+The one way an order gets created.
+
+Every order endpoint (place-order, create-order, create-cod-order and
+checkout) is an adapter that gathers lines and addresses, prices them with
+price_lines() and hands the Quote to commit_order(). So an order goes
+through the same two steps everywhere:
+
+1. Pricing (price_lines): Decimal line totals at the current product price,
+   then the coupon (percentage, fixed amount or BOGO 50) applied to the
+   subtotal with the same validity rules on every path.
+2. Commit (commit_order), in one transaction: the order row, all items in
+   one bulk insert, the stock step (a hold for online payment, or an
+   immediate decrement), the coupon's usage bump as one conditional UPDATE,
+   and optionally the ordered lines removed from the cart with one DELETE.
+
+The number of queries does not depend on how many lines the order has.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from core.models import Cart, CartItem, Coupon, Order, OrderItem, ProductVariant
+from core.services.cart_service import refresh_cart_summaries
+from core.services.coupon_service import apply_coupon_to_cart
+from core.services.popularity_service import record_sales
+from core.services.reservation_service import reserve_stock, take_stock
+from core.utils.sql import delete_by_pk
+
+ZERO = Decimal('0.00')
+
+
+class CheckoutError(Exception):
+    """A checkout that cannot go ahead; status is the HTTP status the adapters answer with."""
+
+    def __init__(self, message, status=400, details=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.details = details
+
+
+class Line:
+    """One order line: a variant (with its product loaded), a quantity and the cart line it came from, if any."""
+    __slots__ = ('variant', 'quantity', 'cart_item_id')
+
+    def __init__(self, variant, quantity, cart_item_id=None):
+        self.variant = variant
+        self.quantity = quantity
+        self.cart_item_id = cart_item_id
+
+    @property
+    def unit_price(self):
+        return self.variant.product.price
+
+    @property
+    def total(self):
+        return self.unit_price * self.quantity
+
+
+class Quote:
+    __slots__ = ('lines', 'subtotal', 'discount', 'coupon')
+
+    def __init__(self, lines, subtotal, discount=ZERO, coupon=None):
+        self.lines = lines
+        self.subtotal = subtotal
+        self.discount = discount
+        self.coupon = coupon
+
+    @property
+    def total(self):
+        return self.subtotal - self.discount
+
+
+def cart_checkout_lines(user):
+    """The user's cart as Lines, from one joined query."""
+    items = list(CartItem.objects.filter(cart__user=user).select_related('variant__product').order_by('id'))
+    if not items:
+        if not Cart.objects.filter(user=user).exists():
+            raise CheckoutError('Cart not found', status=404)
+        raise CheckoutError('Cart is empty')
+    return [Line(item.variant, item.quantity, item.pk) for item in items]
+
+
+def requested_lines(items):
+    """
+    Lines from [{'variant_id', 'quantity'}] request data, loaded in one
+    query; repeated variants are merged.
+    """
+    quantities = {}
+    for item in items:
+        variant_id = item.get('variant_id')
+        if not variant_id:
+            raise CheckoutError('variant_id is required for each item')
+        try:
+            variant_id, quantity = int(variant_id), int(item.get('quantity', 1))
+        except (TypeError, ValueError):
+            raise CheckoutError('variant_id and quantity must be whole numbers')
+        if quantity < 1:
+            raise CheckoutError('quantity must be at least 1')
+        quantities[variant_id] = quantities.get(variant_id, 0) + quantity
+    variants = ProductVariant.objects.select_related('product').in_bulk(quantities)
+    if len(variants) != len(quantities):
+        raise CheckoutError('Invalid variant_id')
+    return [Line(variants[variant_id], quantity) for variant_id, quantity in quantities.items()]
+
+
+def price_lines(lines, coupon_code=None, user=None):
+    """Price the lines and apply the coupon, if any. Raises CheckoutError for unusable coupons."""
+    subtotal = sum((line.total for line in lines), ZERO)
+    code = (coupon_code or '').strip()
+    if not code:
+        return Quote(lines, subtotal)
+
+    coupon = Coupon.objects.filter(code__iexact=code).first()
+    if coupon is None:
+        raise CheckoutError('Invalid coupon code')
+    if not coupon.is_valid():
+        raise CheckoutError('Coupon is not valid (check dates, status, or usage limit).')
+    if coupon.is_new_user_only and not coupon.is_valid_for_user(user):
+        raise CheckoutError('This coupon is only available for new users.')
+    if subtotal < coupon.minimum_order_amount:
+        raise CheckoutError(
+            f'Order total is less than the minimum required amount of ₹{coupon.minimum_order_amount} for this coupon.'
+        )
+
+    if coupon.discount_type == 'bogo_50':
+        # apply_coupon_to_cart reads item.variant.product like a CartItem
+        discount = apply_coupon_to_cart(coupon, lines, user)
+    else:
+        discount = coupon.calculate_discount(subtotal)
+    discount = min(discount, subtotal).quantize(Decimal('0.01'))
+    if discount <= 0:
+        return Quote(lines, subtotal)
+    return Quote(lines, subtotal, discount, coupon)
+
+
+def commit_order(user, quote, payment_method, shipping_address, billing_email, hold=False, clear_cart=False,
+                 razorpay_order_id=None):
+    """
+    Create the order for a quote in one transaction and return it.
+
+    hold=True reserves the stock until payment is verified
+    (confirm_reservations), which is also when the units count as sales;
+    otherwise it is taken from stock and counted at once. A
+    coupon whose usage limit ran out meanwhile, or stock that is no longer
+    there, rolls everything back (CheckoutError / InsufficientStock).
+    """
+    lines = quote.lines
+    with transaction.atomic():
+        if quote.coupon is not None:
+            used = Coupon.objects.filter(
+                Q(usage_limit__isnull=True) | Q(used_count__lt=F('usage_limit')), pk=quote.coupon.pk
+            ).update(used_count=F('used_count') + 1)
+            if not used:
+                raise CheckoutError('Coupon is not valid (check dates, status, or usage limit).')
+
+        order = Order.objects.create(
+            user=user,
+            total_amount=quote.total,
+            discount_amount=quote.discount,
+            applied_coupon=quote.coupon,
+            payment_method=payment_method,
+            shipping_address=shipping_address,
+            billing_email=billing_email,
+            razorpay_order_id=razorpay_order_id,
+            status='placed',
+        )
+        OrderItem.objects.bulk_create([
+            OrderItem(
+                order=order,
+                product_id=line.variant.product_id,
+                variant=line.variant,
+                quantity=line.quantity,
+                price=line.unit_price,
+                size=line.variant.size,
+            )
+            for line in lines
+        ])
+        stock_lines = [(line.variant.pk, line.quantity) for line in lines]
+        if hold:
+            # Counted as sales once paid (confirm_reservations)
+            reserve_stock(order, stock_lines)
+        else:
+            take_stock(stock_lines)
+            # bulk_create skips the OrderItem signal that feeds the popularity scores
+            record_sales((line.variant.product_id, line.quantity) for line in lines)
+
+        if clear_cart:
+            # Only the lines that were ordered, in one DELETE; the per-row
+            # CartItem signals would refresh the summary once per line
+            delete_by_pk(CartItem, [line.cart_item_id for line in lines if line.cart_item_id])
+            refresh_cart_summaries(Cart.objects.filter(user=user))
+    return order
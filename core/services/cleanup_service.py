@@ -0,0 +1,131 @@
+# core/services/cleanup_service.py
+"""
+Purge of rows nobody will read again: abandoned carts and spent OTP codes,
+plus the release of expired stock holds.
+
+A cart is abandoned when its owner has been inactive since the cutoff: the
+cart untouched, no sign-in (last_login) and no order placed.
+
+Each purge walks its table along an index ((updated_at, id) for carts,
+(expires_at, id) for OTPs, (status, expires_at, id) for holds) in
+fixed-size batches. Every batch is its own
+short transaction that locks up to batch_size rows (skipping rows another
+transaction holds, where the database can) and deletes those of them that
+still match, so locks are held for one batch at a time, a row touched
+meanwhile survives, and a run can be stopped at any point without leaving
+partial work behind.
+
+run_cleanup() is the entry point for schedulers (cron, Celery beat, ...);
+the cleanup_stale_rows management command wraps it.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.models import OTP, Cart, Order, StockReservation
+from core.services.cart_service import skip_summary_refresh
+
+DEFAULT_BATCH_SIZE = 1000
+
+
+def abandoned_cart_cutoff(now=None):
+    days = getattr(settings, 'ABANDONED_CART_DAYS', 30)
+    return (now or timezone.now()) - timedelta(days=days)
+
+
+def otp_cutoff(now=None):
+    # Codes expire minutes after they are issued; the margin keeps the
+    # newest one around for the resend cooldown check
+    minutes = getattr(settings, 'OTP_RETENTION_MINUTES', 60)
+    return (now or timezone.now()) - timedelta(minutes=minutes)
+
+
+def _purge(name, queryset, delete_batch, batch_size, max_batches, dry_run, progress):
+    """
+    Delete queryset's rows batch by batch, oldest first along its ordering.
+
+    delete_batch(batch) removes one batch and returns the number of rows it
+    removed; batch is queryset narrowed to the locked ids, so its conditions
+    are checked again by the DELETE. progress(name, stats) is called after
+    each batch. Returns the stats dict.
+    """
+    stats = {'rows': 0, 'batches': 0, 'seconds': 0.0, 'dry_run': dry_run}
+    started = time.monotonic()
+    select = queryset
+    if connection.features.has_select_for_update_skip_locked:
+        select = queryset.select_for_update(skip_locked=True)
+    if dry_run:
+        stats['rows'] = queryset.count()
+    else:
+        while max_batches is None or stats['batches'] < max_batches:
+            with transaction.atomic():
+                ids = list(select.values_list('pk', flat=True)[:batch_size])
+                removed = delete_batch(queryset.filter(pk__in=ids).order_by()) if ids else 0
+            if not ids:
+                break
+            stats['rows'] += removed
+            stats['batches'] += 1
+            stats['seconds'] = time.monotonic() - started
+            if progress is not None:
+                progress(name, stats)
+            if len(ids) < batch_size:
+                break
+    stats['seconds'] = time.monotonic() - started
+    stats['rows_per_second'] = stats['rows'] / stats['seconds'] if stats['seconds'] else 0.0
+    return stats
+
+
+def _delete_carts(batch):
+    # The items go with their carts by cascade; their signals would only
+    # recompute the summary of a cart that is being deleted
+    with skip_summary_refresh():
+        return batch.delete()[1].get(Cart._meta.label, 0)
+
+
+def _delete_otps(batch):
+    # Nothing references OTP and it has no delete signals: one DELETE
+    return batch.delete()[1].get(OTP._meta.label, 0)
+
+
+def purge_abandoned_carts(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, dry_run=False, progress=None, now=None):
+    """Delete carts (and their items) of users inactive since abandoned_cart_cutoff()."""
+    cutoff = abandoned_cart_cutoff(now)
+    recent_orders = Order.objects.filter(user=OuterRef('user_id'), created_at__gte=cutoff)
+    queryset = Cart.objects.filter(updated_at__lt=cutoff).exclude(
+        user__last_login__gte=cutoff
+    ).exclude(Exists(recent_orders)).order_by('updated_at', 'id')
+    return _purge('carts', queryset, _delete_carts, batch_size, max_batches, dry_run, progress)
+
+
+def purge_spent_otps(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, dry_run=False, progress=None, now=None):
+    """Delete OTP codes that expired before otp_cutoff(), used or not."""
+    queryset = OTP.objects.filter(expires_at__lt=otp_cutoff(now)).order_by('expires_at', 'id')
+    return _purge('otps', queryset, _delete_otps, batch_size, max_batches, dry_run, progress)
+
+
+def release_expired_holds(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, dry_run=False, progress=None, now=None):
+    """Mark HELD reservations past their expiry RELEASED (they already stopped counting against stock)."""
+    queryset = StockReservation.objects.filter(
+        status=StockReservation.HELD, expires_at__lte=now or timezone.now()
+    ).order_by('expires_at', 'id')
+
+    def release(batch):
+        # batch re-checks status and expiry: a payment may confirm a hold
+        # between the SELECT and this UPDATE, and a confirmed hold must stay confirmed
+        return batch.update(status=StockReservation.RELEASED)
+
+    return _purge('holds', queryset, release, batch_size, max_batches, dry_run, progress)
+
+
+def run_cleanup(batch_size=DEFAULT_BATCH_SIZE, max_batches=None, dry_run=False, progress=None):
+    """Run every purge and return {name: stats}."""
+    now = timezone.now()
+    return {
+        'carts': purge_abandoned_carts(batch_size, max_batches, dry_run, progress, now),
+        'otps': purge_spent_otps(batch_size, max_batches, dry_run, progress, now),
+        'holds': release_expired_holds(batch_size, max_batches, dry_run, progress, now),
+    }
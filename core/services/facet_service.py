@@ -0,0 +1,169 @@
+# core/services/facet_service.py
+import hashlib
+import json
+
+from django.db import transaction
+from django.db.models import Count, Min, Q
+
+from core.models import Product, ProductFacet
+from core.services.catalog_version import get_catalog_version
+
+# ?price= buckets shared by ProductFilter and the sidebar counts
+PRICE_BUCKETS = [
+    ('under_500', 500),
+    ('under_1000', 1000),
+    ('under_2000', 2000),
+]
+
+# Query params that change which products match; everything else (cursor,
+# page_size, ordering, ...) is ignored when building the cache signature.
+FILTER_PARAMS = (
+    'color', 'size', 'material', 'category', 'price',
+    'price_under', 'min_price', 'max_price', 'search', 'in_stock',
+)
+# Matched through normalize_facet_value, any number of values
+MULTI_VALUE_PARAMS = ('color', 'size', 'material')
+# Single-valued params the filters lowercase themselves
+CASE_INSENSITIVE_PARAMS = ('search', 'in_stock')
+
+
+def normalize_facet_value(value):
+    return str(value).strip().lower()
+
+
+def build_product_facets(product, variants):
+    """Return unsaved ProductFacet rows for a product and its variants."""
+    facets = {}
+
+    def add(facet_type, raw_value, in_stock):
+        value = normalize_facet_value(raw_value)
+        if not value:
+            return
+        key = (facet_type, value)
+        if key in facets:
+            facets[key].in_stock = facets[key].in_stock or in_stock
+        else:
+            facets[key] = ProductFacet(
+                product_id=product.id,
+                facet_type=facet_type,
+                value=value[:100],
+                label=str(raw_value).strip()[:100],
+                in_stock=in_stock,
+            )
+
+    any_in_stock = False
+    for variant in variants:
+        in_stock = variant.stock > 0
+        any_in_stock = any_in_stock or in_stock
+        add(ProductFacet.COLOR, variant.color, in_stock)
+        add(ProductFacet.SIZE, variant.size, in_stock)
+
+    for material in product.materials or []:
+        add(ProductFacet.MATERIAL, material, any_in_stock)
+
+    return list(facets.values())
+
+
+def rebuild_product_facets(product_ids):
+    """Recompute the facet rows for the given products (missing products are skipped)."""
+    product_ids = list(product_ids)
+    products = Product.objects.filter(pk__in=product_ids).prefetch_related('variants')
+    rows = []
+    for product in products:
+        rows.extend(build_product_facets(product, product.variants.all()))
+
+    with transaction.atomic():
+        ProductFacet.objects.filter(product_id__in=product_ids).delete()
+        ProductFacet.objects.bulk_create(rows, batch_size=1000)
+
+
+def facet_filter(facet_type, values):
+    """Q matching products that have any of the given facet values (a semi-join, no DISTINCT needed)."""
+    normalized = {normalize_facet_value(v) for v in values if normalize_facet_value(v)}
+    return Q(pk__in=ProductFacet.objects.filter(
+        facet_type=facet_type,
+        value__in=normalized,
+    ).values('product_id'))
+
+
+def facet_counts(product_queryset, in_stock_only=False):
+    """
+    Count products per facet value for the given (already filtered) products.
+
+    Runs a single GROUP BY over the facet table and returns
+    {'color': [{'value': 'black', 'label': 'Black', 'count': 42}, ...], ...}.
+    """
+    facets = ProductFacet.objects.filter(
+        product_id__in=product_queryset.order_by().values('pk')
+    )
+    if in_stock_only:
+        facets = facets.filter(in_stock=True)
+
+    rows = facets.values('facet_type', 'value').annotate(
+        label=Min('label'),
+        count=Count('product_id'),
+    ).order_by('facet_type', '-count', 'value')
+
+    counts = {facet_type: [] for facet_type, _ in ProductFacet.FACET_TYPE_CHOICES}
+    for row in rows:
+        counts[row['facet_type']].append({
+            'value': row['value'],
+            'label': row['label'],
+            'count': row['count'],
+        })
+    return counts
+
+
+def catalog_facets(product_queryset, in_stock_only=False):
+    """
+    Sidebar counts for every color, size, material, category and price bucket.
+
+    One GROUP BY over the facet table plus one GROUP BY over the products
+    (per category, with a conditional count per price bucket).
+    """
+    counts = facet_counts(product_queryset, in_stock_only=in_stock_only)
+
+    bucket_counts = {
+        name: Count('pk', filter=Q(price__lt=limit)) for name, limit in PRICE_BUCKETS
+    }
+    rows = product_queryset.order_by().values('category__slug', 'category__name').annotate(
+        count=Count('pk'),
+        **bucket_counts,
+    ).order_by('-count', 'category__slug')
+
+    counts['category'] = []
+    price_totals = dict.fromkeys(bucket_counts, 0)
+    for row in rows:
+        counts['category'].append({
+            'value': row['category__slug'],
+            'label': row['category__name'],
+            'count': row['count'],
+        })
+        for name in price_totals:
+            price_totals[name] += row[name]
+    counts['price'] = [
+        {'value': name, 'count': price_totals[name]} for name, _ in PRICE_BUCKETS
+    ]
+    return counts
+
+
+def facet_cache_key(query_params):
+    """
+    Cache key for a filter state at the current catalog version. Param order
+    and, for the facet filters, duplicates and case don't matter; category
+    and price are exact matches (the last value wins), so they are kept as is.
+    """
+    signature = {}
+    for param in FILTER_PARAMS:
+        if param in MULTI_VALUE_PARAMS:
+            values = sorted({normalize_facet_value(v) for v in query_params.getlist(param) if v.strip()})
+        else:
+            value = (query_params.get(param) or '').strip()
+            if param in CASE_INSENSITIVE_PARAMS:
+                value = value.lower()
+            values = [value] if value else []
+        if values:
+            signature[param] = values
+    digest = hashlib.md5(json.dumps(signature, sort_keys=True).encode()).hexdigest()
+    # Stock changes bump the version, so sell-outs show up without waiting for the timeout
+    return f'product-facets:{get_catalog_version()}:{digest}'
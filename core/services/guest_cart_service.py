@@ -0,0 +1,126 @@
+# core/services/guest_cart_service.py
+"""
+Guest carts for shoppers who have not signed in yet.
+
+The cart lives entirely in a signed token ("variant:quantity,..." plus a
+timestamp) that the client sends back with every request, so anonymous
+shoppers cost no database writes and no server-side storage. Prices and
+stock are read fresh on each request; the token only holds quantities.
+When VerifyOTPView signs the shopper in, the lines are merged into their
+Cart in one bulk write (see merge_guest_cart).
+"""
+from decimal import Decimal
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core import signing
+
+from core.models import ProductVariant
+from core.queries import first_image_subquery
+from core.services.cart_service import apply_cart_operations, apply_operations, stock_problems
+
+GUEST_CART_MAX_LINES = 50
+_signer = signing.TimestampSigner(salt='core.guest-cart')
+
+
+class InvalidGuestCart(Exception):
+    pass
+
+
+def _max_age():
+    return getattr(settings, 'GUEST_CART_MAX_AGE', 30 * 24 * 3600)
+
+
+def encode_guest_cart(quantities):
+    """Sign {variant_id: quantity}, dropping empty lines."""
+    value = ','.join(f'{variant_id}:{quantity}' for variant_id, quantity in sorted(quantities.items()) if quantity > 0)
+    return _signer.sign(value)
+
+
+def decode_guest_cart(token):
+    """
+    Return {variant_id: quantity} from a token. A missing or expired token is
+    an empty cart; a tampered or malformed one raises InvalidGuestCart.
+    """
+    if not token:
+        return {}
+    try:
+        value = _signer.unsign(token, max_age=_max_age())
+    except signing.SignatureExpired:
+        return {}
+    except signing.BadSignature:
+        raise InvalidGuestCart('Invalid guest cart')
+    quantities = {}
+    try:
+        for line in filter(None, value.split(',')):
+            variant_id, quantity = line.split(':')
+            quantities[int(variant_id)] = int(quantity)
+    except ValueError:
+        raise InvalidGuestCart('Invalid guest cart')
+    return quantities
+
+
+def update_guest_cart(quantities, operations):
+    """
+    Apply cart operations to a guest cart and return (new quantities, problems).
+    Stock is checked against one read of the touched variants; nothing is written.
+    """
+    updated = apply_operations(quantities, operations)
+    touched = {operation['variant_id'] for operation in operations}
+    variants = ProductVariant.objects.filter(pk__in=touched).only('id', 'stock').in_bulk()
+    problems = stock_problems(variants, {variant_id: updated[variant_id] for variant_id in touched})
+    if not problems and sum(1 for quantity in updated.values() if quantity > 0) > GUEST_CART_MAX_LINES:
+        problems = [{'error': f'A guest cart holds at most {GUEST_CART_MAX_LINES} lines'}]
+    if problems:
+        return quantities, problems
+    return {variant_id: quantity for variant_id, quantity in updated.items() if quantity > 0}, []
+
+
+def guest_cart_lines(quantities):
+    """
+    The guest cart in the same line shape as cart_service.cart_lines() (for
+    CartLineSerializer), from one query over the variants. Variants deleted
+    since they were added are left out.
+    """
+    variants = ProductVariant.objects.filter(pk__in=quantities).select_related('product').annotate(
+        thumbnail_path=first_image_subquery('product')
+    ).order_by('id')
+    lines = []
+    for variant in variants:
+        quantity = quantities[variant.id]
+        lines.append(SimpleNamespace(
+            id=None,
+            variant=variant,
+            quantity=quantity,
+            line_total=variant.product.price * quantity,
+            in_stock=variant.stock >= quantity,
+            thumbnail_path=variant.thumbnail_path,
+        ))
+    return lines
+
+
+def guest_cart_summary(lines):
+    return {
+        'item_count': sum(line.quantity for line in lines),
+        'subtotal': sum((line.line_total for line in lines), Decimal('0.00')),
+    }
+
+
+def merge_guest_cart(user, token):
+    """
+    Add the guest cart's lines to the user's cart (quantities summed and
+    capped at stock, unknown variants skipped) with one bulk write. Returns
+    the number of lines merged; an invalid token merges nothing.
+    """
+    try:
+        quantities = decode_guest_cart(token)
+    except InvalidGuestCart:
+        return 0
+    if not quantities:
+        return 0
+    operations = [
+        {'op': 'increment', 'variant_id': variant_id, 'quantity': quantity}
+        for variant_id, quantity in quantities.items()
+    ]
+    apply_cart_operations(user, operations, cap_at_stock=True)
+    return len(operations)
@@ -0,0 +1,58 @@
+# core/services/home_service.py
+"""
+Home page payload, serialized once per catalog version.
+
+The shared payload is cached under the current catalog version (bumped by
+the catalog signals), so editing a product, variant, image or category
+retires it on the next request. The only per-user field, is_wishlisted, is
+overlaid on a shallow copy by the view.
+"""
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+
+from core.models import Category, Product
+from core.serializers import CategorySerializer, ProductSerializer
+from core.services.catalog_version import get_catalog_version
+
+HOME_NEW_ARRIVALS = 10
+
+
+def build_home_payload(request, fields=None, expand=()):
+    categories = Category.objects.all()
+    new_arrivals = ProductSerializer.setup_eager_loading(
+        Product.objects.filter(is_new_drop=True), fields, expand
+    ).order_by('-id')[:HOME_NEW_ARRIVALS]
+    return {
+        'categories': CategorySerializer(categories, many=True).data,
+        'new_arrivals': ProductSerializer(
+            new_arrivals, many=True, context={'request': request}, fields=fields, expand=expand
+        ).data,
+    }
+
+
+def get_home_payload(request, fields=None, expand=()):
+    """
+    Return (catalog version, payload). Image URLs are absolute, so the
+    payload is cached per scheme and host as well as per version and
+    product field selection.
+    """
+    version = get_catalog_version()
+    rendered = ','.join(ProductSerializer.resolve_fields(fields, expand))
+    variant = f"{request.build_absolute_uri('/')}|{rendered}"
+    cache_key = f'home-page:{version}:{hashlib.md5(variant.encode()).hexdigest()[:12]}'
+    payload = cache.get(cache_key)
+    if payload is None:
+        payload = build_home_payload(request, fields, expand)
+        cache.set(cache_key, payload, getattr(settings, 'HOME_PAGE_CACHE_TIMEOUT', 86400))
+    return version, payload
+
+
+def overlay_wishlist(products, wishlisted_ids):
+    """Copy the shared product dicts with this user's is_wishlisted flags."""
+    return [
+        {**product, 'is_wishlisted': product.get('id') in wishlisted_ids}
+        if 'is_wishlisted' in product else product
+        for product in products
+    ]
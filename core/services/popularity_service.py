@@ -0,0 +1,140 @@
+# core/services/popularity_service.py
+"""
+Popularity and trending scores for the catalog sorts.
+
+Trending uses forward decay: a sale at time t adds
+quantity * 2 ** ((t - epoch) / TRENDING_HALF_LIFE), so newer sales
+weigh more and scores can be incremented in place without rewriting every
+row as time passes. Comparing two stored scores gives the same ranking as
+decaying both to "now".
+
+The weight doubles every half-life, so the epoch (the TrendingEpoch row) is
+moved up to the present every TRENDING_REBASE_AFTER, with every score
+rescaled by the same factor; rankings don't change and the floats stay far
+from overflowing (about 1024 half-lives, 19.6 years at 7 days).
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import transaction
+from django.db.models import Case, Exists, F, FloatField, IntegerField, OuterRef, Sum, Value, When
+from django.utils import timezone
+
+from core.models import OrderItem, Product, ProductPopularity, StockReservation, TrendingEpoch
+
+# Starting epoch, used until the first rebase
+TRENDING_EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+TRENDING_HALF_LIFE = timedelta(days=7)
+# Sales older than this contribute less than 2**-8 of a fresh sale to trending
+TRENDING_WINDOW = timedelta(days=56)
+# Weights reach 2**52 before a rebase is due
+TRENDING_REBASE_AFTER = 52 * TRENDING_HALF_LIFE
+
+
+def trending_epoch():
+    return TrendingEpoch.objects.get_or_create(pk=1, defaults={'started_at': TRENDING_EPOCH})[0].started_at
+
+
+def trending_weight(when, epoch):
+    return 2 ** ((when - epoch) / TRENDING_HALF_LIFE)
+
+
+def rebase_trending_scores(now=None, force=False):
+    """
+    Move the trending epoch up to now and rescale every score to match, once
+    the epoch is older than TRENDING_REBASE_AFTER (or always with force).
+    Returns whether it rebased.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        epoch, _ = TrendingEpoch.objects.select_for_update().get_or_create(
+            pk=1, defaults={'started_at': TRENDING_EPOCH}
+        )
+        if not force and now - epoch.started_at < TRENDING_REBASE_AFTER:
+            return False
+        ProductPopularity.objects.update(
+            trending_score=F('trending_score') * Value(1 / trending_weight(now, epoch.started_at))
+        )
+        epoch.started_at = now
+        epoch.save(update_fields=['started_at'])
+    return True
+
+
+def ensure_popularity_rows(product_ids):
+    ProductPopularity.objects.bulk_create(
+        [ProductPopularity(product_id=product_id) for product_id in product_ids],
+        ignore_conflicts=True,
+    )
+
+
+def record_sales(lines, when=None):
+    """
+    Add sold units to the scores in one UPDATE.
+
+    lines: iterable of (product_id, quantity) pairs; duplicates are summed.
+    """
+    quantities = defaultdict(int)
+    for product_id, quantity in lines:
+        quantities[product_id] += quantity
+    if not quantities:
+        return
+
+    weight = trending_weight(when or timezone.now(), trending_epoch())
+    units = Case(
+        *[When(product_id=pid, then=Value(qty)) for pid, qty in quantities.items()],
+        output_field=IntegerField(),
+    )
+    trend = Case(
+        *[When(product_id=pid, then=Value(qty * weight)) for pid, qty in quantities.items()],
+        output_field=FloatField(),
+    )
+    with transaction.atomic():
+        ensure_popularity_rows(quantities)
+        ProductPopularity.objects.filter(product_id__in=quantities).update(
+            units_sold=F('units_sold') + units,
+            trending_score=F('trending_score') + trend,
+            updated_at=timezone.now(),
+        )
+
+
+def sold_order_items():
+    """Order items that count as sales: held (online) orders only once their holds are confirmed."""
+    unconfirmed = StockReservation.objects.filter(order=OuterRef('order_id')).exclude(
+        status=StockReservation.CONFIRMED
+    )
+    return OrderItem.objects.exclude(Exists(unconfirmed))
+
+
+def refresh_product_scores(batch_size=1000):
+    """Recompute every score from OrderItem history (periodic job / repair); rebases the epoch when due."""
+    rebase_trending_scores()
+    epoch = trending_epoch()
+    units = dict(
+        sold_order_items().values('product_id').annotate(total=Sum('quantity'))
+        .values_list('product_id', 'total')
+    )
+
+    trending = defaultdict(float)
+    recent = sold_order_items().filter(
+        order__created_at__gte=timezone.now() - TRENDING_WINDOW
+    ).values_list('product_id', 'quantity', 'order__created_at')
+    for product_id, quantity, created_at in recent.iterator():
+        trending[product_id] += quantity * trending_weight(created_at, epoch)
+
+    product_ids = list(Product.objects.values_list('id', flat=True))
+    ensure_popularity_rows(product_ids)
+
+    now = timezone.now()
+    rows = [
+        ProductPopularity(
+            product_id=product_id,
+            units_sold=units.get(product_id, 0),
+            trending_score=trending.get(product_id, 0.0),
+            updated_at=now,
+        )
+        for product_id in product_ids
+    ]
+    ProductPopularity.objects.bulk_update(
+        rows, ['units_sold', 'trending_score', 'updated_at'], batch_size=batch_size
+    )
+    return len(rows)
@@ -0,0 +1,192 @@
+# core/services/reservation_service.py
+"""
+Stock reservations: checkout holds units for a limited time instead of
+either ignoring stock or decrementing it before payment.
+
+    available to sell = ProductVariant.stock - sum(active HELD quantities)
+
+reserve_stock() creates HELD rows for an order after checking availability
+under a lock on the variants; confirm_reservations() turns them into real
+decrements of ProductVariant.stock on payment, and take_stock() sells
+straight from stock for orders that need no hold (COD, direct orders).
+Decrements are one conditional UPDATE rather than lock-then-check.
+release_reservations() and the expiry sweep hand unconfirmed units back.
+Holds past expires_at stop counting as soon as they expire, so the sweep is
+housekeeping, not a correctness requirement.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Product, ProductVariant, StockReservation
+from core.services.catalog_version import bump_catalog_version
+from core.services.facet_service import rebuild_product_facets
+from core.services.popularity_service import record_sales
+
+
+class InsufficientStock(Exception):
+    """problems: [{'variant_id', 'requested', 'available'}] for every line that does not fit."""
+
+    def __init__(self, problems):
+        super().__init__('Not enough stock')
+        self.problems = problems
+
+
+def reservation_ttl():
+    return timedelta(minutes=getattr(settings, 'STOCK_RESERVATION_TTL_MINUTES', 15))
+
+
+def active_holds(now=None):
+    return StockReservation.objects.filter(status=StockReservation.HELD, expires_at__gt=now or timezone.now())
+
+
+def with_available(queryset, now=None, exclude_order=None):
+    """Annotate a ProductVariant queryset with available = stock - active held units."""
+    holds = active_holds(now).filter(variant=OuterRef('pk'))
+    if exclude_order is not None:
+        holds = holds.exclude(order=exclude_order)
+    held = holds.order_by().values('variant').annotate(total=Sum('quantity')).values('total')
+    return queryset.annotate(available=F('stock') - Coalesce(Subquery(held), Value(0)))
+
+
+def available_to_sell(variant_ids):
+    """{variant_id: available units} from one aggregate over the active-hold index."""
+    rows = with_available(ProductVariant.objects.filter(pk__in=list(variant_ids))).values_list('id', 'available')
+    return {variant_id: max(available, 0) for variant_id, available in rows}
+
+
+def _merge(lines):
+    quantities = defaultdict(int)
+    for variant_id, quantity in lines:
+        quantities[variant_id] += quantity
+    return quantities
+
+
+def reserve_stock(order, lines, ttl=None):
+    """
+    Hold (variant_id, quantity) lines for the order until now + ttl.
+
+    The variants are locked in primary-key order (one query, so concurrent
+    checkouts cannot deadlock) and checked against available-to-sell; either
+    every line is held or InsufficientStock is raised and nothing is.
+    Must run inside the caller's transaction.
+    """
+    quantities = _merge(lines)
+    now = timezone.now()
+    locked = ProductVariant.objects.select_for_update().filter(pk__in=quantities).order_by('pk')
+    available = dict(with_available(locked, now).values_list('id', 'available'))
+    problems = [
+        {'variant_id': variant_id, 'requested': quantity, 'available': max(available.get(variant_id, 0), 0)}
+        for variant_id, quantity in sorted(quantities.items())
+        if available.get(variant_id, 0) < quantity
+    ]
+    if problems:
+        raise InsufficientStock(problems)
+    return StockReservation.objects.bulk_create([
+        StockReservation(variant_id=variant_id, order=order, quantity=quantity, expires_at=now + (ttl or reservation_ttl()))
+        for variant_id, quantity in sorted(quantities.items())
+    ])
+
+
+def confirm_reservations(order):
+    """
+    Take the order's held units off stock and mark the holds CONFIRMED.
+
+    A hold that expired (or was released by the sweep) before confirmation
+    is honoured only if the units are still available; otherwise
+    InsufficientStock is raised and nothing changes. The confirmed units
+    count as sales for the popularity scores from here, not from checkout.
+    Returns the number of units confirmed.
+    """
+    unconfirmed = [StockReservation.HELD, StockReservation.RELEASED]
+    with transaction.atomic():
+        holds = list(
+            StockReservation.objects.filter(order=order, status__in=unconfirmed).values_list(
+                'id', 'variant_id', 'variant__product_id', 'quantity'
+            )
+        )
+        if not holds:
+            return 0
+        quantities = _merge((variant_id, quantity) for _, variant_id, _, quantity in holds)
+        # This order's own holds are excluded so expired and live holds are judged alike
+        decrement_stock(quantities, exclude_order=order)
+        StockReservation.objects.filter(pk__in=[hold[0] for hold in holds]).update(status=StockReservation.CONFIRMED)
+        record_sales((product_id, quantity) for _, _, product_id, quantity in holds)
+    return sum(quantities.values())
+
+
+def take_stock(lines):
+    """Sell (variant_id, quantity) lines straight from available stock, with no hold (COD, direct orders)."""
+    with transaction.atomic():
+        decrement_stock(_merge(lines))
+
+
+class _ShortStock(Exception):
+    pass
+
+
+def decrement_stock(quantities, exclude_order=None):
+    """
+    Subtract {variant_id: units} from ProductVariant.stock in one statement.
+
+        UPDATE ... SET stock = stock - CASE id WHEN v THEN q ... END
+        WHERE id IN (...) AND stock - (other live holds) >= CASE id ... END
+
+    No row is read and locked first, and stock can never go below what is
+    sold or promised. The id list is sorted, so the primary-key index scan
+    takes row locks in the same order in every transaction. If the update
+    matches fewer rows than requested, it is rolled back and
+    InsufficientStock is raised. Also does what the variant signals would
+    have (update() fires none).
+    """
+    if not quantities:
+        return
+    ids = sorted(quantities)
+    requested = Case(
+        *[When(pk=variant_id, then=Value(quantities[variant_id])) for variant_id in ids],
+        output_field=IntegerField(),
+    )
+    holds = active_holds().filter(variant=OuterRef('pk'))
+    if exclude_order is not None:
+        holds = holds.exclude(order=exclude_order)
+    held = holds.order_by().values('variant').annotate(total=Sum('quantity')).values('total')
+    try:
+        with transaction.atomic():
+            updated = ProductVariant.objects.filter(
+                pk__in=ids, stock__gte=requested + Coalesce(Subquery(held), Value(0))
+            ).update(stock=F('stock') - requested)
+            if updated != len(ids):
+                raise _ShortStock
+    except _ShortStock:
+        available = available_to_sell(ids)
+        problems = [
+            {'variant_id': variant_id, 'requested': quantities[variant_id], 'available': available.get(variant_id, 0)}
+            for variant_id in ids
+        ]
+        # A unit freed since the UPDATE can make every line look fine; report them all then
+        raise InsufficientStock([p for p in problems if p['available'] < p['requested']] or problems)
+    stock_changed(ids)
+
+
+def stock_changed(variant_ids):
+    """Refresh what depends on variant stock after a bulk update: validators, facets, catalog version."""
+    rows = ProductVariant.objects.filter(pk__in=variant_ids).values_list('product_id', 'stock')
+    product_ids = {product_id for product_id, _ in rows}
+    # Only a variant running out flips a facet's in-stock flag
+    sold_out = {product_id for product_id, stock in rows if stock == 0}
+    Product.objects.filter(pk__in=product_ids).update(updated_at=timezone.now())
+    if sold_out:
+        transaction.on_commit(lambda: rebuild_product_facets(sold_out))
+    transaction.on_commit(bump_catalog_version)
+
+
+def release_reservations(order):
+    """Hand back the order's unconfirmed holds; returns the number of holds released."""
+    return StockReservation.objects.filter(order=order, status=StockReservation.HELD).update(
+        status=StockReservation.RELEASED
+    )
@@ -0,0 +1,121 @@
+# core/services/search_service.py
+"""
+Full-text product search.
+
+ProductSearchDocument holds one row of searchable text per product and is
+kept current from model signals. The index on top of it depends on the
+database vendor (created by migration 0006, which also holds the DDL):
+
+* SQLite: an external-content FTS5 table kept in sync by triggers, ranked with
+  bm25(). Only the SEARCH_CANDIDATES best matches are returned.
+* PostgreSQL: a generated, GIN-indexed tsvector column, ranked with ts_rank().
+* Anything else: falls back to icontains over the document table.
+
+Every query term is treated as a prefix, so the same index serves the
+search results page and autocomplete.
+"""
+import json
+import re
+
+from django.db import connection
+from django.db.models import CharField, FloatField, Func, OuterRef, Q, Subquery, Value
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast, Concat
+
+from core.models import Product, ProductSearchDocument
+
+FTS_TABLE = 'core_product_fts'
+DOCUMENT_TABLE = ProductSearchDocument._meta.db_table
+
+# Most matches a SQLite search returns. bm25() scores every match either
+# way; cutting the ranked set keeps the join and sort on the products small.
+SEARCH_CANDIDATES = 500
+
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def tokenize(query):
+    return _TOKEN_RE.findall((query or '').lower())
+
+
+def build_search_document(product, variants):
+    """Return an unsaved ProductSearchDocument for a product and its variants."""
+    colors = []
+    for variant in variants:
+        if variant.color and variant.color not in colors:
+            colors.append(variant.color)
+    parts = [product.description, product.category.name]
+    parts.extend(str(material) for material in product.materials or [])
+    parts.extend(colors)
+    return ProductSearchDocument(
+        product_id=product.id,
+        name=product.name,
+        body=' '.join(part for part in parts if part),
+    )
+
+
+def refresh_search_documents(product_ids):
+    """Upsert the search documents of the given products (missing products are skipped)."""
+    products = Product.objects.filter(pk__in=list(product_ids)).select_related(
+        'category'
+    ).prefetch_related('variants')
+    documents = [build_search_document(p, p.variants.all()) for p in products]
+    ProductSearchDocument.objects.bulk_create(
+        documents,
+        batch_size=500,
+        update_conflicts=True,
+        unique_fields=['product'],
+        update_fields=['name', 'body'],
+    )
+
+
+def search_products(queryset, query):
+    """
+    Restrict a Product queryset to matches for `query` and annotate
+    `search_rank` (higher is better). Blank queries return the queryset as is.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return queryset
+
+    if connection.vendor == 'sqlite':
+        # bm25() only works in the query that runs the MATCH, so the best
+        # matches are ranked here and the queryset filtered to their ids.
+        # Both survive the queryset being used as a subquery.
+        match = ' '.join(f'"{token}"*' for token in tokens)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, -bm25({FTS_TABLE}, 10.0, 1.0) AS score FROM {FTS_TABLE} "
+                f"WHERE {FTS_TABLE} MATCH %s ORDER BY score DESC, rowid LIMIT %s",
+                [match, SEARCH_CANDIDATES],
+            )
+            ranks = dict(cursor.fetchall())
+        rank = Func(
+            Value(json.dumps({str(pk): score for pk, score in ranks.items()})),
+            Concat(Value('$."'), Cast('pk', CharField()), Value('"')),
+            function='json_extract',
+            output_field=FloatField(),
+        )
+        return queryset.filter(pk__in=list(ranks)).annotate(search_rank=rank)
+    if connection.vendor == 'postgresql':
+        tsquery = ' & '.join(f'{token}:*' for token in tokens)
+        matches = RawSQL(
+            f"SELECT product_id FROM {DOCUMENT_TABLE} "
+            f"WHERE search_vector @@ to_tsquery('simple', %s)",
+            [tsquery],
+        )
+        rank = Subquery(
+            ProductSearchDocument.objects.filter(product=OuterRef('pk')).annotate(
+                rank=RawSQL("ts_rank(search_vector, to_tsquery('simple', %s))", [tsquery], output_field=FloatField())
+            ).values('rank')[:1],
+            output_field=FloatField(),
+        )
+    else:
+        condition = Q()
+        for token in tokens:
+            condition &= Q(name__icontains=token) | Q(body__icontains=token)
+        matches = ProductSearchDocument.objects.filter(condition).values('product_id')
+        rank = RawSQL('0.0', [], output_field=FloatField())
+
+    return queryset.filter(pk__in=matches).annotate(search_rank=rank)
+
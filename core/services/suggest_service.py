@@ -0,0 +1,87 @@
+# core/services/suggest_service.py
+"""
+Search-box autocomplete served from memory.
+
+Product names, category names and materials are loaded into a RadixTrie
+once per catalog version. Requests only read the shared catalog version
+from the cache (at most once every SUGGEST_VERSION_CHECK_INTERVAL seconds)
+and walk the trie, so typing never reaches the database.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from core.models import Category, Product, ProductFacet
+from core.services.catalog_version import get_catalog_version
+from core.services.facet_service import normalize_facet_value
+from core.utils.trie import RadixTrie
+
+SUGGEST_TOP_K = 10
+
+_lock = threading.Lock()
+_state = {'version': None, 'trie': None, 'checked_at': 0.0}
+
+
+def _keys(text):
+    """The full phrase plus every word-start suffix, so 'hoo' matches 'Graphic Hoodie'."""
+    words = normalize_facet_value(text).split()
+    return {' '.join(words[i:]) for i in range(len(words))}
+
+
+def build_suggestion_trie():
+    trie = RadixTrie(top_k=SUGGEST_TOP_K)
+
+    products = Product.objects.values_list('id', 'name', 'popularity__units_sold')
+    for product_id, name, units_sold in products:
+        for key in _keys(name):
+            trie.insert(key, ('product', name, product_id), units_sold or 0)
+
+    categories = Category.objects.annotate(product_count=Count('product')).values_list(
+        'name', 'slug', 'product_count'
+    )
+    for name, slug, product_count in categories:
+        for key in _keys(name):
+            trie.insert(key, ('category', name, slug), product_count)
+
+    materials = ProductFacet.objects.filter(facet_type=ProductFacet.MATERIAL).values(
+        'value'
+    ).annotate(product_count=Count('product_id')).values_list('value', 'product_count')
+    for value, product_count in materials:
+        for key in _keys(value):
+            trie.insert(key, ('material', value, value), product_count)
+
+    return trie.finalize()
+
+
+def get_suggestion_trie():
+    """Return the trie for the current catalog version, rebuilding it if the catalog changed."""
+    now = time.monotonic()
+    interval = getattr(settings, 'SUGGEST_VERSION_CHECK_INTERVAL', 1.0)
+    if _state['trie'] is not None and now - _state['checked_at'] < interval:
+        return _state['trie']
+
+    version = get_catalog_version()
+    if _state['trie'] is None or _state['version'] != version:
+        with _lock:
+            # Another thread may have rebuilt it while we waited
+            if _state['trie'] is None or _state['version'] != version:
+                _state['trie'] = build_suggestion_trie()
+                _state['version'] = version
+    _state['checked_at'] = now
+    return _state['trie']
+
+
+def suggest(query, limit=SUGGEST_TOP_K):
+    prefix = ' '.join(normalize_facet_value(query).split())
+    if not prefix:
+        return []
+    return [
+        {'type': kind, 'text': text, 'value': value}
+        for kind, text, value in get_suggestion_trie().complete(prefix, limit)
+    ]
+
+
+def reset_suggestion_trie():
+    _state.update(version=None, trie=None, checked_at=0.0)
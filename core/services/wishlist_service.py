@@ -0,0 +1,246 @@
+# core/services/wishlist_service.py
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from core.models import Product, Wishlist, WishlistItem
+
+_REQUEST_CACHE_ATTR = '_wishlisted_product_ids'
+
+
+def _membership_key(user_id):
+    return f'wishlist:members:{user_id}'
+
+
+def get_wishlist_membership(user_id):
+    """
+    Sorted array of the product IDs in a user's wishlist.
+
+    Cached per user and dropped whenever the wishlist is written (see
+    invalidate_wishlist_membership), so membership checks are one cache
+    read; the database is only queried after a change or expiry.
+    """
+    key = _membership_key(user_id)
+    members = cache.get(key)
+    if members is None:
+        members = array('q', sorted(
+            WishlistItem.objects.filter(wishlist__user_id=user_id).values_list('product_id', flat=True)
+        ))
+        cache.set(key, members, getattr(settings, 'WISHLIST_MEMBERSHIP_CACHE_TIMEOUT', 86400))
+    return members
+
+
+def invalidate_wishlist_membership(user_id):
+    """
+    Drop the cached membership. WishlistItem signals call this for ORM
+    writes; bulk or raw SQL writes must call it themselves.
+    """
+    key = _membership_key(user_id)
+    cache.delete(key)
+    # Again after commit, in case a concurrent reader re-cached the old rows
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def contains(members, product_id):
+    index = bisect_left(members, product_id)
+    return index < len(members) and members[index] == product_id
+
+
+def normalize_product_id(value):
+    """Product IDs arrive as ints or numeric strings; anything else matches nothing."""
+    try:
+        return int(str(value).strip())
+    except (TypeError, ValueError):
+        return None
+
+
+def check_wishlisted(user_id, product_ids):
+    """Return {str(requested id): bool} for the given IDs from the cached membership."""
+    members = get_wishlist_membership(user_id)
+    result = {}
+    for raw_id in product_ids:
+        product_id = normalize_product_id(raw_id)
+        result[str(raw_id)] = product_id is not None and contains(members, product_id)
+    return result
+
+
+def get_wishlisted_product_ids(request):
+    """
+    Return the set of product IDs in the current user's wishlist.
+
+    The set is built from the cached membership the first time it is needed
+    and stored on the request, so every serializer rendering the same
+    response (list, detail, nested order/wishlist items) shares one lookup.
+    """
+    # Admin principals (extreme_admin) are authenticated but own no wishlist
+    if request is None or not isinstance(request.user, get_user_model()):
+        return frozenset()
+
+    # DRF wraps the Django request; store on the underlying HttpRequest so
+    # both objects see the same cached set.
+    http_request = getattr(request, '_request', request)
+    product_ids = getattr(http_request, _REQUEST_CACHE_ATTR, None)
+    if product_ids is None:
+        product_ids = frozenset(get_wishlist_membership(request.user.id))
+        setattr(http_request, _REQUEST_CACHE_ATTR, product_ids)
+    return product_ids
+
+
+def adjust_item_count(wishlist_id, delta):
+    """Move the denormalized Wishlist.item_count by delta in one UPDATE."""
+    Wishlist.objects.filter(pk=wishlist_id).update(
+        item_count=Greatest(F('item_count') + delta, Value(0)),
+        updated_at=timezone.now(),
+    )
+
+
+def refresh_wishlists(wishlist_ids):
+    """Recount item_count from WishlistItem and drop the cached memberships (bulk/m2m writes)."""
+    wishlist_ids = list(wishlist_ids)
+    counts = WishlistItem.objects.filter(wishlist=OuterRef('pk')).order_by().values(
+        'wishlist'
+    ).annotate(total=Count('pk')).values('total')
+    wishlists = Wishlist.objects.filter(pk__in=wishlist_ids)
+    wishlists.update(item_count=Coalesce(Subquery(counts), Value(0)), updated_at=timezone.now())
+    for user_id in wishlists.values_list('user_id', flat=True):
+        invalidate_wishlist_membership(user_id)
+
+
+WISHLIST_TABLE = Wishlist._meta.db_table
+ITEM_TABLE = WishlistItem._meta.db_table
+PRODUCT_TABLE = Product._meta.db_table
+
+# SQLite runs one writer at a time and takes the write lock before the
+# UPDATE reads anything, so flipping the counter and reading the current
+# membership in one statement is race-free; the item row follows in the
+# same transaction.
+_SQLITE_FLIP = f"""
+    UPDATE {WISHLIST_TABLE}
+    SET item_count = MAX(item_count + CASE WHEN EXISTS (
+            SELECT 1 FROM {ITEM_TABLE} i WHERE i.wishlist_id = {WISHLIST_TABLE}.id AND i.product_id = %(product)s
+        ) THEN -1 ELSE 1 END, 0),
+        updated_at = %(now)s
+    WHERE user_id = %(user)s AND EXISTS (SELECT 1 FROM {PRODUCT_TABLE} WHERE id = %(product)s)
+    RETURNING id, item_count, EXISTS (
+        SELECT 1 FROM {ITEM_TABLE} i WHERE i.wishlist_id = {WISHLIST_TABLE}.id AND i.product_id = %(product)s
+    ), (SELECT name FROM {PRODUCT_TABLE} WHERE id = %(product)s)
+"""
+
+# PostgreSQL: each statement deletes or inserts the item and moves the
+# counter of the (row-locked) wishlist in one data-modifying CTE.
+_POSTGRES_REMOVE = f"""
+    WITH removed AS (
+        DELETE FROM {ITEM_TABLE}
+        WHERE product_id = %(product)s
+          AND wishlist_id = (SELECT id FROM {WISHLIST_TABLE} WHERE user_id = %(user)s)
+        RETURNING wishlist_id
+    )
+    UPDATE {WISHLIST_TABLE} w
+    SET item_count = GREATEST(w.item_count - 1, 0), updated_at = %(now)s
+    FROM removed WHERE w.id = removed.wishlist_id
+    RETURNING w.item_count, (SELECT name FROM {PRODUCT_TABLE} WHERE id = %(product)s)
+"""
+_POSTGRES_ADD = f"""
+    WITH added AS (
+        INSERT INTO {ITEM_TABLE} (wishlist_id, product_id, added_at)
+        SELECT w.id, p.id, %(now)s FROM {WISHLIST_TABLE} w, {PRODUCT_TABLE} p
+        WHERE w.user_id = %(user)s AND p.id = %(product)s
+        ON CONFLICT (wishlist_id, product_id) DO NOTHING
+        RETURNING wishlist_id
+    )
+    UPDATE {WISHLIST_TABLE} w
+    SET item_count = w.item_count + 1, updated_at = %(now)s
+    FROM added WHERE w.id = added.wishlist_id
+    RETURNING w.item_count, (SELECT name FROM {PRODUCT_TABLE} WHERE id = %(product)s)
+"""
+
+
+def toggle_wishlist_item(user, product_id):
+    """
+    Add the product to the user's wishlist if it is missing, remove it otherwise.
+
+    Returns (in_wishlist, item_count, product_name) and raises
+    Product.DoesNotExist for unknown products. Runs at most two SQL
+    statements on SQLite and PostgreSQL (plus one-off wishlist creation),
+    and concurrent toggles of the same pair never raise IntegrityError.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    params = {'user': user.pk, 'product': product_id, 'now': now}
+    for attempt in range(2):
+        if connection.vendor == 'sqlite':
+            result = _toggle_sqlite(params)
+        elif connection.vendor == 'postgresql':
+            result = _toggle_postgres(params)
+        else:
+            result = _toggle_orm(user, product_id)
+        if result is not None:
+            invalidate_wishlist_membership(user.pk)
+            return result
+
+        # Nothing matched: either the product is unknown or this is the
+        # user's first wishlist write
+        if not Product.objects.filter(pk=product_id).exists():
+            raise Product.DoesNotExist(f'Product {product_id} does not exist')
+        Wishlist.objects.get_or_create(user=user)
+    raise RuntimeError('Wishlist toggle did not apply')
+
+
+def _toggle_sqlite(params):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_SQLITE_FLIP, params)
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        wishlist_id, item_count, was_present, product_name = row
+        if was_present:
+            cursor.execute(
+                f"DELETE FROM {ITEM_TABLE} WHERE wishlist_id = %s AND product_id = %s",
+                [wishlist_id, params['product']],
+            )
+        else:
+            cursor.execute(
+                f"INSERT INTO {ITEM_TABLE} (wishlist_id, product_id, added_at) VALUES (%s, %s, %s) "
+                f"ON CONFLICT (wishlist_id, product_id) DO NOTHING",
+                [wishlist_id, params['product'], params['now']],
+            )
+    return not was_present, item_count, product_name
+
+
+def _toggle_postgres(params):
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(_POSTGRES_REMOVE, params)
+        row = cursor.fetchone()
+        if row is not None:
+            return False, row[0], row[1]
+        cursor.execute(_POSTGRES_ADD, params)
+        row = cursor.fetchone()
+        if row is not None:
+            return True, row[0], row[1]
+    # A concurrent request added the same item between our two statements
+    state = Wishlist.objects.filter(user_id=params['user']).values_list('item_count', flat=True).first()
+    if state is None or not WishlistItem.objects.filter(
+        wishlist__user_id=params['user'], product_id=params['product']
+    ).exists():
+        return None
+    return True, state, Product.objects.values_list('name', flat=True).get(pk=params['product'])
+
+
+def _toggle_orm(user, product_id):
+    with transaction.atomic():
+        wishlist = Wishlist.objects.select_for_update().filter(user=user).first()
+        product = Product.objects.filter(pk=product_id).only('name').first()
+        if wishlist is None or product is None:
+            return None
+        deleted, _ = WishlistItem.objects.filter(wishlist=wishlist, product=product).delete()
+        if not deleted:
+            WishlistItem.objects.create(wishlist=wishlist, product=product)
+        # The WishlistItem signals kept item_count current
+        wishlist.refresh_from_db(fields=['item_count'])
+        return not deleted, wishlist.item_count, product.name
@@ -0,0 +1,135 @@
+# core/signals.py
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Cart, CartItem, Category, OrderItem, Product, ProductImage, ProductVariant, Wishlist, WishlistItem
+from .services.cart_service import refresh_cart_summaries, summary_refresh_skipped
+from .services.catalog_version import bump_catalog_version
+from .services.facet_service import rebuild_product_facets
+from .services.popularity_service import ensure_popularity_rows, record_sales
+from .services.search_service import refresh_search_documents
+from .services.wishlist_service import adjust_item_count, invalidate_wishlist_membership, refresh_wishlists
+
+
+def _refresh_derived_rows(product_ids):
+    rebuild_product_facets(product_ids)
+    refresh_search_documents(product_ids)
+
+
+def _schedule_catalog_refresh(product_id):
+    # Run after commit: during a cascade delete the product row is still
+    # present when variant signals fire, and rebuilding then would insert
+    # rows that point at a product about to disappear.
+    transaction.on_commit(lambda: _refresh_derived_rows([product_id]))
+    _schedule_version_bump()
+
+
+def _schedule_version_bump():
+    # After commit, so a reader that sees the new version also sees the new rows
+    transaction.on_commit(bump_catalog_version)
+
+
+@receiver(post_save, sender=Product)
+def product_saved(sender, instance, created, update_fields, **kwargs):
+    _schedule_catalog_refresh(instance.pk)
+    if created:
+        # Every product gets a score row so the popular/trending sorts never see NULLs
+        ensure_popularity_rows([instance.pk])
+    elif update_fields is None or 'price' in update_fields:
+        # Cart subtotals are priced at the current product price
+        refresh_cart_summaries(Cart.objects.filter(items__variant__product=instance), touch=False)
+
+
+@receiver(post_delete, sender=Product)
+def product_deleted(sender, instance, **kwargs):
+    _schedule_version_bump()
+
+
+def _touch_product(product_id):
+    # Variants and images are part of the serialized product, so they move
+    # its updated_at (the conditional-GET validator). update() fires no signals.
+    Product.objects.filter(pk=product_id).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=ProductVariant)
+@receiver(post_delete, sender=ProductVariant)
+def variant_changed(sender, instance, **kwargs):
+    _touch_product(instance.product_id)
+    _schedule_catalog_refresh(instance.product_id)
+
+
+@receiver(post_save, sender=ProductImage)
+@receiver(post_delete, sender=ProductImage)
+def image_changed(sender, instance, **kwargs):
+    _touch_product(instance.product_id)
+    _schedule_version_bump()
+
+
+@receiver(post_delete, sender=Category)
+def category_deleted(sender, instance, **kwargs):
+    _schedule_version_bump()
+
+
+@receiver(post_save, sender=Category)
+def category_saved(sender, instance, created, **kwargs):
+    _schedule_version_bump()
+    if not created:
+        # The category name is part of every product's search document
+        product_ids = list(instance.product_set.values_list('id', flat=True))
+        transaction.on_commit(lambda: refresh_search_documents(product_ids))
+
+
+@receiver(post_save, sender=OrderItem)
+def order_item_created(sender, instance, created, **kwargs):
+    if created:
+        record_sales([(instance.product_id, instance.quantity)])
+
+
+@receiver(post_save, sender=CartItem)
+@receiver(post_delete, sender=CartItem)
+def cart_item_changed(sender, instance, **kwargs):
+    if not summary_refresh_skipped():
+        refresh_cart_summaries([instance.cart_id])
+
+
+def _invalidate_wishlist_owner(item):
+    if WishlistItem.wishlist.is_cached(item):
+        user_id = item.wishlist.user_id
+    else:
+        user_id = Wishlist.objects.filter(pk=item.wishlist_id).values_list('user_id', flat=True).first()
+    if user_id is not None:
+        invalidate_wishlist_membership(user_id)
+
+
+@receiver(post_save, sender=WishlistItem)
+def wishlist_item_saved(sender, instance, created, **kwargs):
+    if created:
+        adjust_item_count(instance.wishlist_id, 1)
+    _invalidate_wishlist_owner(instance)
+
+
+@receiver(post_delete, sender=WishlistItem)
+def wishlist_item_deleted(sender, instance, **kwargs):
+    adjust_item_count(instance.wishlist_id, -1)
+    _invalidate_wishlist_owner(instance)
+
+
+@receiver(m2m_changed, sender=Wishlist.products.through)
+def wishlist_products_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    # wishlist.products.add()/remove()/clear() write WishlistItem rows in
+    # bulk without post_save/post_delete, so recount the affected wishlists.
+    if reverse and action == 'pre_clear':
+        instance._cleared_wishlist_ids = list(
+            WishlistItem.objects.filter(product=instance).values_list('wishlist_id', flat=True)
+        )
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        wishlist_ids = [instance.pk]
+    elif action == 'post_clear':
+        wishlist_ids = getattr(instance, '_cleared_wishlist_ids', [])
+    else:
+        wishlist_ids = pk_set or []
+    refresh_wishlists(wishlist_ids)
@@ -1,3 +1,1772 @@
-from django.test import TestCase
+import base64
+import hashlib
+import hmac
+import json
+import math
+import os
+import threading
+import time
+import unittest
+from datetime import timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from decouple import config
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import F, Sum
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+from rest_framework_simplejwt.tokens import AccessToken
+
+from extreme_admin.models import Admin
+
+from .models import (
+    FAQ, OTP, Cart, CartItem, Category, Coupon, CustomUser, Order, OrderItem, Payment, Product, ProductImage,
+    ProductPopularity, ProductVariant, StockReservation, Wishlist, WishlistItem,
+)
+from rest_framework.renderers import JSONRenderer
+
+from .fast_serializers import ReadPlan
+from .serializers import OrderSerializer, ProductSerializer, WishlistSerializer
+from .services.cart_service import StockLimitReached, add_to_cart
+from .services.catalog_version import bump_catalog_version
+from .services.cleanup_service import purge_abandoned_carts, purge_spent_otps, release_expired_holds, run_cleanup
+from .services.facet_service import facet_counts, rebuild_product_facets
+from .services.reservation_service import available_to_sell
+from .services.search_service import refresh_search_documents, search_products
+from .services.suggest_service import reset_suggestion_trie
+from .services.wishlist_service import toggle_wishlist_item
+from .utils.trie import RadixTrie
+from .services.popularity_service import (
+    TRENDING_EPOCH, ensure_popularity_rows, rebase_trending_scores, record_sales, refresh_product_scores,
+    trending_epoch,
+)
+
+RUN_BENCHMARKS = bool(os.environ.get('RUN_BENCHMARKS'))
+
+COLORS = ['Black', 'White', 'Blue']
+SIZES = ['S', 'M', 'L', 'XL']
+
+
+def create_products(category, count, start=0):
+    return [
+        Product.objects.create(
+            name=f"Product {start + i}",
+            price=Decimal('499.00'),
+            category=category,
+        )
+        for i in range(count)
+    ]
+
+
+def seed_catalog(category, products, variants_per_product=6, images_per_product=4):
+    """Bulk-insert a catalog of the given shape and return the product IDs."""
+    Product.objects.bulk_create(
+        Product(
+            name=f"Seed {i}",
+            price=Decimal(300 + i % 2000),
+            category=category,
+            materials=['cotton'] if i % 2 else ['polyester'],
+        )
+        for i in range(products)
+    )
+    product_ids = list(Product.objects.filter(category=category).values_list('id', flat=True))
+    ProductVariant.objects.bulk_create(
+        ProductVariant(
+            product_id=product_id,
+            color=COLORS[v % len(COLORS)],
+            size=SIZES[v % len(SIZES)],
+            stock=10,
+        )
+        for product_id in product_ids
+        for v in range(variants_per_product)
+    )
+    ProductImage.objects.bulk_create(
+        ProductImage(product_id=product_id, image=f"products/{product_id}_{n}.jpg")
+        for product_id in product_ids
+        for n in range(images_per_product)
+    )
+    # bulk_create skips model signals, so build the derived rows explicitly
+    rebuild_product_facets(product_ids)
+    ensure_popularity_rows(product_ids)
+    refresh_search_documents(product_ids)
+    return product_ids
+
+
+class WishlistMembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        self.wishlist = Wishlist.objects.create(user=self.user)
+
+    def _serialize(self, products):
+        cache.clear()  # Count the membership load on every call
+        request = RequestFactory().get('/api/products/')
+        request.user = self.user
+        queryset = Product.objects.filter(
+            id__in=[p.id for p in products]
+        ).select_related('category').prefetch_related('variants', 'images')
+        with CaptureQueriesContext(connection) as ctx:
+            data = ProductSerializer(queryset, many=True, context={'request': request}).data
+        return data, len(ctx.captured_queries)
+
+    def test_is_wishlisted_reflects_wishlist(self):
+        products = create_products(self.category, 3)
+        WishlistItem.objects.create(wishlist=self.wishlist, product=products[1])
+
+        data, _ = self._serialize(products)
+
+        flags = {row['id']: row['is_wishlisted'] for row in data}
+        self.assertEqual(flags, {products[0].id: False, products[1].id: True, products[2].id: False})
+
+    def test_admin_with_a_shoppers_id_sees_no_flags(self):
+        product = create_products(self.category, 1)[0]
+        WishlistItem.objects.create(wishlist=self.wishlist, product=product)
+        admin = Admin.objects.create(id=self.user.id, email='admin@example.com', role='admin')
+        token = AccessToken.for_user(admin)
+
+        response = self.client.get('/api/extreme-admin/products/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['is_wishlisted'] for row in response.data], [False])
+
+    def test_query_count_does_not_grow_with_page_size(self):
+        small = create_products(self.category, 5)
+        large = small + create_products(self.category, 45, start=5)
+        WishlistItem.objects.create(wishlist=self.wishlist, product=small[0])
+
+        _, small_queries = self._serialize(small)
+        _, large_queries = self._serialize(large)
+
+        self.assertEqual(small_queries, large_queries)
+
+
+class WishlistCheckTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        self.products = create_products(self.category, 4)
+
+    def _check(self, product_ids):
+        response = self.client.post(
+            '/api/list/check/', {'product_ids': product_ids}, content_type='application/json', **self.auth
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_string_and_int_ids_match(self):
+        first, second = self.products[0].id, self.products[1].id
+        self.client.post('/api/list/toggle/', {'product_id': first}, **self.auth)
+        self.assertEqual(self._check([first, str(first), f' {first}', second, 'abc']), {
+            str(first): True, f' {first}': True, str(second): False, 'abc': False,
+        })
+
+    def test_checks_are_served_from_cache_and_follow_writes(self):
+        ids = list(range(1, 501))
+        self._check(ids)
+        # Only the token lookup touches the database
+        with self.assertNumQueries(1):
+            result = self._check(ids)
+        self.assertFalse(any(result.values()))
+
+        target = self.products[2].id
+        self.client.post('/api/wishlist/', {'product_id': target}, **self.auth)
+        self.assertTrue(self._check([target])[str(target)])
+        self.client.delete(f'/api/wishlist/{target}/', **self.auth)
+        self.assertFalse(self._check([target])[str(target)])
+
+
+class WishlistCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        self.products = create_products(self.category, 4)
+
+    def _count(self):
+        wishlist = Wishlist.objects.get(user=self.user)
+        self.assertEqual(wishlist.item_count, wishlist.items.count())
+        return wishlist.item_count
+
+    def test_counter_follows_every_write_path(self):
+        self.client.post('/api/wishlist/', {'product_id': self.products[0].id}, **self.auth)
+        self.client.post('/api/wishlist/', {'product_id': self.products[0].id}, **self.auth)
+        self.client.post('/api/list/toggle/', {'product_id': self.products[1].id}, **self.auth)
+        self.assertEqual(self._count(), 2)
+
+        wishlist = Wishlist.objects.get(user=self.user)
+        wishlist.products.add(self.products[2], self.products[3])
+        self.assertEqual(self._count(), 4)
+        wishlist.products.remove(self.products[3])
+        self.products[2].wishlisted_by.clear()
+        self.assertEqual(self._count(), 2)
+
+        self.client.delete(f'/api/wishlist/{self.products[0].id}/', **self.auth)
+        self.products[1].delete()
+        self.assertEqual(self._count(), 0)
+        self.assertEqual(list(wishlist.products.all()), [])
+
+    def test_serializer_reads_the_counter(self):
+        self.client.post('/api/wishlist/', {'product_id': self.products[0].id}, **self.auth)
+        wishlist = Wishlist.objects.get(user=self.user)
+        with CaptureQueriesContext(connection) as ctx:
+            data = WishlistSerializer(wishlist).data
+        self.assertEqual(data['total_items'], 1)
+        self.assertFalse(any('COUNT(' in query['sql'] for query in ctx.captured_queries))
+
+
+def data_statements(captured):
+    """Captured queries minus transaction control (BEGIN/SAVEPOINT/RELEASE...)"""
+    control = ('BEGIN', 'COMMIT', 'ROLLBACK', 'SAVEPOINT', 'RELEASE')
+    return [q['sql'] for q in captured if not q['sql'].lstrip().upper().startswith(control)]
+
+
+class WishlistToggleTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        self.products = create_products(self.category, 2)
+
+    def _toggle(self, product_id):
+        return self.client.post('/api/list/toggle/', {'product_id': product_id}, **self.auth)
+
+    def test_toggle_returns_state_and_count(self):
+        first, second = self.products
+        response = self._toggle(first.id)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data, {
+            'message': f'{first.name} added to wishlist', 'in_wishlist': True, 'total_items': 1,
+        })
+        self.assertEqual(self._toggle(str(second.id)).data['total_items'], 2)
+
+        response = self._toggle(first.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['in_wishlist'], response.data['total_items']), (False, 1))
+        self.assertEqual(list(Wishlist.objects.get(user=self.user).products.all()), [second])
+
+        self.assertEqual(self._toggle(999999).status_code, 404)
+        self.assertEqual(self._toggle('abc').status_code, 404)
+
+    def test_toggle_runs_at_most_two_statements(self):
+        toggle_wishlist_item(self.user, self.products[0].id)  # Creates the wishlist
+        for expected_state in (False, True, False):
+            with CaptureQueriesContext(connection) as ctx:
+                in_wishlist, count, _ = toggle_wishlist_item(self.user, self.products[0].id)
+            self.assertEqual(in_wishlist, expected_state)
+            self.assertEqual(count, int(expected_state))
+            self.assertLessEqual(len(data_statements(ctx.captured_queries)), 2)
+
+    def test_toggle_keeps_membership_cache_current(self):
+        product_id = self.products[0].id
+        check = lambda: self.client.post(
+            '/api/list/check/', {'product_ids': [product_id]}, content_type='application/json', **self.auth
+        ).data[str(product_id)]
+        self.assertFalse(check())
+        self._toggle(product_id)
+        self.assertTrue(check())
+        self._toggle(product_id)
+        self.assertFalse(check())
+
+
+requires_concurrent_writes = unittest.skipIf(
+    connection.vendor == 'sqlite' and connection.settings_dict['TEST'].get('NAME') in (None, '', ':memory:'),
+    'needs a database that accepts concurrent writers (PostgreSQL or file-backed SQLite)',
+)
+
+
+def run_in_threads(count, work):
+    """Start count threads together, run work(index) in each and return the exceptions raised."""
+    errors = []
+    barrier = threading.Barrier(count)
+
+    def worker(index):
+        try:
+            barrier.wait()
+            work(index)
+        except Exception as exc:  # Collected and asserted on by the caller
+            errors.append(exc)
+        finally:
+            connections.close_all()
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+@requires_concurrent_writes
+class WishlistToggleConcurrencyTests(TransactionTestCase):
+    THREADS = 16
+    TOGGLES_PER_THREAD = 10
+
+    def test_parallel_toggles_of_one_pair(self):
+        user = CustomUser.objects.create(username='racer', email='racer@example.com')
+        category = Category.objects.create(name='Race', slug='race')
+        product = create_products(category, 1)[0]
+        Wishlist.objects.create(user=user)
+
+        def work(index):
+            for _ in range(self.TOGGLES_PER_THREAD):
+                toggle_wishlist_item(user, product.id)
+
+        self.assertEqual(run_in_threads(self.THREADS, work), [])
+        wishlist = Wishlist.objects.get(user=user)
+        rows = WishlistItem.objects.filter(wishlist=wishlist).count()
+        # An even number of toggles always ends where it started
+        self.assertEqual(rows, (self.THREADS * self.TOGGLES_PER_THREAD) % 2)
+        self.assertEqual(wishlist.item_count, rows)
+
+
+@requires_concurrent_writes
+class DropLoadTests(TransactionTestCase):
+    """Buyers hit place-order at once for the same 3 variants, items in mixed order."""
+    # SQLite takes one writer at a time: fewer buyers keep its queue inside
+    # the default lock timeout, where 500 would fail with "database is locked"
+    BUYERS = 500 if connection.vendor == 'postgresql' else 60
+    STOCK = BUYERS * 3 // 10
+
+    def test_no_oversell_and_no_deadlocks(self):
+        category = Category.objects.create(name='Drop', slug='drop')
+        product = create_products(category, 1)[0]
+        variants = [
+            ProductVariant.objects.create(product=product, color='Black', size=size, stock=self.STOCK)
+            for size in ('S', 'M', 'L')
+        ]
+        CustomUser.objects.bulk_create(
+            CustomUser(username=f'buyer{i}', email=f'buyer{i}@example.com') for i in range(self.BUYERS)
+        )
+        Token.objects.bulk_create(
+            Token(key=Token.generate_key(), user=user) for user in CustomUser.objects.filter(username__startswith='buyer')
+        )
+        keys = list(Token.objects.order_by('user_id').values_list('key', flat=True))
+        statuses = [None] * self.BUYERS
+
+        def work(index):
+            # Every buyer wants two of the variants, in an order that depends on the buyer
+            picked = [variants[index % 3], variants[(index + 1 + index % 2) % 3]]
+            if index % 2:
+                picked.reverse()
+            response = Client().post('/api/place-order/', {
+                'shipping_address': '1 Road', 'billing_email': 'buyer@example.com',
+                'items': [{'variant_id': variant.id, 'quantity': 1} for variant in picked],
+            }, content_type='application/json', HTTP_AUTHORIZATION=f'Token {keys[index]}')
+            statuses[index] = response.status_code
+
+        self.assertEqual(run_in_threads(self.BUYERS, work), [])
+        self.assertEqual(set(statuses) - {201, 400}, set())  # 500 would mean a deadlock or lock timeout
+        for variant in variants:
+            variant.refresh_from_db()
+            sold = OrderItem.objects.filter(variant=variant).aggregate(total=Sum('quantity'))['total'] or 0
+            self.assertEqual(variant.stock + sold, self.STOCK)
+            self.assertGreaterEqual(variant.stock, 0)
+        self.assertEqual(Order.objects.count(), statuses.count(201))
+        self.assertEqual(OrderItem.objects.count(), 2 * statuses.count(201))
+        # Demand (2 units a buyer) is over twice the supply (3 variants x STOCK): some variant sells out
+        self.assertIn(0, [variant.stock for variant in variants])
+
+
+class WishlistListingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        self.product_ids = seed_catalog(self.category, 30)
+        ProductVariant.objects.filter(product_id=self.product_ids[0]).update(stock=0)
+        wishlist = Wishlist.objects.create(user=self.user)
+        wishlist.products.add(*self.product_ids)
+
+    def _list(self, url='/api/wishlist/?page_size=10'):
+        response = self.client.get(url, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_pages_walk_newest_first_without_gaps(self):
+        seen, url = [], '/api/wishlist/?page_size=10'
+        while url:
+            data = self._list(url)
+            self.assertEqual(data['total_items'], 30)
+            seen.extend(row['product']['id'] for row in data['results'])
+            url = data['next']
+        expected = list(WishlistItem.objects.order_by('-id').values_list('product_id', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_rows_use_the_compact_product(self):
+        data = self._list('/api/wishlist/?page_size=100')
+        row = data['results'][-1]
+        item = WishlistItem.objects.get(product_id=self.product_ids[0])
+        self.assertEqual(row['id'], item.id)
+        self.assertEqual(set(row['product']), {'id', 'name', 'price', 'thumbnail', 'in_stock'})
+        self.assertFalse(row['product']['in_stock'])
+        self.assertTrue(data['results'][0]['product']['in_stock'])
+        first_image = ProductImage.objects.filter(product_id=self.product_ids[0]).order_by('id').first()
+        self.assertTrue(row['product']['thumbnail'].endswith(first_image.image.url))
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self._list()
+        # Token lookup, wishlist, one page query
+        for page_size in (1, 10, 30):
+            with self.assertNumQueries(3):
+                self._list(f'/api/wishlist/?page_size={page_size}')
+
+
+class CartReadModelTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        self.category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product_ids = seed_catalog(self.category, 12, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.filter(product_id__in=product_ids).order_by('id'))
+
+    def _add(self, variant, quantity=1):
+        response = self.client.post(
+            '/api/cart/', {'variant_id': variant.id, 'quantity': quantity}, **self.auth
+        )
+        self.assertEqual(response.status_code, 201)
+
+    def _summary(self):
+        response = self.client.get('/api/cart/summary/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_lines_carry_prices_stock_and_product(self):
+        first, second = self.variants[0], self.variants[2]
+        self._add(first, 2)
+        self._add(second, 3)
+        ProductVariant.objects.filter(pk=second.pk).update(stock=1)
+
+        data = self.client.get('/api/cart/', **self.auth).data
+        lines = {line['variant']['id']: line for line in data['items']}
+        price = first.product.price
+        self.assertEqual(lines[first.id]['unit_price'], str(price))
+        self.assertEqual(Decimal(lines[first.id]['line_total']), price * 2)
+        self.assertTrue(lines[first.id]['in_stock'])
+        self.assertFalse(lines[second.id]['in_stock'])
+        self.assertEqual(lines[first.id]['product']['id'], first.product_id)
+        self.assertEqual(lines[first.id]['product']['name'], first.product.name)
+        self.assertIsNotNone(lines[first.id]['product']['thumbnail'])
+        self.assertEqual(data['item_count'], 5)
+        self.assertEqual(Decimal(data['subtotal']), price * 2 + second.product.price * 3)
+
+    def test_cart_is_read_in_one_query_whatever_its_size(self):
+        self._add(self.variants[0])
+        self.client.get('/api/cart/', **self.auth)
+        # Token lookup, cart, lines
+        with self.assertNumQueries(3):
+            self.client.get('/api/cart/', **self.auth)
+        for variant in self.variants[1:20]:
+            self._add(variant)
+        with self.assertNumQueries(3):
+            data = self.client.get('/api/cart/', **self.auth).data
+        self.assertEqual(len(data['items']), 20)
+
+    def test_summary_follows_writes_without_loading_items(self):
+        self.assertEqual(self._summary(), {'item_count': 0, 'subtotal': '0.00'})
+        first, second = self.variants[0], self.variants[2]
+        self._add(first, 2)
+        self._add(first, 1)
+        self._add(second, 1)
+        expected = first.product.price * 3 + second.product.price
+        self.assertEqual(self._summary(), {'item_count': 4, 'subtotal': str(expected)})
+
+        product = second.product
+        product.price = Decimal('10.00')
+        product.save()
+        self.assertEqual(self._summary()['subtotal'], str(first.product.price * 3 + Decimal('10.00')))
+
+        item = CartItem.objects.get(variant=first)
+        self.client.delete(f'/api/cart/{item.id}/', **self.auth)
+        with self.assertNumQueries(2):
+            self.assertEqual(self._summary(), {'item_count': 1, 'subtotal': '10.00'})
+
+
+class CartAddTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product = create_products(category, 1)[0]
+        self.variant = ProductVariant.objects.create(product=product, color='Black', size='M', stock=5)
+
+    def _add(self, quantity, variant_id=None):
+        return self.client.post(
+            '/api/cart/', {'variant_id': variant_id or self.variant.id, 'quantity': quantity}, **self.auth
+        )
+
+    def test_adds_increment_up_to_stock(self):
+        self.assertEqual(self._add(2).data['quantity'], 2)
+        response = self._add(2)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['variant'], {'id': self.variant.id, 'color': 'Black', 'size': 'M', 'stock': 5})
+        self.assertEqual((response.data['quantity'], response.data['at_stock_limit']), (4, False))
+
+        response = self._add(3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data, {'error': 'Only 5 left', 'quantity': 4, 'stock': 5})
+        self.assertEqual(CartItem.objects.get().quantity, 4)
+
+        response = self._add(1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.data['quantity'], response.data['at_stock_limit']), (5, True))
+        item = CartItem.objects.get()
+        self.assertEqual(item.quantity, 5)
+        self.assertEqual(item.cart.item_count, 5)
+
+    def test_rejects_unknown_and_sold_out_variants(self):
+        self.assertEqual(self._add(1, variant_id=999999).status_code, 400)
+        self.assertEqual(self._add(0).status_code, 400)
+        ProductVariant.objects.filter(pk=self.variant.pk).update(stock=0)
+        self.assertEqual(self._add(1).data, {'error': 'Only 0 left', 'quantity': 0, 'stock': 0})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_add_is_one_upsert(self):
+        self._add(1)
+        with CaptureQueriesContext(connection) as ctx:
+            self._add(1)
+        # Token lookup, the upsert, the summary refresh
+        self.assertEqual(len(data_statements(ctx.captured_queries)), 3)
+
+
+class CartBatchTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=self.user).key}'}
+        category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product_ids = seed_catalog(category, 30, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.filter(product_id__in=product_ids).order_by('id'))
+
+    def _batch(self, operations):
+        return self.client.post(
+            '/api/cart/batch/', {'operations': operations}, content_type='application/json', **self.auth
+        )
+
+    def _quantities(self):
+        return dict(CartItem.objects.values_list('variant_id', 'quantity'))
+
+    def test_operations_apply_in_order(self):
+        a, b, c, d = (variant.id for variant in self.variants[:4])
+        self._batch([{'op': 'set', 'variant_id': a, 'quantity': 2}, {'op': 'set', 'variant_id': b, 'quantity': 1}])
+        response = self._batch([
+            {'op': 'increment', 'variant_id': a, 'quantity': 3},
+            {'op': 'remove', 'variant_id': b},
+            {'op': 'increment', 'variant_id': c, 'quantity': 1},
+            {'op': 'increment', 'variant_id': c, 'quantity': 1},
+            {'op': 'set', 'variant_id': d, 'quantity': 4},
+            {'op': 'increment', 'variant_id': d, 'quantity': -4},
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self._quantities(), {a: 5, c: 2})
+        self.assertEqual(response.data['item_count'], 7)
+        self.assertEqual(len(response.data['items']), 2)
+
+    def test_rejects_the_whole_batch(self):
+        a, b = self.variants[0].id, self.variants[1].id
+        self._batch([{'op': 'set', 'variant_id': a, 'quantity': 1}])
+        response = self._batch([
+            {'op': 'set', 'variant_id': a, 'quantity': 3},
+            {'op': 'increment', 'variant_id': b, 'quantity': 11},
+            {'op': 'remove', 'variant_id': 999999},
+        ])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([problem['variant_id'] for problem in response.data['details']], [b, 999999])
+        self.assertEqual(response.data['details'][0]['stock'], 10)
+        self.assertEqual(self._quantities(), {a: 1})
+        self.assertEqual(self._batch([{'op': 'increment', 'variant_id': a}]).status_code, 400)
+
+    def test_write_statements_do_not_depend_on_batch_size(self):
+        def statements(variants):
+            self._batch([{'op': 'set', 'variant_id': v.id, 'quantity': 1} for v in variants[::2]])
+            operations = []
+            for i, variant in enumerate(variants):
+                op = 'set' if i % 2 else ('remove' if i % 4 == 0 else 'increment')
+                operations.append({'op': op, 'variant_id': variant.id, 'quantity': 2 if op == 'set' else 1})
+            with CaptureQueriesContext(connection) as ctx:
+                self.assertEqual(self._batch(operations).status_code, 200)
+            return len(data_statements(ctx.captured_queries))
+
+        self.assertEqual(statements(self.variants[:8]), statements(self.variants[8:60]))
+
+
+class GuestCartTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product_ids = seed_catalog(category, 3, variants_per_product=2)
+        self.variants = list(ProductVariant.objects.filter(product_id__in=product_ids).order_by('id'))
+
+    def _post(self, operations, token=None):
+        headers = {'HTTP_X_GUEST_CART': token} if token else {}
+        return self.client.post(
+            '/api/guest-cart/', {'operations': operations}, content_type='application/json', **headers
+        )
+
+    def test_guest_cart_round_trips_without_writes(self):
+        a, b = self.variants[0], self.variants[1]
+        with CaptureQueriesContext(connection) as ctx:
+            first = self._post([{'op': 'increment', 'variant_id': a.id, 'quantity': 2}])
+            second = self._post([
+                {'op': 'set', 'variant_id': b.id, 'quantity': 1},
+                {'op': 'increment', 'variant_id': a.id, 'quantity': 1},
+            ], token=first.data['guest_cart'])
+        self.assertEqual(second.status_code, 200)
+        self.assertTrue(all(sql.lstrip().upper().startswith('SELECT') for sql in data_statements(ctx.captured_queries)))
+        self.assertEqual(Cart.objects.count() + CartItem.objects.count(), 0)
+
+        data = self.client.get('/api/guest-cart/', HTTP_X_GUEST_CART=second.data['guest_cart']).data
+        self.assertEqual({line['variant']['id']: line['quantity'] for line in data['items']}, {a.id: 3, b.id: 1})
+        self.assertEqual(data['item_count'], 4)
+        self.assertEqual(Decimal(data['subtotal']), a.product.price * 3 + b.product.price)
+        self.assertIn('product', data['items'][0])
+
+    def test_rejects_tampered_tokens_and_excess_stock(self):
+        token = self._post([{'op': 'set', 'variant_id': self.variants[0].id, 'quantity': 1}]).data['guest_cart']
+        self.assertEqual(self.client.get('/api/guest-cart/', HTTP_X_GUEST_CART=token[:-1] + 'x').status_code, 400)
+        response = self._post([{'op': 'set', 'variant_id': self.variants[0].id, 'quantity': 11}], token=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['details'][0]['stock'], 10)
+
+    def test_sign_in_merges_the_guest_cart(self):
+        a, b = self.variants[0], self.variants[1]
+        token = self._post([
+            {'op': 'set', 'variant_id': a.id, 'quantity': 6},
+            {'op': 'set', 'variant_id': b.id, 'quantity': 2},
+        ]).data['guest_cart']
+        user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, variant=a, quantity=7)
+        OTP.objects.create(user=user, code='123456', expires_at=timezone.now() + timedelta(minutes=5))
+
+        response = self.client.post('/api/verify-otp/', {'otp': '123456', 'guest_cart': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['merged_cart_lines'], 2)
+        self.assertEqual(dict(cart.items.values_list('variant_id', 'quantity')), {a.id: 10, b.id: 2})
+        cart.refresh_from_db()
+        self.assertEqual(cart.item_count, 12)
+
+
+class CleanupTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product = create_products(category, 1)[0]
+        variant = ProductVariant.objects.create(product=product, color='Black', size='M', stock=5)
+        now = timezone.now()
+        self.fresh_carts, self.fresh_otps = [], []
+        for i in range(10):
+            user = CustomUser.objects.create(username=f'user{i}', email=f'user{i}@example.com')
+            cart = Cart.objects.create(user=user)
+            CartItem.objects.create(cart=cart, variant=variant, quantity=1)
+            otp = OTP.objects.create(user=user, code='123456', expires_at=now + timedelta(minutes=5))
+            if i % 2:
+                self.fresh_carts.append(cart.id)
+                self.fresh_otps.append(otp.id)
+            else:
+                Cart.objects.filter(pk=cart.pk).update(updated_at=now - timedelta(days=45))
+                OTP.objects.filter(pk=otp.pk).update(expires_at=now - timedelta(days=1), is_used=i % 4 == 0)
+
+    def test_purges_in_batches(self):
+        batches = []
+        with CaptureQueriesContext(connection) as ctx:
+            results = run_cleanup(batch_size=2, progress=lambda name, stats: batches.append(name))
+        # Items cascade with their carts without per-row summary refreshes
+        self.assertFalse([q for q in ctx.captured_queries if q['sql'].startswith('UPDATE "core_cart"')])
+        self.assertEqual(results['carts']['rows'], 5)
+        self.assertEqual(results['carts']['batches'], 3)
+        self.assertEqual(batches.count('otps'), 3)
+        self.assertEqual(sorted(Cart.objects.values_list('id', flat=True)), self.fresh_carts)
+        self.assertEqual(sorted(CartItem.objects.values_list('cart_id', flat=True)), self.fresh_carts)
+        self.assertEqual(sorted(OTP.objects.values_list('id', flat=True)), self.fresh_otps)
+
+    def test_carts_of_recently_active_users_survive(self):
+        signed_in, ordered = Cart.objects.exclude(pk__in=self.fresh_carts).order_by('id')[:2]
+        CustomUser.objects.filter(pk=signed_in.user_id).update(last_login=timezone.now())
+        Order.objects.create(user_id=ordered.user_id, total_amount=0)
+        self.assertEqual(purge_abandoned_carts()['rows'], 3)
+        self.assertEqual(Cart.objects.filter(pk__in=[signed_in.pk, ordered.pk]).count(), 2)
+
+    def test_max_batches_and_dry_run(self):
+        self.assertEqual(run_cleanup(dry_run=True)['otps']['rows'], 5)
+        self.assertEqual(OTP.objects.count(), 10)
+        run_cleanup(batch_size=2, max_batches=1)
+        self.assertEqual((Cart.objects.count(), OTP.objects.count()), (8, 8))
+
+    def test_rows_touched_after_selection_survive(self):
+        cart = Cart.objects.exclude(pk__in=self.fresh_carts).first()
+        otp = OTP.objects.exclude(pk__in=self.fresh_otps).first()
+        with mock.patch('core.services.cleanup_service._purge') as purge:
+            purge_abandoned_carts()
+            purge_spent_otps()
+        (_, carts, delete_carts), (_, otps, delete_otps) = (c.args[:3] for c in purge.call_args_list)
+        # An add-to-cart and a fresh code land between the SELECT and the DELETE
+        Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
+        OTP.objects.filter(pk=otp.pk).update(expires_at=timezone.now() + timedelta(minutes=5))
+        self.assertEqual(delete_carts(carts.filter(pk__in=[cart.pk])), 0)
+        self.assertEqual(delete_otps(otps.filter(pk__in=[otp.pk])), 0)
+        self.assertTrue(CartItem.objects.filter(cart=cart).exists())
+        self.assertTrue(OTP.objects.filter(pk=otp.pk).exists())
+
+    def test_command_reports_throughput(self):
+        out = StringIO()
+        call_command('cleanup_stale_rows', '--batch-size=3', stdout=out)
+        output = out.getvalue()
+        self.assertIn('carts: processed 5 rows in 2 batches', output)
+        self.assertIn('rows/s', output)
+        self.assertEqual(OTP.objects.count(), 5)
+
+
+class OrderFlowMixin:
+    """Cart, create-order and verify-payment helpers shared by the order tests."""
+
+    def _auth(self, user):
+        token, _ = Token.objects.get_or_create(user=user)
+        return {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+
+    def _fill_cart(self, user, variant_ids, quantity=1):
+        """Replace the user's cart lines with quantity of each variant"""
+        cart, _ = Cart.objects.get_or_create(user=user)
+        CartItem.objects.filter(cart=cart).delete()
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, variant_id=variant_id, quantity=quantity) for variant_id in variant_ids
+        )
+
+    def _create_order(self, auth, razorpay_id='order_rzp1', data=None):
+        with mock.patch('core.views.razorpay_client') as client:
+            client.order.create.return_value = {'id': razorpay_id}
+            return self.client.post('/api/create-order/', data or {}, **auth)
+
+    def _verify(self, razorpay_id):
+        secret = config('RAZORPAY_KEY_SECRET').encode()
+        signature = hmac.new(secret, f'{razorpay_id}|pay_1'.encode(), hashlib.sha256).hexdigest()
+        return self.client.post('/api/verify-payment/', {
+            'razorpay_order_id': razorpay_id, 'razorpay_payment_id': 'pay_1', 'razorpay_signature': signature,
+        })
+
+
+class StockReservationTests(OrderFlowMixin, TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        product = create_products(category, 1)[0]
+        self.variant = ProductVariant.objects.create(product=product, color='Black', size='M', stock=5)
+        self.users = [
+            CustomUser.objects.create(username=f'buyer{i}', email=f'buyer{i}@example.com', address='1 Road')
+            for i in range(2)
+        ]
+
+    def test_available_to_sell_counts_only_live_holds(self):
+        order = Order.objects.create(user=self.users[0], total_amount=0)
+        now = timezone.now()
+        StockReservation.objects.bulk_create([
+            StockReservation(variant=self.variant, order=order, quantity=2, expires_at=now + timedelta(minutes=5)),
+            StockReservation(variant=self.variant, order=order, quantity=1, expires_at=now - timedelta(minutes=1)),
+            StockReservation(variant=self.variant, order=order, quantity=1, status=StockReservation.RELEASED,
+                             expires_at=now + timedelta(minutes=5)),
+        ])
+        self.assertEqual(available_to_sell([self.variant.id]), {self.variant.id: 3})
+
+    def test_online_hold_blocks_other_orders_until_paid(self):
+        self._fill_cart(self.users[0], [self.variant.id], 4)
+        self.assertEqual(self._create_order(self._auth(self.users[0])).status_code, 201)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 5)  # Held, not yet taken
+
+        self._fill_cart(self.users[1], [self.variant.id], 2)
+        response = self.client.post('/api/create-cod-order/', {}, **self._auth(self.users[1]))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['details'][0]['available'], 1)
+
+        self.assertEqual(self._verify('order_rzp1').status_code, 200)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 1)
+        self.assertEqual(StockReservation.objects.get().status, StockReservation.CONFIRMED)
+
+    def test_cod_and_direct_orders_take_stock_at_once(self):
+        self._fill_cart(self.users[0], [self.variant.id], 2)
+        self.assertEqual(self.client.post('/api/create-cod-order/', {}, **self._auth(self.users[0])).status_code, 201)
+        response = self.client.post('/api/place-order/', {
+            'shipping_address': '1 Road', 'billing_email': 'buyer1@example.com',
+            'items': [{'variant_id': self.variant.id, 'quantity': 4}],
+        }, content_type='application/json', **self._auth(self.users[1]))
+        self.assertEqual(response.status_code, 400)
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 3)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_expired_holds_are_swept_and_confirmed_only_if_still_available(self):
+        self._fill_cart(self.users[0], [self.variant.id], 4)
+        self._create_order(self._auth(self.users[0]))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        self._fill_cart(self.users[1], [self.variant.id], 3)
+        self.assertEqual(self.client.post('/api/create-cod-order/', {}, **self._auth(self.users[1])).status_code, 201)
+
+        self.assertEqual(run_cleanup()['holds']['rows'], 1)
+        response = self._verify('order_rzp1')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Payment.objects.count(), 1)
+        self.assertEqual(Order.objects.get(razorpay_order_id='order_rzp1').status, 'refund_pending')
+        self.variant.refresh_from_db()
+        self.assertEqual(self.variant.stock, 2)
+
+    def test_online_orders_count_as_sales_once_paid(self):
+        self._fill_cart(self.users[0], [self.variant.id], 2)
+        self._create_order(self._auth(self.users[0]))
+        popularity = ProductPopularity.objects.filter(product_id=self.variant.product_id)
+        self.assertFalse(popularity.filter(units_sold__gt=0).exists())
+        refresh_product_scores()
+        self.assertEqual(popularity.get().units_sold, 0)
+
+        self.assertEqual(self._verify('order_rzp1').status_code, 200)
+        self.assertEqual(popularity.get().units_sold, 2)
+        refresh_product_scores()
+        self.assertEqual(popularity.get().units_sold, 2)
+
+    def test_razorpay_failure_leaves_no_order_behind(self):
+        self._fill_cart(self.users[0], [self.variant.id], 2)
+        with mock.patch('core.views.razorpay_client') as client:
+            client.order.create.side_effect = RuntimeError('gateway down')
+            response = self.client.post('/api/create-order/', {}, **self._auth(self.users[0]))
+        self.assertEqual(response.status_code, 500)
+        self.assertFalse(Order.objects.exists())
+        self.assertFalse(StockReservation.objects.exists())
+        self.assertFalse(ProductPopularity.objects.filter(units_sold__gt=0).exists())
+
+    def test_sweep_leaves_holds_confirmed_after_it_selected_them(self):
+        self._fill_cart(self.users[0], [self.variant.id], 2)
+        self._create_order(self._auth(self.users[0]))
+        hold = StockReservation.objects.get()
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(minutes=1))
+        with mock.patch('core.services.cleanup_service._purge') as purge:
+            release_expired_holds()
+        _, queryset, release = purge.call_args.args[:3]
+        self.assertEqual(self._verify('order_rzp1').status_code, 200)  # Confirmed after the sweep's SELECT
+        self.assertEqual(release(queryset.filter(pk__in=[hold.id])), 0)
+        hold.refresh_from_db()
+        self.assertEqual(hold.status, StockReservation.CONFIRMED)
+
+
+class CheckoutTests(OrderFlowMixin, TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Checkout', slug='checkout')
+        product_ids = seed_catalog(category, 20, variants_per_product=2, images_per_product=1)
+        self.variant_ids = list(
+            ProductVariant.objects.filter(product_id__in=product_ids).order_by('id').values_list('id', flat=True)
+        )
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com', address='1 Road')
+        self.auth = self._auth(self.user)
+        self.cart = Cart.objects.create(user=self.user)
+
+    def test_every_endpoint_prices_coupons_the_same_way(self):
+        now = timezone.now()
+        Coupon.objects.create(
+            code='TENOFF', discount_type='percentage', discount_value=Decimal('10'),
+            valid_from=now - timedelta(days=1), valid_to=now + timedelta(days=1),
+        )
+        self._fill_cart(self.user, self.variant_ids[:3], 2)
+        subtotal = self.cart.items.aggregate(
+            total=Sum(F('quantity') * F('variant__product__price'))
+        )['total']
+        items = [{'variant_id': variant_id, 'quantity': 2} for variant_id in self.variant_ids[:3]]
+
+        def checkout():
+            return self.client.post('/api/checkout/', {
+                'first_name': 'A', 'last_name': 'B', 'email': 'shopper@example.com', 'address_line_1': '1 Road',
+                'city': 'Chennai', 'state': 'TN', 'pincode': '600001', 'phone': '9999999999',
+                'payment_method': 'cod', 'coupon_code': 'tenoff',
+            }, **self.auth)
+
+        endpoints = {
+            'checkout': checkout,
+            'create-order': lambda: self._create_order(self.auth, data={'coupon_code': 'TenOff'}),
+            'create-cod-order': lambda: self.client.post(
+                '/api/create-cod-order/', {'coupon_code': 'TENOFF'}, **self.auth),
+            'place-order': lambda: self.client.post('/api/place-order/', {
+                'shipping_address': '1 Road', 'billing_email': 'shopper@example.com',
+                'items': items, 'coupon_code': 'tenoff',
+            }, content_type='application/json', **self.auth),
+        }
+        for name, place in endpoints.items():
+            with self.subTest(endpoint=name):
+                self._fill_cart(self.user, self.variant_ids[:3], 2)
+                response = place()
+                self.assertEqual(response.status_code, 201, response.data)
+                order = Order.objects.latest('id')
+                self.assertEqual(order.discount_amount, subtotal / 10)
+                self.assertEqual(order.total_amount, subtotal - subtotal / 10)
+        self.assertEqual(Coupon.objects.get().used_count, len(endpoints))
+
+        self._fill_cart(self.user, self.variant_ids[:1], 2)
+        response = self.client.post('/api/create-cod-order/', {'coupon_code': 'NOPE'}, **self.auth)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], 'Invalid coupon code')
+        self.assertEqual(Order.objects.count(), len(endpoints))
+
+
+class OrderQueryCountTests(OrderFlowMixin, TestCase):
+    """Every order endpoint runs a fixed number of queries, whatever the number of lines."""
+    LINES = 30
+
+    def setUp(self):
+        category = Category.objects.create(name='Bulk', slug='bulk')
+        seed_catalog(category, self.LINES, variants_per_product=1, images_per_product=1)
+        self.variant_ids = list(ProductVariant.objects.order_by('id').values_list('id', flat=True))
+        self.user = CustomUser.objects.create(username='b2b', email='b2b@example.com', address='1 Road')
+        self.auth = self._auth(self.user)
+
+    def _items(self, lines):
+        return [{'variant_id': variant_id, 'quantity': 1} for variant_id in self.variant_ids[:lines]]
+
+    def _checkout(self, payment_method):
+        return self.client.post('/api/checkout/', {
+            'first_name': 'A', 'last_name': 'B', 'email': 'b2b@example.com', 'address_line_1': '1 Road',
+            'city': 'Chennai', 'state': 'TN', 'pincode': '600001', 'phone': '9999999999',
+            'payment_method': payment_method,
+        }, **self.auth)
+
+    def _queries(self, lines, place, setup=None):
+        self._fill_cart(self.user, self.variant_ids[:lines])
+        arg = setup(lines) if setup else lines
+        with CaptureQueriesContext(connection) as ctx:
+            response = place(arg)
+        self.assertIn(response.status_code, (200, 201), response.data)
+        return len(ctx.captured_queries)
+
+    def assertConstantQueries(self, budget, place, setup=None):
+        one, many = (self._queries(lines, place, setup) for lines in (1, self.LINES))
+        self.assertEqual(one, many)
+        # Includes auth and the savepoints of the nested atomic blocks
+        self.assertLessEqual(many, budget)
+
+    def test_place_order(self):
+        self.assertConstantQueries(18, lambda lines: self.client.post('/api/place-order/', {
+            'shipping_address': '1 Road', 'billing_email': 'b2b@example.com', 'items': self._items(lines),
+        }, content_type='application/json', **self.auth))
+        self.assertEqual(OrderItem.objects.count(), 1 + self.LINES)
+
+    def test_create_order(self):
+        self.assertConstantQueries(8, lambda lines: self._create_order(self.auth, f'rzp_{lines}'))
+        self.assertEqual(StockReservation.objects.count(), 1 + self.LINES)
+
+    def test_verify_payment(self):
+        def hold(lines):
+            self._create_order(self.auth, f'rzp_{lines}')
+            return f'rzp_{lines}'
+
+        self.assertConstantQueries(18, self._verify, setup=hold)
+        self.assertEqual(StockReservation.objects.filter(status=StockReservation.CONFIRMED).count(), 1 + self.LINES)
+
+    def test_create_cod_order(self):
+        self.assertConstantQueries(20, lambda lines: self.client.post('/api/create-cod-order/', {}, **self.auth))
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_checkout(self):
+        self.assertConstantQueries(10, lambda lines: self._checkout('online'))
+        self.assertConstantQueries(20, lambda lines: self._checkout('cod'))
+        # Online checkouts hold; the two COD ones take 1 + 30 units
+        self.assertEqual(ProductVariant.objects.aggregate(total=Sum('stock'))['total'], 10 * self.LINES - 1 - self.LINES)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'set RUN_BENCHMARKS=1 to run benchmarks')
+class CheckoutBenchmark(TestCase):
+    def test_checkout_1_20_200_lines(self):
+        category = Category.objects.create(name='Bench', slug='bench')
+        seed_catalog(category, 100, variants_per_product=2, images_per_product=1)
+        ProductVariant.objects.update(stock=1000)
+        variant_ids = list(ProductVariant.objects.order_by('id').values_list('id', flat=True))
+        user = CustomUser.objects.create(username='bench', email='bench@example.com', address='1 Road')
+        auth = {'HTTP_AUTHORIZATION': f'Token {Token.objects.create(user=user).key}'}
+        cart = Cart.objects.create(user=user)
+
+        item_fields = [field for field in OrderItem._meta.concrete_fields if not field.primary_key]
+        fixed = set()
+        for lines in (1, 20, 200):
+            CartItem.objects.bulk_create(CartItem(cart=cart, variant_id=v, quantity=1) for v in variant_ids[:lines])
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.post('/api/create-cod-order/', {}, **auth)
+            elapsed = time.perf_counter() - started
+            self.assertEqual(response.status_code, 201)
+            # Every query counts. The only term that grows is the OrderItem
+            # INSERT, split into batches by the database's bind-parameter limit
+            batches = math.ceil(lines / connection.ops.bulk_batch_size(item_fields, [None] * lines))
+            inserts = sum(1 for q in ctx.captured_queries if q['sql'].startswith('INSERT INTO "core_orderitem"'))
+            self.assertEqual(inserts, batches)
+            fixed.add(len(ctx.captured_queries) - batches)
+            print(f"\n{lines} lines: {len(ctx.captured_queries)} queries ({batches} item batches), {elapsed * 1000:.1f}ms")
+        self.assertEqual(len(fixed), 1)
+
+
+@requires_concurrent_writes
+class CartAddConcurrencyTests(TransactionTestCase):
+    THREADS = 16
+    ADDS_PER_THREAD = 5
+
+    def test_parallel_adds_lose_no_increments(self):
+        user = CustomUser.objects.create(username='racer', email='racer@example.com')
+        category = Category.objects.create(name='Race', slug='race')
+        product = create_products(category, 1)[0]
+        roomy = ProductVariant.objects.create(product=product, color='Black', size='M', stock=1000)
+        scarce = ProductVariant.objects.create(product=product, color='Black', size='L', stock=37)
+
+        def work(index):
+            for _ in range(self.ADDS_PER_THREAD):
+                add_to_cart(user, roomy.id, 1)
+                try:
+                    add_to_cart(user, scarce.id, 1)
+                except StockLimitReached:
+                    pass
+
+        self.assertEqual(run_in_threads(self.THREADS, work), [])
+        quantities = dict(CartItem.objects.values_list('variant_id', 'quantity'))
+        self.assertEqual(quantities[roomy.id], self.THREADS * self.ADDS_PER_THREAD)
+        self.assertEqual(quantities[scarce.id], scarce.stock)
+        self.assertEqual(Cart.objects.get(user=user).item_count, sum(quantities.values()))
+
+
+class ProductCatalogQueryTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+
+    def _count_queries(self, url):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries)
+
+    def test_list_query_count_is_constant(self):
+        seed_catalog(self.category, 3)
+        small = self._count_queries('/api/products/')
+        seed_catalog(self.category, 20)
+        self.assertEqual(self._count_queries('/api/products/'), small)
+
+    def test_filtered_list_query_count_is_constant(self):
+        url = '/api/products/?color=Black&size=M&material=cotton'
+        seed_catalog(self.category, 3)
+        small = self._count_queries(url)
+        seed_catalog(self.category, 20)
+        self.assertEqual(self._count_queries(url), small)
+
+    def test_detail_query_count_is_constant(self):
+        product_id = seed_catalog(self.category, 1, variants_per_product=2, images_per_product=1)[0]
+        few = self._count_queries(f'/api/products/{product_id}/')
+        other_id = seed_catalog(self.category, 1, variants_per_product=12, images_per_product=8)[-1]
+        self.assertEqual(self._count_queries(f'/api/products/{other_id}/'), few)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'set RUN_BENCHMARKS=1 to run benchmarks')
+class ProductCatalogBenchmark(TestCase):
+    def test_list_5k_products(self):
+        category = Category.objects.create(name='Bench', slug='bench')
+        seed_catalog(category, 5000, variants_per_product=6, images_per_product=4)
+
+        for url in ('/api/products/', '/api/products/?color=Black&size=M'):
+            started = time.perf_counter()
+            with CaptureQueriesContext(connection) as ctx:
+                response = self.client.get(url)
+            elapsed = time.perf_counter() - started
+            self.assertEqual(response.status_code, 200)
+            # ETag validator aggregate, the page, variants, images
+            self.assertLessEqual(len(ctx.captured_queries), 4)
+            print(f"\n{url}: {len(ctx.captured_queries)} queries, {elapsed:.2f}s")
+
+        # A deep page costs the same as the first one
+        deep = Product.objects.order_by('price', 'id')[4900]
+        cursor = base64.urlsafe_b64encode(
+            json.dumps({'v': [str(deep.price), deep.id]}).encode()
+        ).decode()
+        started = time.perf_counter()
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(f'/api/products/?ordering=price&cursor={cursor}')
+        elapsed = time.perf_counter() - started
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), 24)
+        self.assertLessEqual(len(ctx.captured_queries), 4)
+        print(f"deep page: {len(ctx.captured_queries)} queries, {elapsed:.2f}s")
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'set RUN_BENCHMARKS=1 to run benchmarks')
+class ProductSearchBenchmark(TestCase):
+    def test_search_100k_products(self):
+        category = Category.objects.create(name='Bench', slug='bench')
+        words = ['cotton', 'track', 'hoodie', 'oversized', 'graphic', 'tee', 'jogger', 'denim']
+        Product.objects.bulk_create(
+            Product(
+                name=f"{words[i % 8]} {words[(i // 8) % 8]} {i}",
+                description=f"{words[(i // 64) % 8]} fit",
+                price=Decimal('499.00'),
+                category=category,
+            )
+            for i in range(100_000)
+        )
+        refresh_search_documents(Product.objects.values_list('id', flat=True))
+
+        # bm25() scores every match, so a prefix hitting a third of the
+        # catalog ('hood') costs far more than a selective query.
+        for query, budget_ms in (('hood', 150), ('graphic tee', 60), ('oversized denim 4242', 30)):
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                ids = list(
+                    search_products(Product.objects.all(), query)
+                    .order_by('-search_rank', 'id').values_list('id', flat=True)[:24]
+                )
+                timings.append((time.perf_counter() - started) * 1000)
+                self.assertTrue(ids)
+            self.assertLess(min(timings), budget_ms, query)
+
+
+class ProductKeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        # Duplicate prices make the tiebreaker matter
+        for i in range(7):
+            Product.objects.create(
+                name=f"Track {i}", price=Decimal(100 * (i % 3)), category=self.category
+            )
+
+    def _walk(self, url):
+        ids, pages = [], []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append(response.data)
+            ids.extend(row['id'] for row in response.data['results'])
+            url = response.data['next']
+        return ids, pages
+
+    def test_walks_every_ordering_without_gaps_or_duplicates(self):
+        for ordering in ('id', '-id', 'price', '-price', 'name', '-name'):
+            expected = list(Product.objects.order_by(ordering, 'id').values_list('id', flat=True))
+            ids, _ = self._walk(f'/api/products/?ordering={ordering}&page_size=3')
+            self.assertEqual(ids, expected, ordering)
+
+    def test_previous_link_returns_the_previous_page(self):
+        first = self.client.get('/api/products/?ordering=price&page_size=3').data
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual(
+            [row['id'] for row in back['results']],
+            [row['id'] for row in first['results']],
+        )
+        self.assertIsNone(first['previous'])
+
+    def test_popular_sort_pages_by_units_sold(self):
+        user = CustomUser.objects.create(username='buyer', email='buyer@example.com')
+        products = list(Product.objects.order_by('id'))
+        order = Order.objects.create(user=user, total_amount=0)
+        for units, product in zip((5, 1, 9), products):
+            variant = ProductVariant.objects.create(product=product, color='Black', size='M')
+            OrderItem.objects.create(
+                order=order, product=product, variant=variant,
+                quantity=units, price=product.price, size='M',
+            )
+
+        ids, _ = self._walk('/api/products/?sort_by=popular&page_size=2')
+
+        self.assertEqual(ids[:3], [products[2].id, products[0].id, products[1].id])
+        self.assertEqual(sorted(ids), sorted(p.id for p in products))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get('/api/products/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_forged_cursor_values_are_rejected(self):
+        for ordering, values in [('price', ['cheap', 1]), ('id', [[1]]), ('name', [None, 1]), ('-id', [{}])]:
+            cursor = base64.urlsafe_b64encode(json.dumps({'v': values}).encode()).decode()
+            response = self.client.get(f'/api/products/?ordering={ordering}&cursor={cursor}')
+            self.assertEqual(response.status_code, 404, (ordering, values))
+
+
+class ProductFacetTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        self.tee = Product.objects.create(
+            name='Tee', price=Decimal('499.00'), category=self.category, materials=['Cotton'],
+        )
+        self.hoodie = Product.objects.create(
+            name='Hoodie', price=Decimal('1499.00'), category=self.category, materials=['Fleece'],
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.create(product=self.tee, color='Black', size='M', stock=3)
+            ProductVariant.objects.create(product=self.tee, color='White', size='L', stock=0)
+            ProductVariant.objects.create(product=self.hoodie, color='black ', size='M', stock=1)
+
+    def _ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sorted(row['id'] for row in response.data['results'])
+
+    def test_filters_are_case_insensitive_and_multi_valued(self):
+        self.assertEqual(self._ids('/api/products/?color=BLACK'), sorted([self.tee.id, self.hoodie.id]))
+        self.assertEqual(self._ids('/api/products/?color=white&color=Blue'), [self.tee.id])
+        self.assertEqual(self._ids('/api/products/?size=l'), [self.tee.id])
+        self.assertEqual(self._ids('/api/products/?material=cotton&size=M'), [self.tee.id])
+
+    def test_facets_follow_variant_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductVariant.objects.filter(product=self.tee, color='White').delete()
+        self.assertEqual(self._ids('/api/products/?color=white'), [])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hoodie.materials = ['Cotton']
+            self.hoodie.save()
+        self.assertEqual(self._ids('/api/products/?material=cotton'), sorted([self.tee.id, self.hoodie.id]))
+
+    def test_facet_counts_run_in_one_query(self):
+        with self.assertNumQueries(1):
+            counts = facet_counts(Product.objects.all())
+
+        colors = {row['value']: row['count'] for row in counts['color']}
+        self.assertEqual(colors, {'black': 2, 'white': 1})
+        in_stock = facet_counts(Product.objects.all(), in_stock_only=True)
+        self.assertEqual({row['value'] for row in in_stock['color']}, {'black'})
+
+
+class ProductFacetEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        tracks = Category.objects.create(name='Tracks', slug='tracks')
+        tees = Category.objects.create(name='T-Shirts', slug='t-shirts')
+        with self.captureOnCommitCallbacks(execute=True):
+            for name, price, category, color in [
+                ('Track A', '450.00', tracks, 'Black'),
+                ('Track B', '1800.00', tracks, 'Blue'),
+                ('Tee A', '900.00', tees, 'Black'),
+            ]:
+                product = Product.objects.create(
+                    name=name, price=Decimal(price), category=category, materials=['cotton'],
+                )
+                ProductVariant.objects.create(product=product, color=color, size='M', stock=2)
+
+    def test_counts_for_current_filter_state(self):
+        data = self.client.get('/api/products/facets/?color=black').data
+
+        self.assertEqual([(r['value'], r['count']) for r in data['color']], [('black', 2)])
+        self.assertEqual(
+            {r['value']: r['count'] for r in data['category']}, {'tracks': 1, 't-shirts': 1}
+        )
+        self.assertEqual(
+            {r['value']: r['count'] for r in data['price']},
+            {'under_500': 1, 'under_1000': 2, 'under_2000': 2},
+        )
+        self.assertEqual(data['material'][0]['count'], 2)
+
+    def test_counts_follow_the_search(self):
+        response = self.client.get('/api/products/facets/?search=track')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            {r['value']: r['count'] for r in response.data['color']}, {'black': 1, 'blue': 1}
+        )
+        self.assertEqual([(r['value'], r['count']) for r in response.data['category']], [('tracks', 2)])
+
+    def test_counts_are_cached_per_normalized_signature(self):
+        self.client.get('/api/products/facets/?size=M&color=Black&color=blue')
+        with self.assertNumQueries(0):
+            response = self.client.get('/api/products/facets/?color=BLUE&color=black&size=m&cursor=x')
+        self.assertEqual(response.status_code, 200)
+
+    def test_exact_params_and_catalog_changes_get_their_own_entry(self):
+        self.client.get('/api/products/facets/?category=tracks')
+        response = self.client.get('/api/products/facets/?category=Tracks')
+        self.assertEqual(response.data['category'], [])  # Slugs match exactly
+
+        self.client.get('/api/products/facets/?color=black')
+        bump_catalog_version()
+        with CaptureQueriesContext(connection) as ctx:
+            self.client.get('/api/products/facets/?color=black')
+        self.assertTrue(ctx.captured_queries)
+
+
+class ProductPopularityTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name='Tracks', slug='tracks')
+        self.old_hit, self.new_hit, self.unsold = create_products(category, 3)
+
+    def _ids(self, url):
+        return [row['id'] for row in self.client.get(url).data['results']]
+
+    def test_trending_prefers_recent_sales(self):
+        now = timezone.now()
+        record_sales([(self.old_hit.id, 10)], when=now - timedelta(days=30))
+        record_sales([(self.new_hit.id, 3)], when=now)
+
+        self.assertEqual(
+            self._ids('/api/products/?sort_by=trending'),
+            [self.new_hit.id, self.old_hit.id, self.unsold.id],
+        )
+        self.assertEqual(
+            self._ids('/api/products/?sort_by=popular'),
+            [self.old_hit.id, self.new_hit.id, self.unsold.id],
+        )
+
+    def test_products_without_scores_rank_as_zero(self):
+        record_sales([(self.new_hit.id, 1)])
+        ProductPopularity.objects.filter(pk=self.unsold.id).delete()
+        for sort in ('popular', 'trending'):
+            ids = self._ids(f'/api/products/?sort_by={sort}&page_size=2')
+            self.assertEqual(ids, [self.new_hit.id, self.old_hit.id])
+            cursor = self.client.get(f'/api/products/?sort_by={sort}&page_size=2').data['next']
+            self.assertEqual([row['id'] for row in self.client.get(cursor).data['results']], [self.unsold.id])
+
+    def test_rebase_moves_the_epoch_and_keeps_the_ranking(self):
+        now = timezone.now()
+        record_sales([(self.old_hit.id, 10)], when=now - timedelta(days=30))
+        record_sales([(self.new_hit.id, 3)], when=now)
+        before = dict(ProductPopularity.objects.values_list('product_id', 'trending_score'))
+
+        self.assertFalse(rebase_trending_scores(now=TRENDING_EPOCH + timedelta(days=1)))
+        self.assertTrue(rebase_trending_scores(now=now))
+        self.assertEqual(trending_epoch(), now)
+        after = dict(ProductPopularity.objects.values_list('product_id', 'trending_score'))
+        self.assertAlmostEqual(after[self.new_hit.id], 3)  # A sale at the epoch weighs 1
+        self.assertAlmostEqual(
+            after[self.old_hit.id] / after[self.new_hit.id], before[self.old_hit.id] / before[self.new_hit.id]
+        )
+        record_sales([(self.old_hit.id, 1)], when=now)
+        score = ProductPopularity.objects.get(pk=self.old_hit.id).trending_score
+        self.assertAlmostEqual(score, after[self.old_hit.id] + 1)
+
+    def test_record_sales_is_a_single_update_per_batch(self):
+        record_sales([(self.old_hit.id, 1)])
+        with CaptureQueriesContext(connection) as ctx:
+            record_sales([(self.old_hit.id, 2), (self.new_hit.id, 1), (self.old_hit.id, 1)])
+        updates = [q for q in ctx.captured_queries if q['sql'].startswith('UPDATE')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(ProductPopularity.objects.get(pk=self.old_hit.id).units_sold, 4)
+
+    def test_refresh_rebuilds_scores_from_order_history(self):
+        user = CustomUser.objects.create(username='buyer', email='buyer@example.com')
+        order = Order.objects.create(user=user, total_amount=0)
+        variant = ProductVariant.objects.create(product=self.unsold, color='Black', size='M')
+        OrderItem.objects.create(
+            order=order, product=self.unsold, variant=variant, quantity=2, price=1, size='M',
+        )
+        ProductPopularity.objects.update(units_sold=0, trending_score=0)
+
+        refresh_product_scores()
+
+        score = ProductPopularity.objects.get(pk=self.unsold.id)
+        self.assertEqual(score.units_sold, 2)
+        self.assertGreater(score.trending_score, 0)
+
+
+class ProductSearchTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name='Hoodies', slug='hoodies')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hoodie = Product.objects.create(
+                name='Graphic Hoodie', description='Heavy fleece', price=Decimal('1499.00'),
+                category=self.category, materials=['Fleece'],
+            )
+            self.tee = Product.objects.create(
+                name='Basic Tee', description='Pairs well with a graphic hoodie',
+                price=Decimal('499.00'), category=self.category, materials=['Cotton'],
+            )
+            ProductVariant.objects.create(product=self.tee, color='Olive', size='M', stock=1)
+
+    def _ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return [row['id'] for row in response.data['results']]
+
+    def test_ranks_name_matches_first_and_supports_prefixes(self):
+        self.assertEqual(self._ids('/api/products/?search=graph hood'), [self.hoodie.id, self.tee.id])
+        self.assertEqual(self._ids('/api/products/?search=oliv'), [self.tee.id])
+        self.assertEqual(self._ids('/api/products/?search=cotton'), [self.tee.id])
+        self.assertEqual(self._ids('/api/products/?search=nothing-like-this'), [])
+
+    def test_explicit_ordering_wins_over_relevance(self):
+        self.assertEqual(
+            self._ids('/api/products/?search=hoodie&ordering=price'), [self.tee.id, self.hoodie.id]
+        )
+
+    def test_index_follows_product_and_category_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hoodie.name = 'Zip Jacket'
+            self.hoodie.save()
+        self.assertEqual(self._ids('/api/products/?search=jacket'), [self.hoodie.id])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = 'Outerwear'
+            self.category.save()
+        self.assertEqual(len(self._ids('/api/products/?search=outerwear')), 2)
+
+        self.tee.delete()
+        self.assertEqual(self._ids('/api/products/?search=basic'), [])
+
+    def test_relevance_pages_walk_every_match_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for i in range(5):
+                Product.objects.create(
+                    name=f'Hoodie {i}', description='hoodie ' * i, price=Decimal('999.00'),
+                    category=self.category,
+                )
+        ids, url = [], '/api/products/?search=hoodie&page_size=2'
+        while url:
+            data = self.client.get(url).data
+            ids.extend(row['id'] for row in data['results'])
+            url = data['next']
+        self.assertEqual(len(ids), 7)
+        self.assertEqual(len(set(ids)), 7)
+
+
+class ProductSuggestTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_suggestion_trie()
+        self.category = Category.objects.create(name='Hoodies', slug='hoodies')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hoodie = Product.objects.create(
+                name='Graphic Hoodie', price=Decimal('1499.00'), category=self.category,
+                materials=['Fleece'],
+            )
+            self.honey = Product.objects.create(
+                name='Honey Tee', price=Decimal('499.00'), category=self.category,
+            )
+        record_sales([(self.honey.id, 5)])
+
+    def _suggest(self, q):
+        response = self.client.get('/api/products/suggest/', {'q': q})
+        self.assertEqual(response.status_code, 200)
+        return [(row['type'], row['text']) for row in response.data['results']]
+
+    def test_trie_splits_edges_and_ranks_by_weight(self):
+        trie = RadixTrie(top_k=2)
+        for word, weight in [('hoodie', 1), ('honey', 3), ('hood', 2), ('tee', 9)]:
+            trie.insert(word, word, weight)
+        trie.finalize()
+        self.assertEqual(trie.complete('ho'), ['honey', 'hood'])
+        self.assertEqual(trie.complete('hoo'), ['hood', 'hoodie'])
+        self.assertEqual(trie.complete('hoodie'), ['hoodie'])
+        self.assertEqual(trie.complete('hoodies'), [])
+        self.assertEqual(trie.complete('x'), [])
+
+    def test_matches_any_word_prefix_ranked_by_popularity(self):
+        self.assertEqual(self._suggest('ho'), [
+            ('product', 'Honey Tee'), ('category', 'Hoodies'), ('product', 'Graphic Hoodie'),
+        ])
+        self.assertEqual(self._suggest('fle'), [('material', 'fleece')])
+        self.assertEqual(self._suggest('  '), [])
+
+    def test_keystrokes_do_not_query_the_database(self):
+        self._suggest('h')
+        with self.assertNumQueries(0):
+            for prefix in ['g', 'gr', 'gra', 'grap']:
+                self.assertEqual(self._suggest(prefix), [('product', 'Graphic Hoodie')])
+
+    def test_rebuilds_after_catalog_changes(self):
+        self.assertEqual(self._suggest('zip'), [])
+        with self.settings(SUGGEST_VERSION_CHECK_INTERVAL=0):
+            with self.captureOnCommitCallbacks(execute=True):
+                Product.objects.create(name='Zip Jacket', price=Decimal('999.00'), category=self.category)
+            self.assertEqual(self._suggest('zip'), [('product', 'Zip Jacket')])
+
+
+class HomePageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.products = [
+                Product.objects.create(
+                    name=f'Drop {i}', price=Decimal('799.00'), category=self.category, is_new_drop=True,
+                )
+                for i in range(3)
+            ]
+            ProductImage.objects.create(product=self.products[0], image='products/drop.jpg')
+
+    def test_payload_is_cached_and_revalidated(self):
+        first = self.client.get('/api/home/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(len(first.data['data']['new_arrivals']), 3)
+        self.assertIn('Last-Modified', first)
+
+        with self.assertNumQueries(0):
+            second = self.client.get('/api/home/')
+            not_modified = self.client.get('/api/home/', HTTP_IF_NONE_MATCH=first['ETag'])
+            since = self.client.get('/api/home/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified['ETag'], first['ETag'])
+        self.assertEqual(since.status_code, 304)
+
+    def test_catalog_changes_retire_the_payload(self):
+        etag = self.client.get('/api/home/')['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            ProductImage.objects.create(product=self.products[1], image='products/new.jpg')
+
+        response = self.client.get('/api/home/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        images = {row['id']: len(row['images']) for row in response.data['data']['new_arrivals']}
+        self.assertEqual(images[self.products[1].id], 1)
+
+    def test_wishlist_is_overlaid_per_user(self):
+        anonymous = self.client.get('/api/home/')
+        user = CustomUser.objects.create(username='fan', email='fan@example.com')
+        wishlist = Wishlist.objects.create(user=user)
+        WishlistItem.objects.create(wishlist=wishlist, product=self.products[2])
+        token = Token.objects.create(user=user)
+
+        response = self.client.get('/api/home/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        flags = {row['id']: row['is_wishlisted'] for row in response.data['data']['new_arrivals']}
+        self.assertEqual(flags[self.products[2].id], True)
+        self.assertEqual(sum(flags.values()), 1)
+        self.assertNotEqual(response['ETag'], anonymous['ETag'])
+        self.assertIn('private', response['Cache-Control'])
+
+        # The shared payload is untouched by the overlay
+        again = self.client.get('/api/home/')
+        self.assertFalse(any(row['is_wishlisted'] for row in again.data['data']['new_arrivals']))
+
+    def test_stale_token_is_served_as_anonymous(self):
+        anonymous = self.client.get('/api/home/')
+        response = self.client.get('/api/home/', HTTP_AUTHORIZATION='Token expired-or-revoked')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], anonymous['ETag'])
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        self.products = create_products(self.category, 3)
+        self.variant = ProductVariant.objects.create(product=self.products[0], color='Black', size='M', stock=5)
+
+    def _revalidate(self, url, response, queries):
+        with self.assertNumQueries(queries):
+            return self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+
+    def test_product_list_revalidates_with_one_query(self):
+        first = self.client.get('/api/products/')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self._revalidate('/api/products/', first, 1).status_code, 304)
+
+        # Nested variant changes and deletes both change the validators
+        self.variant.stock = 4
+        self.variant.save()
+        second = self._revalidate('/api/products/', first, 4)
+        self.assertEqual(second.status_code, 200)
+        self.products[2].delete()
+        self.assertEqual(self.client.get('/api/products/', HTTP_IF_NONE_MATCH=second['ETag']).status_code, 200)
+
+    def test_score_sorts_revalidate_on_new_sales(self):
+        url = '/api/products/?sort_by=popular'
+        record_sales([(self.products[0].id, 1)])
+        first = self.client.get(url)
+        self.assertEqual(self._revalidate(url, first, 1).status_code, 304)
+        record_sales([(self.products[2].id, 5)])
+        second = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.data['results'][0]['id'], self.products[2].id)
+
+    def test_product_detail_uses_etag_and_last_modified(self):
+        url = f'/api/products/{self.products[0].id}/'
+        first = self.client.get(url)
+        self.assertEqual(self._revalidate(url, first, 1).status_code, 304)
+        since = self.client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(since.status_code, 304)
+
+        self.category.name = 'Joggers'
+        self.category.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.assertEqual(self.client.get('/api/products/999999/').status_code, 404)
+
+    def test_wishlist_changes_the_signed_in_etag(self):
+        user = CustomUser.objects.create(username='fan', email='fan@example.com')
+        token = Token.objects.create(user=user)
+        auth = {'HTTP_AUTHORIZATION': f'Token {token.key}'}
+        first = self.client.get('/api/products/', **auth)
+        self.assertIn('private', first['Cache-Control'])
+        self.assertNotIn('Last-Modified', first)
+
+        wishlist = Wishlist.objects.create(user=user)
+        WishlistItem.objects.create(wishlist=wishlist, product=self.products[1])
+        response = self.client.get('/api/products/', HTTP_IF_NONE_MATCH=first['ETag'], **auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_faq_list(self):
+        faq = FAQ.objects.create(question='Shipping?', answer='3-5 days')
+        first = self.client.get('/api/faqs/')
+        self.assertEqual(self._revalidate('/api/faqs/', first, 1).status_code, 304)
+        faq.answer = '2-4 days'
+        faq.save()
+        self.assertEqual(self.client.get('/api/faqs/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class SparseFieldsetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        self.products = create_products(self.category, 3)
+        for product in self.products:
+            product.is_new_drop = True
+            product.save()
+            ProductVariant.objects.create(product=product, color='Black', size='M', stock=5)
+            ProductImage.objects.create(product=product, image=f'products/{product.id}_b.jpg')
+            ProductImage.objects.create(product=product, image=f'products/{product.id}_a.jpg')
+
+    def test_default_shape_is_unchanged(self):
+        row = self.client.get('/api/products/').data['results'][0]
+        self.assertEqual(list(row), [
+            'id', 'name', 'description', 'price', 'category', 'materials', 'is_new_drop',
+            'variants', 'images', 'is_wishlisted',
+        ])
+
+    def test_grid_tiles_skip_unrequested_joins_and_columns(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/products/?fields=id,name,price,bogus&expand=thumbnail')
+        # One validator aggregate plus the page itself: no category join, no prefetches
+        self.assertEqual(len(ctx.captured_queries), 2)
+        page_sql = ctx.captured_queries[-1]['sql']
+        self.assertNotIn('description', page_sql)
+        self.assertNotIn('core_category', page_sql)
+
+        row = response.data['results'][0]
+        self.assertEqual(list(row), ['id', 'name', 'price', 'thumbnail'])
+        full = self.client.get(f'/api/products/{row["id"]}/').data
+        self.assertEqual(row['thumbnail'], full['images'][0]['image'])
+        self.assertTrue(row['thumbnail'].startswith('http://testserver/'))
+
+    def test_detail_home_and_admin_list_accept_fields(self):
+        detail = self.client.get(f'/api/products/{self.products[0].id}/?fields=name,variants')
+        self.assertEqual(list(detail.data), ['name', 'variants'])
+
+        home = self.client.get('/api/home/?fields=id,name,is_wishlisted')
+        self.assertEqual(list(home.data['data']['new_arrivals'][0]), ['id', 'name', 'is_wishlisted'])
+        self.assertIn('description', self.client.get('/api/home/').data['data']['new_arrivals'][0])
+
+
+def seed_orders(user, product_ids, count, items_per_order=2):
+    """Bulk-insert orders (with items) for the given user and return their IDs."""
+    Order.objects.bulk_create(
+        Order(
+            user=user,
+            order_id=f'ORDSEED{i:06d}',
+            total_amount=Decimal('998.50'),
+            shipping_address=f'{i} Main Street',
+            billing_email='seed@example.com',
+            payment_method='cod' if i % 3 else 'online',
+        )
+        for i in range(count)
+    )
+    order_ids = list(Order.objects.filter(user=user).values_list('id', flat=True))
+    variants = dict(ProductVariant.objects.filter(product_id__in=product_ids).values_list('product_id', 'id'))
+    OrderItem.objects.bulk_create(
+        OrderItem(
+            order_id=order_id,
+            product_id=product_ids[(n + i) % len(product_ids)],
+            variant_id=variants[product_ids[(n + i) % len(product_ids)]],
+            quantity=1 + i,
+            price=Decimal('499.25'),
+            size='M',
+        )
+        for n, order_id in enumerate(order_ids)
+        for i in range(items_per_order)
+    )
+    return order_ids
+
+
+class FastSerializerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create(username='shopper', email='shopper@example.com')
+        self.category = Category.objects.create(name='Tracks', slug='tracks')
+        self.product_ids = seed_catalog(self.category, 6, variants_per_product=3, images_per_product=2)
+        create_products(self.category, 1)  # No variants or images
+        wishlist = Wishlist.objects.create(user=self.user)
+        WishlistItem.objects.create(wishlist=wishlist, product_id=self.product_ids[2])
+
+    def _request(self, url='/api/products/'):
+        request = RequestFactory().get(url)
+        request.user = self.user
+        return request
+
+    def _assert_same_json(self, serializer_class, queryset, **kwargs):
+        slow = serializer_class(queryset, many=True, **kwargs).data
+        plan = ReadPlan(serializer_class(**kwargs))
+        fast = plan.render(plan.values(queryset))
+        self.assertEqual(JSONRenderer().render(fast), JSONRenderer().render(slow))
+
+    def test_products_render_identically(self):
+        queryset = ProductSerializer.setup_eager_loading(Product.objects.order_by('id'))
+        self._assert_same_json(ProductSerializer, queryset, context={'request': self._request()})
+
+        queryset = ProductSerializer.setup_eager_loading(
+            Product.objects.order_by('-id'), ['id', 'price', 'images'], ['thumbnail']
+        )
+        self._assert_same_json(
+            ProductSerializer, queryset, context={'request': self._request()},
+            fields=['id', 'price', 'images'], expand=['thumbnail'],
+        )
+
+    def test_orders_render_identically(self):
+        seed_orders(self.user, self.product_ids, 5)
+        self._assert_same_json(OrderSerializer, Order.objects.order_by('id'))
+
+    def test_list_endpoints_use_the_fast_path(self):
+        seed_orders(self.user, self.product_ids, 3)
+        token = Token.objects.create(user=self.user)
+        response = self.client.get('/api/orders/', HTTP_AUTHORIZATION=f'Token {token.key}')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            JSONRenderer().render(response.data),
+            JSONRenderer().render(OrderSerializer(Order.objects.all(), many=True).data),
+        )
+
+        response = self.client.get('/api/products/?ordering=-price&page_size=4')
+        expected = ProductSerializer(
+            Product.objects.order_by('-price', 'id')[:4], many=True,
+            context={'request': response.wsgi_request},
+        ).data
+        self.assertEqual(JSONRenderer().render(response.data['results']), JSONRenderer().render(expected))
+        second = self.client.get(response.data['next'])
+        self.assertEqual(len(second.data['results']), 3)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'set RUN_BENCHMARKS=1 to run benchmarks')
+class FastSerializerBenchmark(TestCase):
+    def _compare(self, label, serializer_class, queryset, **kwargs):
+        renderer = JSONRenderer()
+        started = time.perf_counter()
+        slow = renderer.render(serializer_class(queryset, many=True, **kwargs).data)
+        slow_elapsed = time.perf_counter() - started
+
+        started = time.perf_counter()
+        plan = ReadPlan(serializer_class(**kwargs))
+        fast = renderer.render(plan.render(plan.values(queryset)))
+        fast_elapsed = time.perf_counter() - started
+
+        self.assertEqual(fast, slow)
+        print(f"\n{label}: serializer {slow_elapsed:.3f}s, read plan {fast_elapsed:.3f}s "
+              f"({slow_elapsed / fast_elapsed:.1f}x)")
+        return slow_elapsed, fast_elapsed
+
+    def test_1k_products_and_1k_orders(self):
+        user = CustomUser.objects.create(username='bench', email='bench@example.com')
+        category = Category.objects.create(name='Bench', slug='bench')
+        product_ids = seed_catalog(category, 1000, variants_per_product=6, images_per_product=4)
+        seed_orders(user, product_ids, 1000)
+
+        request = RequestFactory().get('/api/products/')
+        request.user = user
+        slow, fast = self._compare(
+            '1k products', ProductSerializer,
+            ProductSerializer.setup_eager_loading(Product.objects.order_by('id')),
+            context={'request': request},
+        )
+        self.assertLess(fast, slow)
+        slow, fast = self._compare(
+            '1k orders', OrderSerializer, Order.objects.select_related('user').order_by('id')
+        )
+        self.assertLess(fast, slow)
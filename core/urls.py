@@ -22,6 +22,7 @@ urlpatterns = [
     path("change-contact/", ChangeContactView.as_view(), name="change-contact"),
     path("complete-profile/", CompleteProfileView.as_view(), name="complete-profile"),
     path("resend-otp/", ResendOTPView.as_view(), name="resend-otp"),
+    path('guest-cart/', GuestCartView.as_view(), name='guest-cart'),
     path('list/toggle/', ToggleWishlistView.as_view(), name='toggle-wishlist'),
     path('list/check/', CheckWishlistView.as_view(), name='check-wishlist'),
     path('user-profile/', user_profile, name='user-profile'),
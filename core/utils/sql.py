@@ -0,0 +1,24 @@
+# core/utils/sql.py
+from django.db import connection
+
+
+def delete_by_pk(model, pks):
+    """
+    Delete model rows by primary key with one plain DELETE and return the
+    number of rows removed.
+
+    Unlike QuerySet.delete() this sends no signals and follows no
+    cascades, so it is only for tables nothing references, and callers do
+    what the delete signals would have done themselves.
+    """
+    pks = list(pks)
+    if not pks:
+        return 0
+    quote = connection.ops.quote_name
+    opts = model._meta
+    placeholders = ', '.join(['%s'] * len(pks))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {quote(opts.db_table)} WHERE {quote(opts.pk.column)} IN ({placeholders})', pks
+        )
+        return cursor.rowcount
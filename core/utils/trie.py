@@ -0,0 +1,97 @@
+# core/utils/trie.py
+
+
+class _Node:
+    __slots__ = ('children', 'entries', 'top', 'top_weighted')
+
+    def __init__(self):
+        self.children = {}      # first char of edge -> (edge label, child node)
+        self.entries = []       # (weight, item) stored exactly at this key
+        self.top = ()           # best items anywhere below, filled by finalize()
+        self.top_weighted = []  # same as top, with weights, for the parent's merge
+
+
+class RadixTrie:
+    """
+    Compressed prefix tree for autocomplete.
+
+    Edges carry whole substrings instead of single characters, and after
+    finalize() every node caches the `top_k` highest-weighted items below
+    it, so a lookup is a walk down the prefix plus a slice, independent of
+    how many keys share that prefix. Items must be hashable; an item
+    inserted under several keys is returned once.
+    """
+
+    def __init__(self, top_k=10):
+        self.top_k = top_k
+        self.root = _Node()
+
+    def insert(self, key, item, weight=0):
+        node = self.root
+        while key:
+            edge = node.children.get(key[0])
+            if edge is None:
+                child = _Node()
+                node.children[key[0]] = (key, child)
+                node = child
+                break
+
+            label, child = edge
+            common = _common_prefix_length(label, key)
+            if common < len(label):
+                # Split the edge: node -label[:common]-> middle -label[common:]-> child
+                middle = _Node()
+                middle.children[label[common]] = (label[common:], child)
+                node.children[key[0]] = (label[:common], middle)
+                child = middle
+            node = child
+            key = key[common:]
+        node.entries.append((weight, item))
+
+    def finalize(self):
+        """Precompute per-node top lists; call once after the last insert."""
+        _collect_top(self.root, self.top_k)
+        return self
+
+    def complete(self, prefix, limit=None):
+        node = self.root
+        while prefix:
+            edge = node.children.get(prefix[0])
+            if edge is None:
+                return []
+            label, child = edge
+            if label.startswith(prefix):
+                node = child
+                break
+            if not prefix.startswith(label):
+                return []
+            node = child
+            prefix = prefix[len(label):]
+        return list(node.top[:limit or self.top_k])
+
+
+def _common_prefix_length(a, b):
+    length = min(len(a), len(b))
+    for i in range(length):
+        if a[i] != b[i]:
+            return i
+    return length
+
+
+def _collect_top(node, top_k):
+    candidates = list(node.entries)
+    for _, child in node.children.values():
+        _collect_top(child, top_k)
+        candidates.extend(child.top_weighted)
+    candidates.sort(key=lambda pair: (-pair[0], str(pair[1])))
+
+    best, seen = [], set()
+    for weight, item in candidates:
+        if item in seen:
+            continue
+        seen.add(item)
+        best.append((weight, item))
+        if len(best) == top_k:
+            break
+    node.top_weighted = best
+    node.top = tuple(item for _, item in best)
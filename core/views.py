@@ -14,15 +14,17 @@ from rest_framework.authentication import TokenAuthentication
 from rest_framework.permissions import IsAuthenticated
 from rest_framework import filters
 from django_filters.rest_framework import DjangoFilterBackend
-from .models import FAQ, Order, Product, CartItem, Cart, OrderItem, ProductVariant, Payment, Category, Wishlist, WishlistItem, Coupon
-from .serializers import FAQSerializer, OrderSerializer, ProductSerializer, CartItemSerializer, CartSerializer, ContactMessageSerializer, CreateOrderSerializer, VerifyPaymentSerializer, CategorySerializer, CheckoutItemSerializer, CheckoutSerializer 
-from .filters import ProductFilter 
+from .models import FAQ, Order, Product, CartItem, Cart, ProductVariant, Payment, Wishlist, WishlistItem, Coupon
+from .serializers import parse_sparse_fieldset, FAQSerializer, OrderSerializer, ProductSerializer, CartAddSerializer, CartBatchSerializer, CartItemSerializer, CartLineSerializer, CartSerializer, CartSummarySerializer, ContactMessageSerializer, CreateOrderSerializer, VerifyPaymentSerializer, CheckoutItemSerializer, CheckoutSerializer 
+from .filters import ProductFilter, ProductOrderingFilter, ProductSearchFilter
+from .authentication import OptionalTokenAuthentication
+from .pagination import KeysetPagination
 from .models import CustomUser, OTP, ContactMessage
 from django.contrib.auth import get_user_model
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from phonenumber_field.phonenumber import PhoneNumber
-from django.db.models import Q
+from django.db.models import F, Prefetch, Q, prefetch_related_objects
 from django.db import transaction
 import razorpay
 from decouple import config
@@ -32,9 +34,25 @@ from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.decorators import authentication_classes, permission_classes
 from decimal import Decimal
-from core.services.coupon_service import apply_coupon_to_cart
 from decimal import Decimal, InvalidOperation
 from .utils.shipping import calculate_shipping_cost
+from .services.cart_service import (
+    CartBatchError, StockLimitReached, add_to_cart, apply_cart_operations, cart_lines, get_cart_summary,
+)
+from .services.guest_cart_service import (
+    InvalidGuestCart, decode_guest_cart, encode_guest_cart, guest_cart_lines, guest_cart_summary,
+    merge_guest_cart, update_guest_cart,
+)
+from .services.reservation_service import InsufficientStock, confirm_reservations, release_reservations
+from .services.checkout_service import CheckoutError, cart_checkout_lines, commit_order, price_lines, requested_lines
+from .services.facet_service import catalog_facets, facet_cache_key
+from .services.suggest_service import SUGGEST_TOP_K, suggest
+from .services.home_service import get_home_payload, overlay_wishlist
+from .services.wishlist_service import check_wishlisted, get_wishlisted_product_ids, normalize_product_id, toggle_wishlist_item
+from .conditional import ConditionalGetMixin, conditional_response, make_etag
+from .fast_serializers import FastListMixin
+from django.conf import settings
+from django.core.cache import cache
 
 
 razorpay_client = razorpay.Client(
@@ -158,8 +176,9 @@ class VerifyOTPView(APIView):
         # Get user from OTP
         user = otp.user
 
-        # Mark user as verified
+        # Mark user as verified; last_login also keeps their cart from the abandoned-cart purge
         user.is_verified = True
+        user.last_login = timezone.now()
         user.save()
 
         # Mark OTP as used
@@ -169,9 +188,13 @@ class VerifyOTPView(APIView):
         # Create or get auth token
         token, _ = Token.objects.get_or_create(user=user)
 
+        # Carry over anything added to the cart before signing in
+        merged = merge_guest_cart(user, request.data.get('guest_cart'))
+
         return Response({
             'token': token.key,
-            'message': 'Verification successful'
+            'message': 'Verification successful',
+            'merged_cart_lines': merged,
         }, status=status.HTTP_200_OK)
     
 
@@ -493,7 +516,7 @@ class ResendOTPView(APIView):
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
         
         
-class FAQViewSet(viewsets.ModelViewSet):
+class FAQViewSet(ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = FAQ.objects.all()
     serializer_class = FAQSerializer
     permission_classes = [AllowAny]  # Public access for FAQs
@@ -516,15 +539,17 @@ class OrderTrackingView(APIView):
         except Order.DoesNotExist:
             return Response({'error': 'Order not found or access denied'}, status=status.HTTP_404_NOT_FOUND)
         
-class ProductViewSet(viewsets.ModelViewSet):
+class ProductViewSet(ConditionalGetMixin, FastListMixin, viewsets.ModelViewSet):
     queryset = Product.objects.all()
     serializer_class = ProductSerializer
     permission_classes = [AllowAny]
-    # Keep SearchFilter and OrderingFilter for name/description search and basic price/name ordering
-    filter_backends = [filters.SearchFilter, filters.OrderingFilter, DjangoFilterBackend, ] # Removed DjangoFilterBackend if not directly used
+    # ETag validators: Product.updated_at also moves when a variant or image changes
+    conditional_fields = ('updated_at', 'category__updated_at')
+    # Full-text search, ordering (incl. ?sort_by=) and the ProductFilter facets
+    filter_backends = [ProductSearchFilter, ProductOrderingFilter, DjangoFilterBackend, ]
+    pagination_class = KeysetPagination  # Cursor pages keyed on the active ordering
 
     filterset_class = ProductFilter   # ← Link your custom filter
-    search_fields = ['name', 'description']
     ordering_fields = ['price', 'name', 'id'] # Add 'id' for default ordering if needed
     ordering = ['id'] # Default ordering, e.g., by creation ID
 
@@ -534,37 +559,39 @@ class ProductViewSet(viewsets.ModelViewSet):
         context['request'] = self.request
         return context
 
+    def get_validator_extras(self):
+        # is_wishlisted is per user; the serializer reuses this same lookup
+        return sorted(get_wishlisted_product_ids(self.request))
+
+    def get_list_conditional_fields(self):
+        # ?sort_by=popular/trending reorder as sales come in, which moves the
+        # scores but not Product.updated_at
+        if self.request.query_params.get(ProductOrderingFilter.sort_param) in ProductOrderingFilter.score_sorts:
+            return self.conditional_fields + ('popularity__updated_at',)
+        return self.conditional_fields
+
+    def get_sparse_fieldset(self):
+        """?fields= / ?expand= apply to reads only; writes always use the full serializer"""
+        if self.request.method not in permissions.SAFE_METHODS:
+            return None, set()
+        return parse_sparse_fieldset(self.request.query_params)
+
+    def get_serializer(self, *args, **kwargs):
+        fields, expand = self.get_sparse_fieldset()
+        kwargs.setdefault('fields', fields)
+        kwargs.setdefault('expand', expand)
+        return super().get_serializer(*args, **kwargs)
+
     def get_queryset(self):
-        queryset = super().get_queryset()
+        fields, expand = self.get_sparse_fieldset()
+        queryset = ProductSerializer.setup_eager_loading(super().get_queryset(), fields, expand)
 
         # --- Filter Logic Based on PDF ---
 
-        # 1. Filter by Size (from ProductVariant)
-        size = self.request.query_params.get('size')
-        if size:
-            # Filter products that have at least one variant matching the size
-            # Use iexact for case-insensitive match if needed, adjust based on your data format
-            queryset = queryset.filter(variants__size__iexact=size).distinct()
-
-        # 2. Filter by Color (from ProductVariant)
-        color = self.request.query_params.get('color')
-        if color:
-            # Filter products that have at least one variant matching the color
-            # Use iexact for case-insensitive match if needed, adjust based on your data format
-            queryset = queryset.filter(variants__color__iexact=color).distinct()
-
-        # 3. Filter by Material (from Product.materials JSON field)
-        material = self.request.query_params.get('material')
-        if material:
-            # Filter products where the materials JSON array contains the specified material
-            # Using __contains for JSON fields. Ensure your DB supports this (PostgreSQL, MySQL 5.7+, SQLite with json1 extension)
-            # The material name in the query param should match exactly one item in the JSON array.
-            # For case-insensitive matching, you might need a database-specific function or a different approach.
-            # For now, assuming exact match within the array is sufficient.
-            # Example: if material='cotton', it matches products where materials contains 'cotton'.
-            queryset = queryset.filter(materials__contains=[material.lower()]) # Use lower() if your stored materials are lowercase
-
-        # 4. Filter by Price Range
+        # Size, color, material and category filters live in ProductFilter and
+        # use the ProductFacet table instead of variant joins + DISTINCT.
+
+        # Filter by Price Range
         # Handle specific price ranges like "Under 1000", "Under 500", "Under 2000"
         price_under = self.request.query_params.get('price_under')
         if price_under:
@@ -591,54 +618,44 @@ class ProductViewSet(viewsets.ModelViewSet):
             except ValueError:
                 pass # Silently ignore invalid input, or return an error response
 
-        # 5. Filter by Category (if needed, already present in original code)
-        category_slug = self.request.query_params.get('category')
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
-
 
         # --- Sorting Logic Based on PDF ---
-        # The `filters.OrderingFilter` handles 'ordering' query param like ?ordering=price, ?ordering=-price, ?ordering=name
-        # Default ordering is set in `ordering = ['id']`
-        # Common query params would be:
-        # ?ordering=price (Low to High) - Uses the 'price' field on Product
-        # ?ordering=-price (High to Low)
-        # ?ordering=name
-        # ?ordering=-name
-
-        sort_by = self.request.query_params.get('sort_by')
-        if sort_by == 'popular':
-            # Example sorting by popularity based on OrderItem count (requires OrderItem to link to Product)
-            # Adjust related_name if necessary (e.g., if OrderItem links to ProductVariant, it's more complex)
-            # Assuming OrderItem has 'product' field linking directly to Product (as per models.py)
-            # This might be performance-intensive without proper indexing
-            queryset = queryset.annotate(
-                num_orders=Count('items') # 'items' is the related_name from Order to OrderItem
-            ).order_by('-num_orders')
-
-        elif sort_by == 'trending':
-            # Trending is often based on recent activity.
-            # A simple proxy could be recent creation (using default ordering) or recent orders.
-            # For a more dynamic trend, you'd need a backend job calculating scores.
-            # For now, let's just keep the default ordering or apply a recent order filter if available.
-            # Default ordering 'id' often implies recent creation.
-            # Or, sort by recent orders (e.g., orders created in the last N days)
-            # This requires joining with Order and OrderItem and filtering by date.
-            # For simplicity here, we'll just keep the default or apply a placeholder if needed.
-            # Default ordering often implies recency, which is a basic trend indicator.
-            # Example placeholder: order by default (or by a hypothetical recent_activity_score)
-            # queryset = queryset.order_by('-recent_activity_score') # Requires such a field
-            # For now, just pass (use default or ordering filter)
-            pass # Keeps default or applies ?ordering=... if present
-
-        # The standard ?ordering=... parameter is handled by filters.OrderingFilter
-        # based on the 'ordering_fields' defined above.
-
-        return queryset.distinct() # Ensure distinct results if joins were made via variants
-
-
-
-class OrderViewSet(viewsets.ModelViewSet):
+        # ?ordering=price / -price / name / -name and ?sort_by=popular are handled by
+        # ProductOrderingFilter; KeysetPagination pages over whatever ordering it picks.
+
+        return queryset
+
+    @action(detail=False, methods=['get'])
+    def facets(self, request):
+        """
+        Sidebar counts for the current filter state, e.g. GET /api/products/facets/?color=Black
+        Takes the same filter params as the list endpoint (plus ?in_stock=true) and
+        caches the result per normalized filter signature.
+        """
+        cache_key = facet_cache_key(request.query_params)
+        data = cache.get(cache_key)
+        if data is None:
+            queryset = self.filter_queryset(self.get_queryset())
+            in_stock_only = request.query_params.get('in_stock', '').lower() in ['true', '1', 'yes']
+            data = catalog_facets(queryset, in_stock_only=in_stock_only)
+            cache.set(cache_key, data, getattr(settings, 'PRODUCT_FACETS_CACHE_TIMEOUT', 300))
+        return Response(data)
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        """
+        Search-box completions, e.g. GET /api/products/suggest/?q=hoo&limit=5
+        Served from an in-memory trie of product, category and material names.
+        """
+        try:
+            limit = min(int(request.query_params.get('limit', SUGGEST_TOP_K)), SUGGEST_TOP_K)
+        except ValueError:
+            limit = SUGGEST_TOP_K
+        return Response({'results': suggest(request.query_params.get('q', ''), max(limit, 1))})
+
+
+
+class OrderViewSet(FastListMixin, viewsets.ModelViewSet):
     queryset = Order.objects.all()
     serializer_class = OrderSerializer
     authentication_classes = [TokenAuthentication]
@@ -659,41 +676,53 @@ class CartViewSet(viewsets.ViewSet):
 
     def list(self, request):
         cart = self.get_cart(request.user)
-        serializer = CartSerializer(cart)
+        prefetch_related_objects([cart], Prefetch('items', queryset=cart_lines(cart)))
+        serializer = CartSerializer(cart, context={'request': request})
         return Response(serializer.data)
 
-    def create(self, request):
-        cart = self.get_cart(request.user)
-        serializer = CartItemSerializer(data=request.data)
-        if serializer.is_valid():
-            variant = serializer.validated_data['variant']
-            quantity = serializer.validated_data['quantity']
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """Apply several set/increment/remove operations in one transaction; all or nothing"""
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            cart = apply_cart_operations(request.user, serializer.validated_data['operations'])
+        except CartBatchError as exc:
+            return Response(
+                {"error": "Cart not updated", "details": exc.problems},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        cart.refresh_from_db(fields=['item_count', 'subtotal', 'updated_at'])
+        prefetch_related_objects([cart], Prefetch('items', queryset=cart_lines(cart)))
+        return Response(CartSerializer(cart, context={'request': request}).data)
 
-            # Check stock
-            if quantity > variant.stock:
-                return Response(
-                    {"error": f"Only {variant.stock} left for {variant.product.name} {variant.size} ({variant.color})"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Item count and subtotal for the header badge, without loading the items"""
+        return Response(CartSummarySerializer(get_cart_summary(request.user)).data)
 
-            # Add or update cart item
-            cart_item, created = CartItem.objects.get_or_create(
-                cart=cart,
-                variant=variant,
-                defaults={'quantity': quantity}
-            )
-            if not created:
-                cart_item.quantity += quantity
-                if cart_item.quantity > variant.stock:
-                    return Response(
-                        {"error": f"Only {variant.stock} left for {variant.product.name}"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                cart_item.save()
+    def create(self, request):
+        """Add a variant to the cart (or add to its line); rejected if the line would pass the stock"""
+        serializer = CartAddSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
-            return Response(CartItemSerializer(cart_item).data, status=status.HTTP_201_CREATED)
+        variant_id = serializer.validated_data['variant_id']
+        quantity = serializer.validated_data['quantity']
+        try:
+            cart_item = add_to_cart(request.user, variant_id, quantity)
+        except ProductVariant.DoesNotExist:
+            return Response({"error": "Product variant not found"}, status=status.HTTP_400_BAD_REQUEST)
+        except StockLimitReached as exc:
+            return Response(
+                {"error": f"Only {exc.stock} left", "quantity": exc.in_cart, "stock": exc.stock},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        data = CartItemSerializer(cart_item).data
+        data['at_stock_limit'] = cart_item.quantity == cart_item.variant.stock
+        return Response(data, status=status.HTTP_201_CREATED)
 
     def destroy(self, request, pk=None):
         cart = self.get_cart(request.user)
@@ -705,8 +734,56 @@ class CartViewSet(viewsets.ViewSet):
             return Response({'error': 'Cart item not found'}, status=status.HTTP_404_NOT_FOUND)
         
 
+class GuestCartView(APIView):
+    """
+    Cart for shoppers who are not signed in, held in a signed token instead
+    of the database. The client sends the token back in the X-Guest-Cart
+    header (or a guest_cart field) and keeps the new one from each response;
+    VerifyOTPView merges it into the real cart at sign-in.
+    """
+    authentication_classes = []
+    permission_classes = [AllowAny]
+
+    def _token(self, request):
+        return (
+            request.headers.get('X-Guest-Cart')
+            or request.data.get('guest_cart')
+            or request.query_params.get('guest_cart')
+        )
+
+    def _render(self, request, quantities):
+        lines = guest_cart_lines(quantities)
+        return Response({
+            'guest_cart': encode_guest_cart(quantities),
+            'items': CartLineSerializer(lines, many=True, context={'request': request}).data,
+            **CartSummarySerializer(guest_cart_summary(lines)).data,
+        })
+
+    def get(self, request):
+        try:
+            quantities = decode_guest_cart(self._token(request))
+        except InvalidGuestCart as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        return self._render(request, quantities)
+
+    def post(self, request):
+        """Apply set/increment/remove operations (as for /cart/batch/) and return the new token"""
+        try:
+            quantities = decode_guest_cart(self._token(request))
+        except InvalidGuestCart as exc:
+            return Response({"error": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = CartBatchSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        quantities, problems = update_guest_cart(quantities, serializer.validated_data['operations'])
+        if problems:
+            return Response({"error": "Cart not updated", "details": problems}, status=status.HTTP_400_BAD_REQUEST)
+        return self._render(request, quantities)
+
+
 from .models import Wishlist, WishlistItem
-from .serializers import WishlistSerializer, WishlistItemSerializer
+from .serializers import ProductTileSerializer, WishlistEntrySerializer, WishlistItemSerializer
 
 class WishlistViewSet(viewsets.ViewSet):
     authentication_classes = [TokenAuthentication]
@@ -718,10 +795,26 @@ class WishlistViewSet(viewsets.ViewSet):
         return wishlist
 
     def list(self, request):
-        """Get user's wishlist"""
+        """
+        Get user's wishlist, newest first, one keyset page at a time.
+
+        Rows are read from Product joined to WishlistItem with the thumbnail
+        and stock flag as subqueries, so a page is one query whatever its size.
+        """
         wishlist = self.get_wishlist(request.user)
-        serializer = WishlistSerializer(wishlist)
-        return Response(serializer.data)
+        products = ProductTileSerializer.setup_eager_loading(
+            Product.objects.filter(wishlistitem__wishlist=wishlist)
+        ).annotate(
+            wishlist_item_id=F('wishlistitem__id'),
+            added_at=F('wishlistitem__added_at'),
+        ).order_by('-wishlist_item_id')
+
+        paginator = KeysetPagination()
+        page = paginator.paginate_queryset(products, request, view=self)
+        serializer = WishlistEntrySerializer(page, many=True, context={'request': request})
+        response = paginator.get_paginated_response(serializer.data)
+        response.data['total_items'] = wishlist.item_count
+        return response
 
     def create(self, request):
         """Add product to wishlist"""
@@ -749,7 +842,7 @@ class WishlistViewSet(viewsets.ViewSet):
         )
         
         if created:
-            serializer = WishlistItemSerializer(wishlist_item)
+            serializer = WishlistItemSerializer(wishlist_item, context={'request': request})
             return Response(
                 {
                     "message": "Product added to wishlist",
@@ -809,44 +902,37 @@ class ToggleWishlistView(APIView):
                 {"error": "Product ID is required"},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+
+        # Conditional delete / insert-if-absent plus the counter, in at most
+        # two statements; double taps cannot hit the unique constraint.
         try:
-            product = Product.objects.get(id=product_id)
+            product_pk = normalize_product_id(product_id)
+            if product_pk is None:
+                raise Product.DoesNotExist
+            in_wishlist, total_items, product_name = toggle_wishlist_item(request.user, product_pk)
         except Product.DoesNotExist:
             return Response(
                 {"error": "Product not found"},
                 status=status.HTTP_404_NOT_FOUND
             )
 
-        wishlist, created = Wishlist.objects.get_or_create(user=request.user)
-        
-        try:
-            wishlist_item = WishlistItem.objects.get(
-                wishlist=wishlist,
-                product=product
-            )
-            # Product exists in wishlist, remove it
-            wishlist_item.delete()
+        if in_wishlist:
             return Response(
                 {
-                    "message": f"{product.name} removed from wishlist",
-                    "in_wishlist": False
-                },
-                status=status.HTTP_200_OK
-            )
-        except WishlistItem.DoesNotExist:
-            # Product not in wishlist, add it
-            WishlistItem.objects.create(
-                wishlist=wishlist,
-                product=product
-            )
-            return Response(
-                {
-                    "message": f"{product.name} added to wishlist",
-                    "in_wishlist": True
+                    "message": f"{product_name} added to wishlist",
+                    "in_wishlist": True,
+                    "total_items": total_items
                 },
                 status=status.HTTP_201_CREATED
             )
+        return Response(
+            {
+                "message": f"{product_name} removed from wishlist",
+                "in_wishlist": False,
+                "total_items": total_items
+            },
+            status=status.HTTP_200_OK
+        )
 
 class CheckWishlistView(APIView):
     """Check if products are in user's wishlist"""
@@ -862,25 +948,10 @@ class CheckWishlistView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            wishlist = Wishlist.objects.get(user=request.user)
-            wishlist_product_ids = list(
-                WishlistItem.objects.filter(
-                    wishlist=wishlist,
-                    product_id__in=product_ids
-                ).values_list('product_id', flat=True)
-            )
-            
-            result = {}
-            for product_id in product_ids:
-                result[str(product_id)] = product_id in wishlist_product_ids
-                
-            return Response(result, status=status.HTTP_200_OK)
-            
-        except Wishlist.DoesNotExist:
-            # User has no wishlist, so nothing is wishlisted
-            result = {str(pid): False for pid in product_ids}
-            return Response(result, status=status.HTTP_200_OK)
+        # One cache read against the user's sorted membership array; IDs may
+        # arrive as ints or numeric strings and are matched either way.
+        result = check_wishlisted(request.user.id, product_ids)
+        return Response(result, status=status.HTTP_200_OK)
         
 
 @api_view(['POST'])
@@ -917,57 +988,20 @@ def place_order(request):
         return Response({"error": "At least one item is required"}, status=400)
 
     try:
-        with transaction.atomic():  # Ensure all-or-nothing
-            # Create order
-            order = Order.objects.create(
-                user=user,
-                shipping_address=shipping_address,
-                billing_email=billing_email,
-                total_amount=0,
-                status='placed'
-            )
-
-            total = 0
-            for item_data in items:
-                variant_id = item_data.get('variant_id')
-                quantity = item_data.get('quantity', 1)
-
-                if not variant_id:
-                    raise ValueError("variant_id is required for each item")
-
-                # Get variant and lock it for update (prevent race condition)
-                variant = ProductVariant.objects.select_for_update().get(id=variant_id)
-
-                if variant.stock < quantity:
-                    raise ValueError(f"Not enough stock for {variant.product.name} (Size: {variant.size}, Color: {variant.color})")
-
-                # Create order item
-                OrderItem.objects.create(
-                    order=order,
-                    product=variant.product,
-                    variant=variant,
-                    quantity=quantity,
-                    price=variant.product.price,  # Use current product price
-                    size=variant.size
-                )
-                total += float(variant.product.price) * quantity
-
-                # Reduce stock
-                variant.stock -= quantity
-                variant.save()
-
-            # Update total
-            order.total_amount = total
-            order.save()
-
-            # Return response
-            serializer = OrderSerializer(order)
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-
-    except ProductVariant.DoesNotExist:
-        return Response({"error": "Invalid variant_id"}, status=400)
-    except ValueError as e:
-        return Response({"error": str(e)}, status=400)
+        lines = requested_lines(items)
+        quote = price_lines(lines, data.get('coupon_code'), user)
+        # Sold straight from stock, like COD
+        order = commit_order(user, quote, 'online', shipping_address, billing_email)
+        return Response(OrderSerializer(order).data, status=status.HTTP_201_CREATED)
+
+    except CheckoutError as e:
+        return Response({"error": e.message}, status=e.status)
+    except InsufficientStock as e:
+        variant = next(line.variant for line in lines if line.variant.pk == e.problems[0]['variant_id'])
+        return Response({
+            "error": f"Not enough stock for {variant.product.name} (Size: {variant.size}, Color: {variant.color})",
+            "details": e.problems,
+        }, status=400)
     except Exception as e:
         return Response({"error": "Failed to place order. Please try again."}, status=500)
     
@@ -977,111 +1011,45 @@ class CreateOrderView(APIView):
 
     def post(self, request):
         try:
-            coupon_code = request.data.get('coupon_code', '').strip()
-
-            # Get user's cart
-            cart = Cart.objects.get(user=request.user)
-            cart_items = cart.items.select_related('variant__product').all()
-            
-            if not cart_items.exists():
-                return Response(
-                    {"error": "Cart is empty"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Calculate base total
-            total = sum(
-                Decimal(str(item.variant.product.price)) * item.quantity 
-                for item in cart_items
-            )
-
-            # Apply coupon
-            discount_amount = Decimal('0')
-            applied_coupon = None
-
-            if coupon_code:
-                try:
-                    coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-                    
-                    # ✅ CHECK NEW USER VALIDATION HERE
-                    if not coupon.is_valid_for_user(request.user):
-                        return Response(
-                            {"error": "This coupon is only available for new users."},
-                            status=status.HTTP_400_BAD_REQUEST
-                        )
-                    
-                    if coupon.is_valid():
-                        if coupon.discount_type == 'bogo_50':
-                            # ✅ PASS USER TO COUPON SERVICE FOR BOGO VALIDATION TOO
-                            from core.services.coupon_service import apply_coupon_to_cart
-                            discount_amount = apply_coupon_to_cart(coupon, list(cart_items), request.user)
-                        else:
-                            if total >= coupon.minimum_order_amount:
-                                discount_amount = coupon.calculate_discount(total)
-                        if discount_amount > 0:
-                            applied_coupon = coupon
-                            coupon.used_count += 1
-                            coupon.save(update_fields=['used_count'])
-                except Coupon.DoesNotExist:
-                    return Response(
-                        {"error": "Invalid coupon code"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            final_total = total - discount_amount
+            user = request.user
+            quote = price_lines(cart_checkout_lines(user), request.data.get('coupon_code'), user)
             # Convert to paise for Razorpay (INR: ₹1 = 100 paise)
-            amount_in_paise = int(final_total * 100)
-
-            # Create Razorpay order
-            razorpay_order = razorpay_client.order.create({
-                "amount": amount_in_paise,
-                "currency": "INR",
-                "payment_capture": 1,
-            })
+            amount_in_paise = int(quote.total * 100)
 
             # Build shipping address (same as COD)
-            user = request.user
             address_parts = [
                 user.address or "Address not provided",
                 f"Phone: {user.phone_number}" if hasattr(user, 'phone_number') else ""
             ]
             shipping_address = ", ".join(part for part in address_parts if part)
 
-            # Create order (but don't clear cart yet — wait for payment verification)
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=final_total,
-                discount_amount=discount_amount,
-                applied_coupon=applied_coupon,
-                payment_method='online',
-                shipping_address=shipping_address,
-                billing_email=user.email,
-                razorpay_order_id=razorpay_order['id'],
-                status='placed'
-            )
+            # Create Razorpay order first: if it fails, nothing has been written
+            # (an unpaid Razorpay order left by a failed commit below is harmless)
+            razorpay_order = razorpay_client.order.create({
+                "amount": amount_in_paise,
+                "currency": "INR",
+                "payment_capture": 1,
+            })
 
-            # Create OrderItems
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.variant.product,
-                    variant=item.variant,
-                    quantity=item.quantity,
-                    price=item.variant.product.price,
-                    size=item.variant.size
-                )
+            # Hold the stock until payment is verified; the cart stays until then too
+            order = commit_order(
+                user, quote, 'online', shipping_address, user.email,
+                hold=True, razorpay_order_id=razorpay_order['id'],
+            )
 
             return Response({
                 "razorpay_order_id": razorpay_order['id'],
                 "amount": amount_in_paise,
                 "currency": "INR",
                 "order_id": order.order_id,
-                "total_amount": str(final_total),
-                "discount_applied": str(discount_amount)
+                "total_amount": str(quote.total),
+                "discount_applied": str(quote.discount)
             }, status=status.HTTP_201_CREATED)
 
-        except Cart.DoesNotExist:
-            return Response({"error": "Cart not found"}, status=status.HTTP_404_NOT_FOUND)
+        except CheckoutError as e:
+            return Response({"error": e.message}, status=e.status)
+        except InsufficientStock as e:
+            return Response({"error": "Not enough stock", "details": e.problems}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {"error": "Failed to create order", "details": str(e)},
@@ -1127,17 +1095,34 @@ class VerifyPaymentView(APIView):
             # Find the order
             order = Order.objects.get(razorpay_order_id=order_id)
 
-            # Save payment record
-            Payment.objects.create(
-                order=order,
-                razorpay_payment_id=payment_id,
-                razorpay_signature=signature,
-                status='captured'
-            )
+            with transaction.atomic():
+                # Save payment record
+                Payment.objects.create(
+                    order=order,
+                    razorpay_payment_id=payment_id,
+                    razorpay_signature=signature,
+                    status='captured'
+                )
 
-            # Optional: update order status
-            order.payment_status = 'paid'
-            order.save()
+                # Paid: the held units now leave stock
+                try:
+                    confirm_reservations(order)
+                except InsufficientStock as e:
+                    # The hold expired and the units were sold meanwhile: keep
+                    # the payment, hand back what is left of the hold and take
+                    # the order out of fulfilment until it is refunded
+                    release_reservations(order)
+                    order.status = 'refund_pending'
+                    order.save(update_fields=['status'])
+                    problems = e.problems
+                else:
+                    problems = None
+
+            if problems:
+                return Response(
+                    {"error": "Reserved stock is no longer available", "details": problems},
+                    status=status.HTTP_409_CONFLICT
+                )
 
             return Response({
                 "status": "success",
@@ -1160,151 +1145,76 @@ class CreateCODOrderView(APIView):
 
     def post(self, request):
         try:
-            coupon_code = request.data.get('coupon_code', '').strip()
-
-            cart = Cart.objects.get(user=request.user)
-            cart_items = cart.items.select_related('variant__product').all()
-            
-            if not cart_items.exists():
-                return Response(
-                    {"error": "Cart is empty"},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-            # Calculate base total
-            total = sum(
-                Decimal(str(item.variant.product.price)) * item.quantity 
-                for item in cart_items
-            )
-
-            # Initialize discount & coupon
-            discount_amount = Decimal('0')
-            applied_coupon = None
-
-            # Apply coupon if provided
-            if coupon_code:
-                try:
-                    coupon = Coupon.objects.get(code=coupon_code, is_active=True)
-                    if coupon.is_valid():
-                        if coupon.discount_type == 'bogo_50':
-                            discount_amount = apply_coupon_to_cart(coupon, list(cart_items))
-                        else:
-                            # Handle percentage/fixed on order total
-                            if total >= coupon.minimum_order_amount:
-                                discount_amount = coupon.calculate_discount(total)
-                            else:
-                                discount_amount = Decimal('0')
-                        
-                        if discount_amount > 0:
-                            applied_coupon = coupon
-                            coupon.used_count += 1
-                            coupon.save(update_fields=['used_count'])
-                    # If invalid, ignore silently or raise error (here: ignore)
-                except Coupon.DoesNotExist:
-                    return Response(
-                        {"error": "Invalid coupon code"},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-            final_total = total - discount_amount
-
-            shipping_address = request.user.address or "Address not provided"
-            billing_email = request.user.email or ""
-
-            # Create order
-            order = Order.objects.create(
-                user=request.user,
-                total_amount=final_total,
-                discount_amount=discount_amount,      # ✅ Saved
-                applied_coupon=applied_coupon,        # ✅ Linked
-                payment_method='cod',
-                shipping_address=shipping_address,
-                billing_email=billing_email,
-                status='placed'
-            )
+            user = request.user
+            quote = price_lines(cart_checkout_lines(user), request.data.get('coupon_code'), user)
 
-            # Create order items
-            for item in cart_items:
-                OrderItem.objects.create(
-                    order=order,
-                    product=item.variant.product,
-                    variant=item.variant,
-                    quantity=item.quantity,
-                    price=item.variant.product.price,
-                    size=item.variant.size
-                )
+            shipping_address = user.address or "Address not provided"
+            billing_email = user.email or ""
 
-            # Clear cart
-            cart_items.delete()
+            # COD is placed, not paid later: sell straight from stock and clear the cart
+            order = commit_order(user, quote, 'cod', shipping_address, billing_email, clear_cart=True)
 
             return Response({
                 "message": "Cash on Delivery order placed successfully!",
                 "order_id": order.order_id,
-                "total_amount": str(final_total),
-                "discount_applied": str(discount_amount)
+                "total_amount": str(quote.total),
+                "discount_applied": str(quote.discount)
             }, status=status.HTTP_201_CREATED)
 
-        except Cart.DoesNotExist:
-            return Response(
-                {"error": "Cart not found"},
-                status=status.HTTP_404_NOT_FOUND
-            )
+        except CheckoutError as e:
+            return Response({"error": e.message}, status=e.status)
+        except InsufficientStock as e:
+            return Response({"error": "Not enough stock", "details": e.problems}, status=status.HTTP_400_BAD_REQUEST)
         except Exception as e:
             return Response(
                 {"error": "Failed to create COD order", "details": str(e)},
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
-        
-
 
 @api_view(['GET'])
-@authentication_classes([]) # Disables default authentication for this view
+@authentication_classes([OptionalTokenAuthentication]) # Optional: only used to overlay is_wishlisted
 @permission_classes([AllowAny]) # Explicitly allows any user (authenticated or not)
 def home_page_data(request):
     """
     API endpoint to get data for the home page.
     Returns categories, new arrival products, and potentially other featured items.
+
+    The payload is serialized once per catalog version and revalidated with
+    ETag / Last-Modified, so a client or CDN holding the current copy gets a 304.
     """
     try:
-        # --- Fetch Categories ---
-        categories = Category.objects.all()
-        categories_serializer = CategorySerializer(categories, many=True)
-
-        # --- Fetch New Arrival Products ---
-        # Filter products marked as new drops and order by creation date (or another relevant date)
-        # Adjust the number of items fetched as needed (e.g., 10)
-        new_arrivals = Product.objects.filter(is_new_drop=True).order_by('-id')[:10] # Assuming 'id' implies creation order, or use 'created_at' if available
-        new_arrivals_serializer = ProductSerializer(
-            new_arrivals, 
-            many=True, 
-            context={'request': request} # Pass request context for is_wishlisted field
-        )
-
-        # --- Example: Fetch Featured/Popular Products ---
-        # You might want to filter based on sales, ratings, or just a random selection later.
-        # For now, let's get some other products, maybe just the next set after new arrivals?
-        # Or, if you have a specific 'featured' flag on Product, use that.
-        # featured_products = Product.objects.filter(featured=True).order_by('-some_popularity_metric')[:8]
-        # Alternatively, get products not in new arrivals:
-        # featured_product_ids = Product.objects.exclude(id__in=new_arrivals).values_list('id', flat=True)[:10]
-        # featured_products = Product.objects.filter(id__in=featured_product_ids)
-        # featured_products_serializer = ProductSerializer(
-        #     featured_products,
-        #     many=True,
-        #     context={'request': request}
-        # )
-
-        # --- Prepare Response Data ---
-        data = {
-            "status": "success",
-            "message": "Home page data retrieved successfully",
-            "data": {
-                "categories": categories_serializer.data,
-                "new_arrivals": new_arrivals_serializer.data,
-                # "featured_products": featured_products_serializer.data, # Add if implemented
+        # ?fields= / ?expand= shape the new_arrivals products (see ProductSerializer)
+        fields, expand = parse_sparse_fieldset(request.query_params)
+        version, payload = get_home_payload(request, fields, expand)
+
+        # --- Per-user overlay ---
+        # Anonymous clients share one ETag; signed-in users also depend on
+        # their own wishlist, which is folded into theirs.
+        wishlisted_ids = get_wishlisted_product_ids(request)
+        new_arrival_ids = [product.get('id') for product in payload['new_arrivals']]
+        wishlisted = sorted(set(new_arrival_ids) & wishlisted_ids)
+        private = request.user.is_authenticated
+
+        def render():
+            # --- Prepare Response Data ---
+            data = {
+                "status": "success",
+                "message": "Home page data retrieved successfully",
+                "data": {
+                    "categories": payload['categories'],
+                    "new_arrivals": overlay_wishlist(payload['new_arrivals'], wishlisted_ids),
+                    # "featured_products": featured_products_serializer.data, # Add if implemented
+                }
             }
-        }
-        return Response(data, status=status.HTTP_200_OK)
+            return Response(data, status=status.HTTP_200_OK)
+
+        return conditional_response(
+            request,
+            render,
+            make_etag('home', version, *wishlisted),
+            last_modified=None if private else version // 1_000_000,
+            private=private,
+        )
 
     except Exception as e:
         # It's good practice to log errors (e.g., import logging; logger = logging.getLogger(__name__); logger.error(e))
@@ -1324,99 +1234,44 @@ def initiate_checkout(request):
     Creates an Order object.
     """
     user = request.user
-    coupon_code = request.data.get('coupon_code', '').strip() # Get coupon code from request
 
-    # Get the user's cart and items
+    # Price the cart (coupon included) before looking at the request body
     try:
-        cart = Cart.objects.get(user=user)
-        cart_items = CartItem.objects.filter(cart=cart).select_related('variant__product')
-        if not cart_items.exists():
-            return Response({
-                "status": "error",
-                "message": "Your cart is empty. Cannot proceed to checkout."
-            }, status=status.HTTP_400_BAD_REQUEST)
-    except Cart.DoesNotExist:
+        quote = price_lines(cart_checkout_lines(user), request.data.get('coupon_code'), user)
+    except CheckoutError as e:
         return Response({
             "status": "error",
-            "message": "Your cart does not exist. Cannot proceed to checkout."
+            "message": e.message
         }, status=status.HTTP_400_BAD_REQUEST)
 
-    # Calculate initial total
-    initial_total = sum(item.variant.product.price * item.quantity for item in cart_items)
-
-    # Handle Coupon (if provided)
-    applied_coupon = None
-    discount_amount = 0
-    from django.core.exceptions import ValidationError as DjangoValidationError  # <-- Add this import
-    if coupon_code:
+    # Use a new serializer specifically for the checkout request body
+    serializer = CheckoutSerializer(data=request.data, context={'request': request, 'quote': quote, 'user': user})
+    if serializer.is_valid():
         try:
-            coupon = Coupon.objects.get(code__iexact=coupon_code)
-            if not coupon.is_valid():
-                return Response({
-                    "status": "error",
-                    "message": "Coupon is not valid (check dates, status, or usage limit)."
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            if initial_total < float(coupon.minimum_order_amount):
-                return Response({
-                    "status": "error",
-                    "message": f"Order total is less than the minimum required amount of ₹{coupon.minimum_order_amount} for this coupon."
-                }, status=status.HTTP_400_BAD_REQUEST)
-
-            # Optional: Check per-user usage limit
-            # user_usage_count = Order.objects.filter(user=user, applied_coupon=coupon).count()
-            # if coupon.per_user_limit and user_usage_count >= coupon.per_user_limit:
-            #     return Response({
-            #         "status": "error",
-            #         "message": "You have reached the usage limit for this coupon."
-            #     }, status=status.HTTP_400_BAD_REQUEST)
-
-            discount_amount = coupon.calculate_discount(initial_total)
-            applied_coupon = coupon # Set the coupon object for later use
-
-        except Coupon.DoesNotExist:
+            # Creates the order, takes or holds the stock and clears the cart
+            order = serializer.save()
+
+            # Return the created order details
+            response_data = {
+                "status": "success",
+                "message": "Order created successfully.",
+                "data": {
+                    "order_id": order.order_id,
+                    "order_details": OrderSerializer(order).data # Return full order data using your existing OrderSerializer
+                }
+            }
+            return Response(response_data, status=status.HTTP_201_CREATED)
+        except CheckoutError as e:
             return Response({
                 "status": "error",
-                "message": "Invalid coupon code."
+                "message": e.message
             }, status=status.HTTP_400_BAD_REQUEST)
-        except DjangoValidationError as e:
-            # Handle validation errors from coupon.clean()
+        except InsufficientStock as e:
             return Response({
                 "status": "error",
-                "message": f"Invalid coupon configuration: {e}"
+                "message": "Some items are no longer available in the requested quantity.",
+                "errors": e.problems
             }, status=status.HTTP_400_BAD_REQUEST)
-
-    # Use a new serializer specifically for the checkout request body
-    serializer = CheckoutSerializer(data=request.data, context={'request': request, 'cart_items': cart_items, 'user': user})
-    if serializer.is_valid():
-        try:
-            with transaction.atomic(): # Ensure all changes happen together
-                order = serializer.save()
-
-                # Apply coupon details to the order *after* it's created
-                if applied_coupon:
-                    order.applied_coupon = applied_coupon
-                    order.discount_amount = discount_amount
-                    order.total_amount = initial_total - discount_amount # Update total with discount
-                    order.save() # Save the updated order
-
-                    # Increment usage count (globally)
-                    applied_coupon.used_count += 1
-                    applied_coupon.save(update_fields=['used_count']) # Only update the count field
-
-                # Clear the user's cart after successful order creation
-                cart.items.all().delete() # Or cart.delete() if you want to remove the cart object itself, but usually clearing items is sufficient
-
-                # Return the created order details
-                response_data = {
-                    "status": "success",
-                    "message": "Order created successfully.",
-                    "data": {
-                        "order_id": order.order_id,
-                        "order_details": OrderSerializer(order).data # Return full order data using your existing OrderSerializer
-                    }
-                }
-                return Response(response_data, status=status.HTTP_201_CREATED)
         except Exception as e:
             # Log the error
             print(f"Error creating order: {e}")
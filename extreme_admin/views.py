@@ -8,7 +8,8 @@ from .permissions import IsSuperAdmin, IsAdminAuthenticated
 from core.models import CustomUser, Order, Product, Coupon
 from decimal import Decimal
 from django.db import models
-from core.serializers import ProductSerializer, OrderSerializer, UserSerializer
+from core.serializers import ProductSerializer, OrderSerializer, UserSerializer, parse_sparse_fieldset
+from core.fast_serializers import ReadPlan
 from rest_framework.parsers import MultiPartParser, FormParser
 from core.models import Category, ProductVariant, ProductImage
 from django.db.models import Count,  CharField
@@ -164,9 +165,12 @@ class AdminProductListView(APIView):
     permission_classes = [IsAdminAuthenticated]
 
     def get(self, request):
-        products = Product.objects.prefetch_related('variants', 'images')
-        serializer = ProductSerializer(products, many=True, context={'request': request})
-        return Response(serializer.data)
+        # Supports ?fields=id,name,price and ?expand=thumbnail like the storefront list
+        fields, expand = parse_sparse_fieldset(request.query_params)
+        products = ProductSerializer.setup_eager_loading(Product.objects.all(), fields, expand)
+        # Same output as ProductSerializer(many=True), rendered from .values() rows
+        plan = ReadPlan(ProductSerializer(context={'request': request}, fields=fields, expand=expand))
+        return Response(plan.render(plan.values(products)))
 
 
 class AdminOrderListView(APIView):
@@ -174,9 +178,9 @@ class AdminOrderListView(APIView):
     permission_classes = [IsAdminAuthenticated]
 
     def get(self, request):
-        orders = Order.objects.select_related('user').prefetch_related('items__product')
-        serializer = OrderSerializer(orders, many=True)
-        return Response(serializer.data)
+        # Same output as OrderSerializer(many=True), rendered from .values() rows
+        plan = ReadPlan(OrderSerializer())
+        return Response(plan.render(plan.values(Order.objects.all())))
 
 # class AdminCustomerListView(APIView):
 #     authentication_classes = [AdminJWTAuthentication]